@@ -0,0 +1,141 @@
+"""
+Deterministic generator for synthetic IRS BMF extracts (eo_ca.csv-shaped) and
+matching canned Census ACS responses, for offline benchmarking.
+
+    python -m benchmarks.generate_bmf --rows 200000 --out /tmp/eo_bench.csv
+"""
+import argparse
+import csv
+import json
+import random
+from typing import List, Optional
+
+# Column layout of the IRS EO BMF extracts.
+BMF_COLUMNS = [
+    "EIN", "NAME", "ICO", "STREET", "CITY", "STATE", "ZIP", "GROUP", "SUBSECTION",
+    "AFFILIATION", "CLASSIFICATION", "RULING", "DEDUCTIBILITY", "FOUNDATION",
+    "ACTIVITY", "ORGANIZATION", "STATUS", "TAX_PERIOD", "ASSET_CD", "INCOME_CD",
+    "FILING_REQ_CD", "PF_FILING_REQ_CD", "ACCT_PD", "ASSET_AMT", "INCOME_AMT",
+    "REVENUE_AMT", "NTEE_CD", "SORT_NAME",
+]
+
+CITIES = [
+    "LOS ANGELES", "SAN DIEGO", "SAN JOSE", "SAN FRANCISCO", "FRESNO", "SACRAMENTO",
+    "LONG BEACH", "OAKLAND", "BAKERSFIELD", "ANAHEIM", "CARLSBAD", "BEVERLY HILLS",
+]
+
+# Mix of category keywords (see data_sources/categories.py) and filler words,
+# so classification cost looks like the real file.
+NAME_PREFIXES = [
+    "FIRST", "ST MARYS", "GREATER", "FRIENDS OF THE", "COMMUNITY", "VALLEY", "PACIFIC",
+    "NORTH COUNTY", "SOUTH BAY", "GOLDEN STATE", "LIGHTHOUSE", "HOPE",
+]
+NAME_SUBJECTS = [
+    "BAPTIST CHURCH", "LUTHERAN CHURCH", "CATHOLIC PARISH", "TEMPLE", "MINISTRIES",
+    "EDUCATION FOUNDATION", "ELEMENTARY SCHOOL PTA", "HIGH SCHOOL BAND BOOSTERS",
+    "ACADEMY", "ANIMAL RESCUE", "HUMANE SOCIETY", "LAGOON CONSERVANCY",
+    "HABITAT RESTORATION", "VETERANS POST", "YOUTH SOCCER LEAGUE", "ARTS COUNCIL",
+    "FOOD BANK", "HISTORICAL SOCIETY", "ROTARY CLUB", "LITTLE LEAGUE", "GARDEN CLUB",
+    "SENIOR CENTER", "HOMEOWNERS ASSOCIATION", "MEDICAL AUXILIARY",
+]
+NAME_SUFFIXES = ["", "", "", " INC", " INC", " CORPORATION", " FUND", " TRUST", " OF CALIFORNIA"]
+NTEE_CODES = ["X20", "X21", "B11", "B94", "D20", "C32", "W30", "N63", "A20", "K31", "P81", "S20", ""]
+STATUS_CODES = ["01"] * 18 + ["02", "12"]
+SUBSECTION_CODES = ["03"] * 8 + ["04", "07"]
+
+DEFAULT_ZIP_COUNT = 1700  # roughly the number of CA ZIPs with BMF orgs
+
+
+def synthetic_zips(count: int = DEFAULT_ZIP_COUNT) -> List[str]:
+    """
+    Spread count ZIPs evenly over California's 90001-96162 range.
+    Index 0 is the most popular ZIP in zipf_weights.
+    """
+    lo, hi = 90001, 96162
+    step = (hi - lo) / float(count)
+    return [f"{int(lo + i * step):05d}" for i in range(count)]
+
+
+def zipf_weights(count: int, exponent: float = 1.1) -> List[float]:
+    return [1.0 / ((rank + 1) ** exponent) for rank in range(count)]
+
+
+def generate_bmf_csv(path: str, rows: int, seed: int = 7, zip_count: int = DEFAULT_ZIP_COUNT) -> List[str]:
+    """
+    Write a synthetic BMF CSV with a Zipf-skewed ZIP distribution (a few dense
+    downtown ZIPs, a long tail of sparse ones). Returns the ZIP list.
+    """
+    rng = random.Random(seed)
+    zips = synthetic_zips(zip_count)
+    weights = zipf_weights(zip_count)
+    zip_column = rng.choices(zips, weights=weights, k=rows)
+
+    with open(path, "w", encoding="latin-1", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(BMF_COLUMNS)
+        for i, zip_code in enumerate(zip_column):
+            name = f"{rng.choice(NAME_PREFIXES)} {rng.choice(NAME_SUBJECTS)}{rng.choice(NAME_SUFFIXES)}"
+            plus4 = f"-{rng.randrange(10000):04d}" if rng.random() < 0.6 else ""
+            record = dict.fromkeys(BMF_COLUMNS, "")
+            record.update({
+                "EIN": f"{100000000 + i:09d}",
+                "NAME": name,
+                "CITY": rng.choice(CITIES),
+                "STATE": "CA",
+                "ZIP": zip_code + plus4,
+                "SUBSECTION": rng.choice(SUBSECTION_CODES),
+                "STATUS": rng.choice(STATUS_CODES),
+                "NTEE_CD": rng.choice(NTEE_CODES),
+                "SORT_NAME": "",
+            })
+            writer.writerow([record[c] for c in BMF_COLUMNS])
+
+    return zips
+
+
+def generate_acs_response(path: str, zips: List[str], seed: int = 7) -> None:
+    """
+    Write a canned ACS API response (same JSON shape as api.census.gov) for zips,
+    suitable for `python -m data_sources.census snapshot --from-file`.
+    """
+    rng = random.Random(seed)
+    data = [[
+        "NAME", "B19013_001E", "B01003_001E", "B25003_002E", "B25003_003E",
+        "B17001_002E", "zip code tabulation area",
+    ]]
+    for zip_code in zips:
+        population = rng.randrange(500, 90000)
+        households = population // 3
+        owners = int(households * rng.uniform(0.2, 0.85))
+        data.append([
+            f"ZCTA5 {zip_code}",
+            str(rng.randrange(30000, 250000)),
+            str(population),
+            str(owners),
+            str(households - owners),
+            str(int(population * rng.uniform(0.02, 0.3))),
+            zip_code,
+        ])
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic IRS BMF CSV")
+    parser.add_argument("--rows", type=int, default=200000, help="number of orgs (default: 200000)")
+    parser.add_argument("--zips", type=int, default=DEFAULT_ZIP_COUNT, help="number of distinct ZIPs")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", required=True, help="CSV path to write")
+    parser.add_argument("--acs-out", help="also write a canned ACS response for the same ZIPs")
+    args = parser.parse_args(argv)
+
+    zips = generate_bmf_csv(args.out, args.rows, args.seed, args.zips)
+    print(f"Wrote {args.rows} orgs over {len(zips)} ZIPs to {args.out}")
+    if args.acs_out:
+        generate_acs_response(args.acs_out, zips, args.seed)
+        print(f"Wrote canned ACS response for {len(zips)} ZIPs to {args.acs_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Offline end-to-end load test: server.py behind real HTTP, with the Census APIs
+replaced by a local stub (benchmarks/upstream_stub.py).
+
+    python -m benchmarks.loadtest --rate 100 --duration 30 --users 200
+    python -m benchmarks.loadtest --latency-ms 800 --error-rate 0.05 --rate-limit 20 --no-cache
+
+Generates a synthetic BMF into a temp directory and builds its shards, starts
+the stub and the app as separate processes (every data file the app reads or
+writes is in the temp directory; city lookups all go to the stub's geocoder), then replays a Zipf-distributed ZIP
+workload open-loop at --rate requests/second. Latency is measured from each
+request's scheduled start, so time spent queued behind busy users counts.
+Reports throughput, p50/p95/p99 latency and a breakdown of outcomes.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from benchmarks.generate_bmf import generate_acs_response, generate_bmf_csv, zipf_weights
+from data_sources.gazetteer import GAZETTEER_COLUMNS
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_local = threading.local()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{proc.args} exited with {proc.returncode} during startup")
+        try:
+            requests.get(url, timeout=1.0)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} not ready after {timeout:g}s")
+
+
+def _percentile(sorted_ms: List[float], q: float) -> Optional[float]:
+    if not sorted_ms:
+        return None
+    return sorted_ms[min(len(sorted_ms) - 1, int(len(sorted_ms) * q))]
+
+
+def _latency_summary(samples: List[float]) -> Dict[str, Optional[float]]:
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "p50_ms": _percentile(samples, 0.50),
+        "p95_ms": _percentile(samples, 0.95),
+        "p99_ms": _percentile(samples, 0.99),
+        "max_ms": samples[-1] if samples else None,
+    }
+
+
+def _request(url: str, scheduled: float, timeout: float) -> Tuple[float, str]:
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+
+    try:
+        resp = session.get(url, timeout=timeout)
+        outcome = str(resp.status_code)
+    except requests.Timeout:
+        outcome = "timeout"
+    except requests.ConnectionError:
+        outcome = "connection_error"
+    return (time.perf_counter() - scheduled) * 1000.0, outcome
+
+
+def replay(base_url: str, zips: List[str], rate: float, duration: float, users: int, timeout: float) -> Dict:
+    """
+    Fire len = rate * duration requests on a fixed schedule, with at most
+    `users` in flight. Returns latency and outcome stats.
+    """
+    total = int(rate * duration)
+    futures = []
+
+    with ThreadPoolExecutor(max_workers=users, thread_name_prefix="user") as pool:
+        started = time.perf_counter()
+        for i in range(total):
+            scheduled = started + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            url = f"{base_url}/api/tax-breaks?zip={zips[i % len(zips)]}"
+            futures.append(pool.submit(_request, url, scheduled, timeout))
+        results = [f.result() for f in futures]
+        elapsed = time.perf_counter() - started
+
+    outcomes = Counter(outcome for _ms, outcome in results)
+    return {
+        "requests": total,
+        "elapsed_s": elapsed,
+        "throughput_rps": outcomes.get("200", 0) / elapsed if elapsed else 0.0,
+        "latency": _latency_summary([ms for ms, _ in results]),
+        "latency_ok": _latency_summary([ms for ms, outcome in results if outcome == "200"]),
+        "outcomes": dict(sorted(outcomes.items())),
+    }
+
+
+def run_loadtest(args: argparse.Namespace, workdir: str) -> Dict:
+    bmf_csv = os.path.join(workdir, "eo_load.csv")
+    all_zips = generate_bmf_csv(bmf_csv, args.rows, args.seed)
+
+    # An empty gazetteer, so every city lookup goes to the stub's geocoder
+    gazetteer = os.path.join(workdir, "zip_gazetteer.tsv")
+    with open(gazetteer, "w", encoding="utf-8") as f:
+        f.write("\t".join(GAZETTEER_COLUMNS) + "\n")
+
+    # Every data file the server reads or writes lives in workdir, so a run
+    # from a dev checkout never touches the real ones
+    env = dict(os.environ)
+    env.update({
+        "BMF_PATH": bmf_csv,
+        "BMF_SHARD_DIR": os.path.join(workdir, "shards"),
+        "CENSUS_SNAPSHOT_PATH": os.path.join(workdir, "acs_{vintage}.json.gz"),
+        "CENSUS_API_KEY": "loadtest",
+        "CENSUS_LIVE_FALLBACK": "1",
+        "GAZETTEER_PATH": gazetteer,
+        "GEOCODER_FALLBACK": "1",
+        "ZCTA_BITMAP_PATH": os.path.join(workdir, "valid_zctas.bin"),
+        "TAX_BREAKS_ARTIFACT": os.path.join(workdir, "tax_breaks.sqlite"),
+        "SERVE_PRECOMPUTED": "0",
+        "UPSTREAM_CACHE_PATH": os.path.join(workdir, "upstream_cache.sqlite") if args.disk_cache else "",
+        "WARMUP_TOP_N": "0",
+        "WARMUP_SEARCH_INDEXES": "0",
+        "WARMUP_STATS_PATH": os.path.join(workdir, "zip_popularity.json"),
+        "PYTHONUNBUFFERED": "1",
+    })
+    if args.no_cache:
+        env["TAX_BREAKS_CACHE_SIZE"] = "0"
+
+    subprocess.run(
+        [sys.executable, "-m", "data_sources.irs_bmf", "build", "--csv", bmf_csv, "--out-dir", env["BMF_SHARD_DIR"]],
+        cwd=REPO_ROOT, env=env, check=True, stdout=subprocess.DEVNULL,
+    )
+    if args.snapshot:
+        acs_json = os.path.join(workdir, "acs_response.json")
+        generate_acs_response(acs_json, all_zips, args.seed)
+        subprocess.run(
+            [sys.executable, "-m", "data_sources.census", "snapshot", "--from-file", acs_json],
+            cwd=REPO_ROOT, env=env, check=True, stdout=subprocess.DEVNULL,
+        )
+
+    # The stub plays both upstreams under two host names, so each gets its
+    # own rate-limit bucket, timeouts and circuit breaker, as in production
+    stub_port, app_port = _free_port(), _free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    acs_host, geocoder_host = "127.0.0.1", "localhost"
+    app_url = f"http://127.0.0.1:{app_port}"
+    env.update({
+        "CENSUS_API_BASE": f"http://{acs_host}:{stub_port}",
+        "CENSUS_GEOCODER_BASE": f"http://{geocoder_host}:{stub_port}",
+        "UPSTREAM_RATE_LIMITS": f"{acs_host}={args.census_quota},{geocoder_host}={args.geocoder_quota}",
+        "UPSTREAM_TIMEOUTS": f"{acs_host}=3.05/8,{geocoder_host}=3.05/5",
+        "PORT": str(app_port),
+    })
+
+    log = open(os.path.join(workdir, "server.log"), "w")
+    stub = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.upstream_stub", "--port", str(stub_port),
+            "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+            "--error-rate", str(args.error_rate), "--rate-limit", str(args.rate_limit),
+            "--empty-rate", str(args.empty_rate), "--seed", str(args.seed),
+        ],
+        cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    app = subprocess.Popen(
+        [sys.executable, "server.py"], cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    try:
+        _wait_ready(f"{stub_url}/__stats", stub)
+        _wait_ready(f"{app_url}/metrics", app)
+
+        rng = random.Random(args.seed)
+        workload = rng.choices(all_zips, weights=zipf_weights(len(all_zips)), k=int(args.rate * args.duration))
+        results = replay(app_url, workload, args.rate, args.duration, args.users, args.timeout)
+
+        results["upstream_stub"] = requests.get(f"{stub_url}/__stats", timeout=5).json()
+    finally:
+        app.terminate()
+        stub.terminate()
+        app.wait(10)
+        stub.wait(10)
+        log.close()
+
+    results["config"] = {
+        k: getattr(args, k)
+        for k in (
+            "rate", "duration", "users", "rows", "latency_ms", "jitter_ms", "error_rate",
+            "rate_limit", "empty_rate", "census_quota", "geocoder_quota", "no_cache", "disk_cache", "snapshot", "seed",
+        )
+    }
+    return results
+
+
+def _print_report(results: Dict) -> None:
+    def fmt(v: Optional[float]) -> str:
+        return "-" if v is None else f"{v:.1f}ms"
+
+    print(f"requests     {results['requests']} in {results['elapsed_s']:.1f}s")
+    print(f"throughput   {results['throughput_rps']:.1f} ok req/s")
+    for label, key in (("latency", "latency"), ("latency 200", "latency_ok")):
+        lat = results[key]
+        print(
+            f"{label:<13}p50 {fmt(lat['p50_ms'])}  p95 {fmt(lat['p95_ms'])}  "
+            f"p99 {fmt(lat['p99_ms'])}  max {fmt(lat['max_ms'])}"
+        )
+    print("outcomes     " + ", ".join(f"{k}: {v}" for k, v in results["outcomes"].items()))
+    print("upstream     " + ", ".join(f"{k}: {v}" for k, v in sorted(results["upstream_stub"].items())))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Offline end-to-end load test against an upstream stub")
+    parser.add_argument("--rate", type=float, default=50.0, help="target requests/second")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load")
+    parser.add_argument("--users", type=int, default=200, help="max concurrent requests")
+    parser.add_argument("--timeout", type=float, default=30.0, help="client timeout per request (s)")
+    parser.add_argument("--rows", type=int, default=50000, help="synthetic BMF size")
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="stub mean latency")
+    parser.add_argument("--jitter-ms", type=float, default=30.0, help="stub latency standard deviation")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of stub responses that are 503")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="stub requests/second before 429s (0 = off)")
+    parser.add_argument("--empty-rate", type=float, default=0.0, help="share of ZCTAs the stub has no data for (fixed per ZCTA)")
+    parser.add_argument("--census-quota", default="10/20", help="our rate/burst for the stub's ACS host")
+    parser.add_argument("--geocoder-quota", default="5/10", help="our rate/burst for the stub's geocoder host")
+    parser.add_argument("--no-cache", action="store_true", help="disable the in-process result cache")
+    parser.add_argument("--disk-cache", action="store_true", help="enable the shared upstream disk cache")
+    parser.add_argument("--snapshot", action="store_true", help="serve Census from a local snapshot, not the stub")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="taxbreaks-load-") as workdir:
+        results = run_loadtest(args, workdir)
+
+    _print_report(results)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
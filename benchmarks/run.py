@@ -0,0 +1,173 @@
+"""
+Offline micro-benchmarks for the per-request pipeline stages.
+
+    python -m benchmarks.run --rows 200000 --out bench.json
+    python -m benchmarks.run --rows 200000 --compare bench.json
+
+Generates a synthetic BMF + canned ACS response into a temp directory, points
+the data_sources modules at them through the environment, and times each stage
+separately over a Zipf-weighted sample of ZIPs. No network access is needed.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.generate_bmf import generate_acs_response, generate_bmf_csv, zipf_weights
+
+# Flag a stage as regressed when its median is this much slower than the
+# baseline, and by more than a few microseconds (sub-µs stages are noisy).
+REGRESSION_THRESHOLD = 1.10
+REGRESSION_MIN_DELTA_MS = 0.01
+
+
+def _time_calls(fn: Callable, args_list: List, repeat: int = 1) -> Dict[str, float]:
+    samples: List[float] = []
+    for _ in range(repeat):
+        for args in args_list:
+            started = time.perf_counter()
+            fn(*args)
+            samples.append((time.perf_counter() - started) * 1000.0)
+
+    samples.sort()
+    return {
+        "calls": len(samples),
+        "mean_ms": statistics.fmean(samples),
+        "p50_ms": samples[len(samples) // 2],
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "min_ms": samples[0],
+        "max_ms": samples[-1],
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_benchmarks(rows: int, samples: int, repeat: int, seed: int, workdir: str) -> Dict:
+    bmf_csv = os.path.join(workdir, "eo_bench.csv")
+    acs_json = os.path.join(workdir, "acs_response.json")
+
+    zips = generate_bmf_csv(bmf_csv, rows, seed)
+    generate_acs_response(acs_json, zips, seed)
+
+    # Modules read their paths from the environment at import time.
+    os.environ["BMF_PATH"] = bmf_csv
+    os.environ["BMF_SHARD_DIR"] = os.path.join(workdir, "shards")
+    os.environ["CENSUS_SNAPSHOT_PATH"] = os.path.join(workdir, "acs_{vintage}.json.gz")
+    os.environ["CENSUS_LIVE_FALLBACK"] = "0"
+    os.environ["GEOCODER_FALLBACK"] = "0"
+    os.environ["ZCTA_BITMAP_PATH"] = os.path.join(workdir, "valid_zctas.bin")
+    os.environ["TAX_BREAKS_ARTIFACT"] = os.path.join(workdir, "tax_breaks.sqlite")
+    os.environ["WARMUP_STATS_PATH"] = os.path.join(workdir, "zip_popularity.json")
+    os.environ["UPSTREAM_CACHE_PATH"] = ""  # nothing written outside workdir
+    os.environ["TAX_BREAKS_CACHE_SIZE"] = "0"
+
+    from data_sources import census, irs_bmf
+    from logic import profiling, recommendations, scoring
+
+    rng = random.Random(seed)
+    sample = rng.choices(zips, weights=zipf_weights(len(zips)), k=samples)
+    one_arg = [(z,) for z in sample]
+
+    stages: Dict[str, Dict[str, float]] = {}
+
+    # Full CSV scan is the no-index fallback; it's slow, so only a few calls.
+    stages["load_bmf_rows_csv_scan"] = _time_calls(irs_bmf.load_bmf_rows, one_arg[:3])
+
+    stages["build_bmf_index"] = _time_calls(irs_bmf.build_bmf_index, [([bmf_csv],)])
+    stages["load_bmf_rows"] = _time_calls(irs_bmf.load_bmf_rows, one_arg, repeat)
+
+    census.build_census_snapshot(source_file=acs_json)
+    stages["get_census_by_zip"] = _time_calls(census.get_census_by_zip, one_arg, repeat)
+
+    profiles = [profiling.learn_zip(z) for z in sample]
+    stages["learn_zip"] = _time_calls(profiling.learn_zip, one_arg, repeat)
+    stages["classify_psychographics"] = _time_calls(
+        profiling.classify_psychographics, [(p,) for p in profiles], repeat
+    )
+    stages["top_nonprofits"] = _time_calls(
+        scoring.top_nonprofits,
+        [(p["nonprofits"], p["psychographics"], recommendations.RECOMMENDATION_GROUPS, 3) for p in profiles],
+        repeat,
+    )
+    stages["generate_tax_breaks"] = _time_calls(recommendations.generate_tax_breaks, one_arg, repeat)
+
+    densest = max(len(p["nonprofits"]) for p in profiles)
+    return {
+        "meta": {
+            "rows": rows,
+            "zips": len(zips),
+            "samples": samples,
+            "repeat": repeat,
+            "seed": seed,
+            "densest_sampled_zip_orgs": densest,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "git_commit": _git_commit(),
+            "timestamp": int(time.time()),
+        },
+        "stages": stages,
+    }
+
+
+def compare(current: Dict, baseline: Dict) -> bool:
+    """
+    Print a per-stage comparison of p50 latencies. Returns True if any stage regressed.
+    """
+    regressed = False
+    print(f"{'stage':<28}{'baseline p50':>14}{'current p50':>14}{'ratio':>8}")
+    for name, stats in current["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if base is None:
+            print(f"{name:<28}{'-':>14}{stats['p50_ms']:>13.3f}ms{'new':>8}")
+            continue
+        ratio = stats["p50_ms"] / base["p50_ms"] if base["p50_ms"] else float("inf")
+        slower = stats["p50_ms"] - base["p50_ms"] > REGRESSION_MIN_DELTA_MS
+        flag = "  REGRESSION" if ratio > REGRESSION_THRESHOLD and slower else ""
+        regressed = regressed or bool(flag)
+        print(f"{name:<28}{base['p50_ms']:>12.3f}ms{stats['p50_ms']:>12.3f}ms{ratio:>8.2f}{flag}")
+    return regressed
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Offline pipeline micro-benchmarks")
+    parser.add_argument("--rows", type=int, default=200000, help="synthetic BMF size (10k-2M)")
+    parser.add_argument("--samples", type=int, default=200, help="Zipf-sampled ZIP lookups per stage")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="taxbreaks-bench-") as workdir:
+        results = run_benchmarks(args.rows, args.samples, args.repeat, args.seed, workdir)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(results, baseline):
+            sys.exit(1)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
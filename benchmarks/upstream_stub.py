@@ -0,0 +1,188 @@
+"""
+Local stand-in for api.census.gov (ACS 5-year) and the Census geocoder, for
+offline load tests.
+
+    python -m benchmarks.upstream_stub --port 8900 --latency-ms 80 --error-rate 0.02 --rate-limit 50
+
+Point the app at it with CENSUS_API_BASE / CENSUS_GEOCODER_BASE. Responses are
+synthesized deterministically per ZIP, in the same JSON shape as the real
+APIs. GET /__stats returns request counts by endpoint and status.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+ACS_HEADER = [
+    "NAME", "B19013_001E", "B01003_001E", "B25003_002E", "B25003_003E",
+    "B17001_002E", "zip code tabulation area",
+]
+
+
+class StubConfig:
+    def __init__(
+        self,
+        latency_ms: float = 50.0,
+        jitter_ms: float = 20.0,
+        error_rate: float = 0.0,
+        rate_limit: float = 0.0,
+        empty_rate: float = 0.0,
+        seed: int = 7,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit  # requests/second; 0 = unlimited
+        self.empty_rate = empty_rate  # share of ZCTAs with no ACS rows (the same ones every time)
+        self.seed = seed
+
+
+class _TokenBucket:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+
+def _acs_rows(zip_code: str, seed: int) -> list:
+    rng = random.Random(f"{seed}:{zip_code}")
+    population = rng.randrange(500, 90000)
+    households = population // 3
+    owners = int(households * rng.uniform(0.2, 0.85))
+    return [ACS_HEADER, [
+        f"ZCTA5 {zip_code}",
+        str(rng.randrange(30000, 250000)),
+        str(population),
+        str(owners),
+        str(households - owners),
+        str(int(population * rng.uniform(0.02, 0.3))),
+        zip_code,
+    ]]
+
+
+def _has_no_data(zip_code: str, config: StubConfig) -> bool:
+    # Fixed per ZCTA (like the real API), so caching a "no data" answer is
+    # as correct against the stub as it is in production
+    return random.Random(f"{config.seed}:empty:{zip_code}").random() < config.empty_rate
+
+
+def make_handler(config: StubConfig):
+    bucket = _TokenBucket(config.rate_limit) if config.rate_limit > 0 else None
+    stats: Dict[str, int] = {}
+    stats_lock = threading.Lock()
+    rng = random.Random(config.seed)
+    rng_lock = threading.Lock()
+
+    def count(key: str) -> None:
+        with stats_lock:
+            stats[key] = stats.get(key, 0) + 1
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):  # noqa: A002 - quiet by default
+            pass
+
+        def _send(self, status: int, body: Optional[object], headers: Optional[Dict[str, str]] = None) -> None:
+            payload = b"" if body is None else json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _route(self) -> Tuple[str, int, Optional[object], Dict[str, str]]:
+            url = urlsplit(self.path)
+            query = parse_qs(url.query)
+
+            if url.path.endswith("/acs/acs5"):
+                geo = unquote(query.get("for", [""])[0])
+                zip_code = geo.rsplit(":", 1)[-1]
+                empty = _has_no_data(zip_code, config)
+                # The real API answers 204 with no body for a ZCTA with no data
+                return "acs5", (204 if empty else 200), (None if empty else _acs_rows(zip_code, config.seed)), {}
+
+            if url.path.endswith("/geocoder/geographies/address"):
+                zip_code = query.get("zip", [""])[0]
+                match = {"addressComponents": {"city": f"CITY {zip_code}", "state": "CA", "zip": zip_code}}
+                return "geocoder", 200, {"result": {"addressMatches": [match]}}, {}
+
+            return "unknown", 404, {"error": "unknown endpoint"}, {}
+
+        def do_GET(self):  # noqa: N802 - BaseHTTPRequestHandler API
+            if self.path == "/__stats":
+                with stats_lock:
+                    self._send(200, dict(stats))
+                return
+
+            endpoint, status, body, headers = self._route()
+
+            if bucket is not None and not bucket.take():
+                count(f"{endpoint}:429")
+                self._send(429, {"error": "rate limited"}, {"Retry-After": "1"})
+                return
+
+            with rng_lock:
+                delay = max(0.0, rng.gauss(config.latency_ms, config.jitter_ms)) / 1000.0
+                failed = rng.random() < config.error_rate
+            time.sleep(delay)
+
+            if failed:
+                status, body = 503, {"error": "injected failure"}
+            count(f"{endpoint}:{status}")
+            self._send(status, body, headers)
+
+    return Handler
+
+
+def serve(port: int, config: StubConfig) -> ThreadingHTTPServer:
+    """
+    Start the stub on 127.0.0.1:port in a background thread and return the
+    server (call .shutdown() to stop it).
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="upstream-stub", daemon=True).start()
+    return server
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Local Census ACS / geocoder stub")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="latency standard deviation")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered 503")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="requests/second before 429s (0 = off)")
+    parser.add_argument("--empty-rate", type=float, default=0.0, help="share of ZCTAs with no ACS data")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit, args.empty_rate, args.seed)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(config))
+    server.daemon_threads = True
+    print(f"Upstream stub listening on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
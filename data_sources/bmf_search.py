@@ -0,0 +1,283 @@
+import heapq
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from itertools import groupby
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .irs_bmf import BmfShard, load_shard, shard_states
+from .zip_prefixes import state_for_zip
+
+# How many per-state search indexes to keep in memory at once (least recently
+# searched ones are dropped first). An index costs about 20 MB of heap and over
+# a second of CPU to build per 200k orgs, and isn't counted in
+# BMF_MEMORY_BUDGET_MB. 0 keeps one per built shard.
+BMF_SEARCH_MAX_INDEXES = int(os.environ.get("BMF_SEARCH_MAX_INDEXES", "4"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _index_cap() -> int:
+    return max(1, BMF_SEARCH_MAX_INDEXES or len(shard_states()))
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class _SearchIndex:
+    """
+    Inverted index over the name and city tokens of one state shard.
+
+    Records are numbered in file order, which is ZIP order, so a ZIP filter is
+    just a range of record ids. Tokens are kept in one sorted list with their
+    postings packed into a single array, so a prefix query is a bisect plus a
+    short scan, and the whole index is a handful of flat buffers.
+    """
+
+    def __init__(self, shard: BmfShard):
+        self.version = shard.version
+
+        # Record id -> the shard's offset for it (see BmfShard.record_at)
+        self.offsets = array("I")
+        # zip_first_id[i] is the first record id of zips[i]
+        self.zips: List[str] = []
+        self.zip_first_id = array("I")
+        postings: Dict[str, List[int]] = {}
+
+        for zip_code, offset, (name, city) in shard.iter_records(("name", "city")):
+            if not self.zips or self.zips[-1] != zip_code:
+                self.zips.append(zip_code)
+                self.zip_first_id.append(len(self.offsets))
+            record_id = len(self.offsets)
+            self.offsets.append(offset)
+            for token in set(tokenize(name) + tokenize(city)):
+                postings.setdefault(token, []).append(record_id)
+        self.zip_first_id.append(len(self.offsets))
+
+        self.tokens = sorted(postings)
+        self.starts = array("I")
+        self.postings = array("I")
+        for token in self.tokens:
+            self.starts.append(len(self.postings))
+            self.postings.extend(postings[token])
+        self.starts.append(len(self.postings))
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def _bounds(self, token: str, prefix: bool, id_range: Optional[range]) -> List[Tuple[int, int]]:
+        """
+        (lo, hi) slices of self.postings holding the ids for token (every token
+        starting with it, if prefix), trimmed to id_range.
+        """
+        bounds: List[Tuple[int, int]] = []
+        i = bisect_left(self.tokens, token)
+        while i < len(self.tokens) and (
+            self.tokens[i].startswith(token) if prefix else self.tokens[i] == token
+        ):
+            lo, hi = self.starts[i], self.starts[i + 1]
+            if id_range is not None:
+                # Postings are sorted by record id, so a ZIP filter is two bisects
+                lo = bisect_left(self.postings, id_range.start, lo, hi)
+                hi = bisect_left(self.postings, id_range.stop, lo, hi)
+            if lo < hi:
+                bounds.append((lo, hi))
+            i += 1
+        return bounds
+
+    def _iter_ids(self, bounds: List[Tuple[int, int]]) -> Iterator[int]:
+        if len(bounds) == 1:
+            lo, hi = bounds[0]
+            return iter(self.postings[lo:hi])
+        merged = heapq.merge(*(self.postings[lo:hi] for lo, hi in bounds))
+        return (rid for rid, _ in groupby(merged))
+
+    def _member_test(self, bounds: List[Tuple[int, int]]) -> Callable[[int], bool]:
+        if len(bounds) > 8:
+            return set(self._iter_ids(bounds)).__contains__
+
+        postings = self.postings
+
+        def contains(rid: int) -> bool:
+            for lo, hi in bounds:
+                j = bisect_left(postings, rid, lo, hi)
+                if j < hi and postings[j] == rid:
+                    return True
+            return False
+
+        return contains
+
+    def match(self, tokens: List[str], limit: int, id_range: Optional[range] = None) -> List[int]:
+        """
+        First `limit` record ids (in ZIP order) matching every token. The last
+        token matches as a prefix, so partially typed queries work for typeahead.
+
+        The token with the fewest postings drives a lazy walk in id order and
+        the others are checked by bisect, so a query stops as soon as it has
+        `limit` hits instead of materializing every match.
+        """
+        last = len(tokens) - 1
+        groups = [self._bounds(token, i == last, id_range) for i, token in enumerate(tokens)]
+        if not all(groups):
+            return []
+
+        groups.sort(key=lambda b: sum(hi - lo for lo, hi in b))
+        checks = [self._member_test(b) for b in groups[1:]]
+
+        matched: List[int] = []
+        for rid in self._iter_ids(groups[0]):
+            if all(check(rid) for check in checks):
+                matched.append(rid)
+                if len(matched) >= limit:
+                    break
+        return matched
+
+    def id_range_for_zip(self, zip_code: str) -> Optional[range]:
+        i = bisect_left(self.zips, zip_code)
+        if i == len(self.zips) or self.zips[i] != zip_code:
+            return None
+        return range(self.zip_first_id[i], self.zip_first_id[i + 1])
+
+    def zip_of(self, record_id: int) -> str:
+        return self.zips[bisect_right(self.zip_first_id, record_id) - 1]
+
+    def record(self, shard: BmfShard, record_id: int) -> Dict:
+        org = shard.record_at(self.offsets[record_id])
+        org["zip"] = self.zip_of(record_id)
+        return org
+
+
+class _SearchIndexes:
+    """
+    Per-state search indexes, built on first search (or by build_search_indexes)
+    and rebuilt when the shard's version changes (a build or refresh swapped
+    the file).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = OrderedDict()  # type: OrderedDict[str, _SearchIndex]
+        self._build_locks = {}  # type: Dict[str, threading.Lock]
+        self.builds = 0
+
+    def _cached(self, state: str, shard: BmfShard) -> Optional[_SearchIndex]:
+        index = self._indexes.get(state)
+        if index is not None and index.version == shard.version:
+            self._indexes.move_to_end(state)
+            return index
+        return None
+
+    def get(self, state: str, shard: BmfShard) -> _SearchIndex:
+        with self._lock:
+            index = self._cached(state, shard)
+            if index is not None:
+                return index
+            build_lock = self._build_locks.setdefault(state, threading.Lock())
+
+        # Built outside the shared lock, so searches of other states go on;
+        # concurrent first searches of this state wait for one build.
+        with build_lock:
+            with self._lock:
+                index = self._cached(state, shard)
+            if index is not None:
+                return index
+
+            index = _SearchIndex(shard)
+
+            with self._lock:
+                self._indexes[state] = index
+                self._indexes.move_to_end(state)
+                self.builds += 1
+                cap = _index_cap()
+                while len(self._indexes) > cap:
+                    self._indexes.popitem(last=False)
+            return index
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "loaded": len(self._indexes),
+                "records": sum(len(i) for i in self._indexes.values()),
+                "builds": self.builds,
+            }
+
+
+_indexes = _SearchIndexes()
+
+
+def search_stats() -> Dict[str, int]:
+    return _indexes.stats()
+
+
+def build_search_indexes(states: Optional[Iterable[str]] = None) -> int:
+    """
+    Build the indexes of states (default: every state with a shard), in
+    order, up to BMF_SEARCH_MAX_INDEXES of them (e.g. on a background thread
+    at startup), so their first searches don't pay for it. Returns how many
+    were built.
+    """
+    built = 0
+    cap = _index_cap()
+    for st in dict.fromkeys(states if states is not None else shard_states()):
+        if built >= cap:
+            break
+        shard = load_shard(st)
+        if shard is not None:
+            _indexes.get(st, shard)
+            built += 1
+    return built
+
+
+def search_nonprofits(
+    query: str,
+    zip_code: Optional[str] = None,
+    state: Optional[str] = None,
+    limit: int = 20,
+) -> List[Dict]:
+    """
+    Nonprofits whose name or city contains every word of query (the last word
+    may be a prefix), optionally limited to one ZIP or state. Results are in
+    ZIP order and carry their "zip". Only states with a built shard are
+    searchable. Raises ValueError for a search without zip_code or state when
+    there are more shards than BMF_SEARCH_MAX_INDEXES, since it would
+    rebuild most of their indexes on every query.
+    """
+    tokens = tokenize(query)
+    if not tokens or limit <= 0:
+        return []
+
+    if zip_code:
+        routed = state_for_zip(zip_code)
+        if routed is None or (state and state.upper() != routed):
+            return []
+        states: Iterable[str] = [routed]
+    elif state:
+        states = [state.upper()]
+    else:
+        states = shard_states()
+        if len(states) > _index_cap():
+            raise ValueError("Add a zip or state to search.")
+
+    results: List[Dict] = []
+    for st in states:
+        shard = load_shard(st)
+        if shard is None:
+            continue
+        index = _indexes.get(st, shard)
+
+        id_range = None
+        if zip_code:
+            id_range = index.id_range_for_zip(zip_code)
+            if id_range is None:
+                continue
+
+        for record_id in index.match(tokens, limit - len(results), id_range):
+            results.append(index.record(shard, record_id))
+        if len(results) >= limit:
+            break
+
+    return results
@@ -0,0 +1,63 @@
+import re
+from typing import Dict, List
+
+# Category bits stored on every BMF org as "category_mask".
+FAITH = 1 << 0
+PHILANTHROPY = 1 << 1
+EDUCATION = 1 << 2
+SCHOOL_SUPPORT = 1 << 3  # boosters, bands, team / mascot clubs
+ANIMAL = 1 << 4
+ENVIRONMENT = 1 << 5
+
+# Name keywords (lowercase substrings) for each category.
+CATEGORY_KEYWORDS: Dict[int, List[str]] = {
+    FAITH: [
+        "church",
+        "temple",
+        "synagogue",
+        "ministries",
+        "mosque",
+        "catholic",
+        "lutheran",
+        "baptist",
+    ],
+    PHILANTHROPY: ["foundation"],
+    EDUCATION: ["school", "academy", "education", "pta"],
+    SCHOOL_SUPPORT: ["band", "booster", "lancer"],
+    ANIMAL: ["animal", "humane", "rescue", "spca"],
+    ENVIRONMENT: ["conservation", "ecolife", "habitat", "environment", "lagoon"],
+}
+
+_KEYWORD_BITS: Dict[str, int] = {}
+for _bit, _words in CATEGORY_KEYWORDS.items():
+    for _word in _words:
+        _KEYWORD_BITS[_word] = _KEYWORD_BITS.get(_word, 0) | _bit
+
+# One compiled alternation for every keyword. Wrapping it in a lookahead makes
+# it match at every position, so overlapping keywords are all found and the
+# result equals testing each keyword as a substring. (No keyword is a prefix
+# of another, so one match per position is enough.)
+_KEYWORD_RE = re.compile(
+    "(?=(" + "|".join(re.escape(w) for w in sorted(_KEYWORD_BITS, key=len, reverse=True)) + "))"
+)
+
+
+def categorize_name(name: str) -> int:
+    """
+    Return the category bitmask for an org name in a single pass over it.
+    """
+    mask = 0
+    for match in _KEYWORD_RE.finditer(name.lower()):
+        mask |= _KEYWORD_BITS[match.group(1)]
+    return mask
+
+
+def org_categories(org: Dict) -> int:
+    """
+    Category bitmask for an org dict: the one tagged at ingest, or computed
+    from the name for orgs that didn't come through the BMF loader.
+    """
+    mask = org.get("category_mask")
+    if mask is None:
+        mask = categorize_name(org.get("name") or "")
+    return mask
@@ -1,56 +1,152 @@
+import argparse
+import gzip
+import json
 import os
-from typing import Optional, Tuple
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
 
-import requests
+from .disk_cache import MISS, upstream_cache
+from .files import file_stat
+from .http_client import UpstreamError, get_json
+from .rate_limit import RateLimited
 
 # Read API key from environment
 CENSUS_API_KEY = os.environ.get("CENSUS_API_KEY")
 
+# Upstream base URLs; override to point at a local stub server.
+CENSUS_API_BASE = os.environ.get("CENSUS_API_BASE", "https://api.census.gov")
+CENSUS_GEOCODER_BASE = os.environ.get("CENSUS_GEOCODER_BASE", "https://geocoding.geo.census.gov")
 
-def get_census_by_zip(zip_code: str) -> dict:
+# ACS 5-year vintage we serve. The numbers only change once a year.
+ACS_VINTAGE = os.environ.get("ACS_VINTAGE", "2022")
+
+ACS_VARIABLES = "NAME,B19013_001E,B01003_001E,B25003_002E,B25003_003E,B17001_002E"
+
+# Local snapshot of every ZCTA for a vintage (see build_census_snapshot below).
+# "{vintage}" is filled in per lookup, so one directory can hold several vintages.
+CENSUS_SNAPSHOT_PATH = os.environ.get(
+    "CENSUS_SNAPSHOT_PATH", "data_sources/acs_zcta_{vintage}.json.gz"
+)
+
+# Checked-in snapshot with just the 90210 and 92008 rows, for tests and offline
+# runs: CENSUS_SNAPSHOT_PATH=fixture CENSUS_LIVE_FALLBACK=0.
+CENSUS_FIXTURE_PATH = "data_sources/fixtures/acs_zcta_{vintage}.json.gz"
+if CENSUS_SNAPSHOT_PATH == "fixture":
+    CENSUS_SNAPSHOT_PATH = CENSUS_FIXTURE_PATH
+
+# Seconds between checks of the snapshot file for a rebuild.
+CENSUS_SNAPSHOT_RELOAD_INTERVAL = float(os.environ.get("CENSUS_SNAPSHOT_RELOAD_INTERVAL", "5"))
+
+# Whether to call api.census.gov when a ZIP isn't in the snapshot
+# (or no snapshot has been built yet).
+CENSUS_LIVE_FALLBACK = os.environ.get("CENSUS_LIVE_FALLBACK", "1").lower() not in ("0", "false", "no")
+
+# Column order of a snapshot row; "zip" is the table key and not stored per row.
+SNAPSHOT_FIELDS = (
+    "name",
+    "median_household_income",
+    "population",
+    "median_age",
+    "owner_units",
+    "renter_units",
+    "owner_ratio",
+    "below_poverty",
+    "poverty_rate",
+)
+
+# How long live upstream answers stay in the shared disk cache (seconds).
+# ACS rows are keyed by vintage and only change once a year; negative results
+# (a ZCTA with no data rows, a ZIP the geocoder can't match) expire sooner.
+CENSUS_CACHE_TTL = float(os.environ.get("CENSUS_CACHE_TTL", str(30 * 86400)))
+GEOCODER_CACHE_TTL = float(os.environ.get("GEOCODER_CACHE_TTL", str(7 * 86400)))
+NEGATIVE_CACHE_TTL = float(os.environ.get("NEGATIVE_CACHE_TTL", str(86400)))
+
+# ZIPs kept in memory as "no ACS data" (for NEGATIVE_CACHE_TTL), so the server
+# can turn them away before doing any work.
+NO_DATA_CACHE_SIZE = int(os.environ.get("CENSUS_NO_DATA_CACHE_SIZE", "20000"))
+
+_GEOCODER_BENCHMARK = "Public_AR_Current"
+
+_snapshot_lock = threading.Lock()
+# vintage -> ({zcta: row} or None, (inode, mtime) of the file it was read from)
+_snapshots = {}  # type: Dict[str, Tuple[Optional[Dict[str, list]], Optional[Tuple[int, int]]]]
+_snapshot_checked = {}  # type: Dict[str, float]  # vintage -> last stat check
+
+
+class _NoDataCache:
+    """
+    Bounded, expiring set of ZIPs whose ACS lookup found no rows. Oldest
+    entries are dropped first once it is full.
     """
-    Fetch Census ACS 5-year data for a ZIP code tabulation area (ZCTA).
 
-    Returns a dict with safe numeric fields or an empty dict {} if:
-      - the key is missing
-      - the request fails
-      - the ZIP has no Census data rows
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._expires: "OrderedDict[str, float]" = OrderedDict()
+        self.hits = 0
+
+    def add(self, zip_code: str) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._expires.pop(zip_code, None)
+            self._expires[zip_code] = time.monotonic() + self.ttl
+            while len(self._expires) > self.max_entries:
+                self._expires.popitem(last=False)
+
+    def __contains__(self, zip_code: str) -> bool:
+        with self._lock:
+            expires = self._expires.get(zip_code)
+            if expires is None:
+                return False
+            if expires <= time.monotonic():
+                del self._expires[zip_code]
+                return False
+            self.hits += 1
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._expires.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._expires), "hits": self.hits}
+
+
+_NO_DATA = _NoDataCache(NO_DATA_CACHE_SIZE, NEGATIVE_CACHE_TTL)
+
+
+def census_has_no_data(zip_code: str) -> bool:
     """
-    if not CENSUS_API_KEY:
-        # In production we don't want to crash the whole app because of a missing key.
-        print("Warning: CENSUS_API_KEY is not set; returning empty census data.")
-        return {}
+    True if a recent lookup found no ACS rows for this ZIP (in-memory check).
+    """
+    load_census_snapshot()  # a rebuilt snapshot clears the set
+    return zip_code in _NO_DATA
 
-    url = (
-        "https://api.census.gov/data/2022/acs/acs5"
-        "?get=NAME,B19013_001E,B01003_001E,B25003_002E,B25003_003E,B17001_002E"
-        f"&for=zip%20code%20tabulation%20area:{zip_code}"
-        f"&key={CENSUS_API_KEY}"
-    )
 
-    try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-    except Exception as e:
-        # Any HTTP / parse error → just log and return empty
-        print(f"Error fetching Census data for {zip_code}: {e}")
-        return {}
+def census_no_data_stats() -> Dict[str, int]:
+    return _NO_DATA.stats()
 
-    # Expect shape:
-    # [
-    #   ["NAME","B19013_001E","B01003_001E","B25003_002E","B25003_003E","B17001_002E","zip code tabulation area"],
-    #   ["ZCTA5 92008","101897","27373","5727","6026","2319","92008"]
-    # ]
-    if not isinstance(data, list) or len(data) < 2:
-        # No data rows for this ZIP (likely non-ZCTA or PO box)
-        print(f"No Census rows returned for ZIP {zip_code}")
-        return {}
 
-    header = data[0]
-    row = data[1]
-    row_dict = dict(zip(header, row))
+def _acs_url(zcta: str, vintage: str = ACS_VINTAGE) -> str:
+    return (
+        f"{CENSUS_API_BASE}/data/{vintage}/acs/acs5"
+        f"?get={ACS_VARIABLES}"
+        f"&for=zip%20code%20tabulation%20area:{zcta}"
+        f"&key={CENSUS_API_KEY}"
+    )
 
+
+def _parse_acs_row(zip_code: str, row_dict: Dict) -> dict:
+    """
+    Turn one ACS row ({variable: raw string}) into our census dict,
+    including the derived owner_ratio and poverty_rate.
+    """
     def to_int(key: str) -> Optional[int]:
         val = row_dict.get(key)
         try:
@@ -90,37 +186,258 @@ def get_census_by_zip(zip_code: str) -> dict:
     }
 
 
+def _snapshot_path(vintage: str) -> str:
+    return CENSUS_SNAPSHOT_PATH.format(vintage=vintage)
+
+
+def _read_snapshot(path: str, vintage: str) -> Optional[Dict[str, list]]:
+    opener = gzip.open if path.endswith(".gz") else open
+    try:
+        with opener(path, "rt", encoding="utf-8") as f:
+            doc = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error reading Census snapshot {path}: {e}")
+        return None
+
+    if doc.get("vintage") != vintage or tuple(doc.get("fields", ())) != SNAPSHOT_FIELDS:
+        print(f"Census snapshot {path} does not match vintage {vintage}; ignoring it.")
+        return None
+    return doc["rows"]
+
+
+def load_census_snapshot(vintage: str = ACS_VINTAGE) -> Optional[Dict[str, list]]:
+    """
+    The {zcta: row} table for a vintage, or None if no snapshot has been built
+    for it. The file is re-read when a rebuild replaces it (checked every
+    CENSUS_SNAPSHOT_RELOAD_INTERVAL seconds), and a reload forgets the ZIPs
+    remembered as having no data.
+    """
+    now = time.monotonic()
+    checked_at = _snapshot_checked.get(vintage)
+    if checked_at is not None and now - checked_at < CENSUS_SNAPSHOT_RELOAD_INTERVAL:
+        return _snapshots[vintage][0]
+
+    with _snapshot_lock:
+        checked_at = _snapshot_checked.get(vintage)
+        if checked_at is not None and now - checked_at < CENSUS_SNAPSHOT_RELOAD_INTERVAL:
+            return _snapshots[vintage][0]
+
+        path = _snapshot_path(vintage)
+        stat = file_stat(path)
+        loaded = _snapshots.get(vintage)
+        if loaded is None or stat != loaded[1]:
+            table = _read_snapshot(path, vintage) if stat is not None else None
+            if loaded is not None:
+                print(f"Reloaded Census snapshot {path} ({len(table) if table else 0} ZCTAs)")
+                _NO_DATA.clear()
+            _snapshots[vintage] = (table, stat)
+
+        _snapshot_checked[vintage] = now
+        return _snapshots[vintage][0]
+
+
+def _census_from_snapshot(zip_code: str, vintage: str = ACS_VINTAGE) -> Optional[dict]:
+    table = load_census_snapshot(vintage)
+    if table is None:
+        return None
+
+    row = table.get(zip_code)
+    if row is None:
+        return None
+
+    result = {"zip": zip_code}
+    result.update(zip(SNAPSHOT_FIELDS, row))
+    return result
+
+
+def _fetch_census_live(zip_code: str) -> dict:
+    if not CENSUS_API_KEY:
+        # In production we don't want to crash the whole app because of a missing key.
+        print("Warning: CENSUS_API_KEY is not set; returning empty census data.")
+        return {}
+
+    # Keyed by endpoint, vintage and variables (never the API key)
+    cache_key = f"acs5|{ACS_VINTAGE}|{ACS_VARIABLES}|{zip_code}"
+    cached = upstream_cache().get("census", cache_key)
+    if cached is not MISS:
+        if not cached:
+            _NO_DATA.add(zip_code)
+        return cached or {}
+
+    url = _acs_url(zip_code)
+
+    try:
+        data = get_json(url)
+    except (RateLimited, UpstreamError):
+        # Over quota, throttled or down is not "no data for this ZIP"; let
+        # the server answer 503 instead of treating the ZIP as invalid
+        raise
+    except Exception as e:
+        # Anything else → just log and return empty (not cached)
+        print(f"Error fetching Census data for {zip_code}: {e}")
+        return {}
+
+    # Expect shape:
+    # [
+    #   ["NAME","B19013_001E","B01003_001E","B25003_002E","B25003_003E","B17001_002E","zip code tabulation area"],
+    #   ["ZCTA5 92008","101897","27373","5727","6026","2319","92008"]
+    # ]
+    if not isinstance(data, list) or len(data) < 2:
+        # No data rows for this ZIP (likely non-ZCTA or PO box)
+        print(f"No Census rows returned for ZIP {zip_code}")
+        upstream_cache().put("census", cache_key, None, NEGATIVE_CACHE_TTL)
+        _NO_DATA.add(zip_code)
+        return {}
+
+    header = data[0]
+    row = data[1]
+    result = _parse_acs_row(zip_code, dict(zip(header, row)))
+    upstream_cache().put("census", cache_key, result, CENSUS_CACHE_TTL)
+    return result
+
+
+def get_census_by_zip(zip_code: str) -> dict:
+    """
+    Fetch Census ACS 5-year data for a ZIP code tabulation area (ZCTA).
+
+    Served from the local ACS snapshot when one has been built
+    (python -m data_sources.census snapshot); otherwise, or for a ZCTA the
+    snapshot doesn't have, from the live API if CENSUS_LIVE_FALLBACK is on.
+
+    Returns a dict with safe numeric fields or an empty dict {} if:
+      - the key is missing
+      - the ZIP has no Census data rows
+
+    Raises RateLimited or UpstreamError (CircuitOpenError) if the live API
+    is throttling us or unavailable.
+    """
+    cached = _census_from_snapshot(zip_code)
+    if cached is not None:
+        return cached
+
+    if not CENSUS_LIVE_FALLBACK:
+        if load_census_snapshot() is not None:
+            _NO_DATA.add(zip_code)  # the snapshot is all we serve from
+        return {}
+
+    return _fetch_census_live(zip_code)
+
+
+def build_census_snapshot(
+    vintage: str = ACS_VINTAGE,
+    source_file: Optional[str] = None,
+    out_path: Optional[str] = None,
+    zip_prefixes: Optional[List[str]] = None,
+) -> int:
+    """
+    Pull every ZCTA for a vintage in a single
+    ``for=zip code tabulation area:*`` request and store it as a snapshot.
+
+    source_file: read a saved API response (same JSON shape) instead of calling
+                 the API -- used for fixtures and offline rebuilds.
+    zip_prefixes: only keep ZCTAs starting with one of these (e.g. ["90", "91", ...]).
+
+    Returns the number of ZCTAs written.
+    """
+    if source_file:
+        with open(source_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    else:
+        if not CENSUS_API_KEY:
+            raise ValueError("CENSUS_API_KEY is required to build a snapshot from the live API")
+        data = get_json(_acs_url("*", vintage), timeout=(3.05, 120.0))
+
+    if not isinstance(data, list) or len(data) < 2:
+        raise ValueError("ACS response has no data rows")
+
+    header = data[0]
+    zcta_col = header.index("zip code tabulation area")
+
+    rows: Dict[str, list] = {}
+    for raw in data[1:]:
+        zcta = raw[zcta_col]
+        if zip_prefixes and not zcta.startswith(tuple(zip_prefixes)):
+            continue
+        parsed = _parse_acs_row(zcta, dict(zip(header, raw)))
+        rows[zcta] = [parsed[k] for k in SNAPSHOT_FIELDS]
+
+    out_path = out_path or _snapshot_path(vintage)
+    doc = {"vintage": vintage, "fields": list(SNAPSHOT_FIELDS), "rows": rows}
+
+    tmp_path = f"{out_path}.tmp.{os.getpid()}"
+    opener = gzip.open if out_path.endswith(".gz") else open
+    with opener(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(doc, f, separators=(",", ":"))
+    os.replace(tmp_path, out_path)
+
+    # Servers pick the new file up on their next stat check; this process now
+    with _snapshot_lock:
+        _snapshot_checked.pop(vintage, None)
+    _NO_DATA.clear()
+
+    return len(rows)
+
+
 def get_city_state_from_zip(zip_code: str) -> Tuple[Optional[str], Optional[str]]:
     """
     Use the Census geocoder to approximate city/state for a given ZIP.
 
-    Returns (city, state) or (None, None) on failure.
+    Returns (city, state), or (None, None) if the geocoder has no match.
+    Raises RateLimited or UpstreamError if the geocoder couldn't be asked or
+    its answer couldn't be read, so a failure isn't mistaken for "no match".
     """
+    cache_key = f"geographies/address|{_GEOCODER_BENCHMARK}|{zip_code}"
+    cached = upstream_cache().get("geocoder", cache_key)
+    if cached is not MISS:
+        return tuple(cached) if cached else (None, None)
+
     url = (
-        "https://geocoding.geo.census.gov/geocoder/geographies/address"
+        f"{CENSUS_GEOCODER_BASE}/geocoder/geographies/address"
         f"?street=&city=&state=&zip={zip_code}"
-        "&benchmark=Public_AR_Current&format=json"
+        f"&benchmark={_GEOCODER_BENCHMARK}&format=json"
     )
 
-    try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-    except Exception as e:
-        print(f"Error fetching geocoder data for {zip_code}: {e}")
-        return None, None
+    data = get_json(url)
 
     try:
         result = data["result"]["addressMatches"]
         if not result:
             print(f"No geocoder matches for ZIP {zip_code}")
+            upstream_cache().put("geocoder", cache_key, None, NEGATIVE_CACHE_TTL)
             return None, None
 
         first = result[0]
         comps = first.get("addressComponents", {})
         city = comps.get("city")
         state = comps.get("state")
+        upstream_cache().put("geocoder", cache_key, [city, state], GEOCODER_CACHE_TTL)
         return city, state
     except Exception as e:
-        print(f"Error parsing geocoder response for {zip_code}: {e}")
-        return None, None
+        raise UpstreamError(urlsplit(url).hostname or "", f"unexpected geocoder response: {e}") from e
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Census ACS snapshot tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    snap = sub.add_parser("snapshot", help="Store every ZCTA for an ACS vintage locally")
+    snap.add_argument("--vintage", default=ACS_VINTAGE, help=f"ACS 5-year vintage (default: {ACS_VINTAGE})")
+    snap.add_argument("--from-file", help="saved ACS API response to load instead of calling the API")
+    snap.add_argument("--out", help="snapshot path (default: CENSUS_SNAPSHOT_PATH)")
+    snap.add_argument(
+        "--zip-prefix",
+        action="append",
+        help="only keep ZCTAs with this prefix; repeatable (e.g. --zip-prefix 90 --zip-prefix 91)",
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.command == "snapshot":
+        count = build_census_snapshot(args.vintage, args.from_file, args.out, args.zip_prefix)
+        print(f"Stored {count} ZCTAs for ACS {args.vintage} in {args.out or _snapshot_path(args.vintage)}")
+
+
+if __name__ == "__main__":
+    main()
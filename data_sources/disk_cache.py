@@ -0,0 +1,180 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict
+
+# Shared on-disk cache of upstream responses (Census ACS, geocoder), so worker
+# processes and restarts don't re-fetch what another worker already fetched.
+# Set UPSTREAM_CACHE_PATH= (empty) to disable it.
+UPSTREAM_CACHE_PATH = os.environ.get("UPSTREAM_CACHE_PATH", "data_sources/upstream_cache.sqlite")
+
+# Entry cap across all sources; the entries closest to expiry go first.
+UPSTREAM_CACHE_MAX_ENTRIES = int(os.environ.get("UPSTREAM_CACHE_MAX_ENTRIES", "200000"))
+
+# How many writes between size checks.
+_EVICT_EVERY = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    value TEXT,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at);
+"""
+
+# get() result when the key is absent or expired, so a cached None (a negative
+# result) can be told apart from a miss.
+MISS = object()
+
+
+class DiskCache:
+    """
+    SQLite-backed key/value cache safe to share between processes.
+
+    The database runs in WAL mode, so readers never block the (short) writes
+    of other workers. Values are JSON; None is stored as a negative result.
+    Each entry carries its own expiry, so every source can use its own TTL.
+    Any SQLite error is logged and treated as a miss: the cache must never
+    take a request down with it.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, source: str, key: str) -> Any:
+        """
+        Cached value for (source, key), None for a cached negative result,
+        or MISS.
+        """
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM entries WHERE key = ? AND expires_at > ?",
+                (f"{source}|{key}", time.time()),
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"[disk cache] Error reading {self.path}: {e}")
+            self._count("errors")
+            return MISS
+
+        if row is None:
+            self._count("misses")
+            return MISS
+        if row[0] is None:
+            self._count("negative_hits")
+            return None
+        self._count("hits")
+        return json.loads(row[0])
+
+    def put(self, source: str, key: str, value: Any, ttl: float) -> None:
+        """
+        Store value (None records a negative result) for ttl seconds.
+        """
+        encoded = None if value is None else json.dumps(value, separators=(",", ":"))
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, source, value, expires_at) VALUES (?, ?, ?, ?)",
+                (f"{source}|{key}", source, encoded, time.time() + ttl),
+            )
+            with self._lock:
+                self._writes += 1
+                check = self._writes % _EVICT_EVERY == 0
+            if check:
+                self._evict(conn)
+        except sqlite3.Error as e:
+            print(f"[disk cache] Error writing {self.path}: {e}")
+            self._count("errors")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """
+        Drop expired entries, then the ones closest to expiry until we're 10%
+        under the cap (so we don't evict again on the very next check).
+        """
+        removed = conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),)).rowcount
+        (count,) = conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        if count > self.max_entries:
+            excess = count - int(self.max_entries * 0.9)
+            removed += conn.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY expires_at LIMIT ?)",
+                (excess,),
+            ).rowcount
+        with self._lock:
+            self.evictions += removed
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "errors": self.errors,
+            }
+
+
+class _NullCache:
+    """
+    Stand-in used when UPSTREAM_CACHE_PATH is empty: every lookup misses.
+    """
+
+    def get(self, source: str, key: str) -> Any:
+        return MISS
+
+    def put(self, source: str, key: str, value: Any, ttl: float) -> None:
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+
+_cache_lock = threading.Lock()
+_cache = None  # type: Any
+
+
+def upstream_cache():
+    """
+    The process-wide upstream response cache (created on first use).
+    """
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if UPSTREAM_CACHE_PATH:
+                    _cache = DiskCache(UPSTREAM_CACHE_PATH, UPSTREAM_CACHE_MAX_ENTRIES)
+                else:
+                    _cache = _NullCache()
+    return _cache
+
+
+def upstream_cache_stats() -> Dict[str, int]:
+    return upstream_cache().stats()
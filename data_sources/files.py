@@ -0,0 +1,14 @@
+import os
+from typing import Optional, Tuple
+
+
+def file_stat(path: str) -> Optional[Tuple[int, int]]:
+    """
+    (inode, mtime_ns) of path, or None if it doesn't exist. Changes whenever
+    the file is replaced, so it tells a reader when to reload.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns
@@ -0,0 +1,310 @@
+import argparse
+import csv
+import math
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Bundled ZIP/ZCTA gazetteer: one row per ZIP with its preferred city, state,
+# county and centroid, sorted by ZIP. Regenerate it with
+#   python -m data_sources.gazetteer rebuild SOURCE.csv
+GAZETTEER_PATH = os.environ.get("GAZETTEER_PATH", "data_sources/zip_gazetteer.tsv")
+
+GAZETTEER_COLUMNS = ("zip", "city", "state", "county", "lat", "lon")
+
+# Spatial grid cell size in degrees (~7 miles of latitude). A 10-mile radius
+# query touches a handful of cells.
+GRID_CELL_DEGREES = 0.1
+
+EARTH_RADIUS_MILES = 3958.8
+
+# A rebuild producing fewer ZIPs than this is almost certainly the wrong source
+# file (a national ZCTA list has ~33,000); refused unless forced.
+GAZETTEER_MIN_ZIPS = int(os.environ.get("GAZETTEER_MIN_ZIPS", "1000"))
+
+# Column names we accept from source files (USPS/HUD crosswalks, Census
+# gazetteer files, commercial ZIP databases), mapped onto GAZETTEER_COLUMNS.
+_SOURCE_ALIASES = {
+    "zip": ("zip", "zipcode", "zip_code", "zcta", "zcta5", "geoid"),
+    "city": ("city", "primary_city", "usps_zip_pref_city", "preferred_city", "po_name"),
+    "state": ("state", "state_abbr", "usps_zip_pref_state", "stusps"),
+    "county": ("county", "county_name", "countyname"),
+    "lat": ("lat", "latitude", "intptlat"),
+    "lon": ("lon", "lng", "longitude", "intptlong"),
+}
+
+
+class GazetteerEntry(NamedTuple):
+    zip: str
+    city: str
+    state: str
+    county: str
+    lat: Optional[float]
+    lon: Optional[float]
+
+
+class Gazetteer:
+    """
+    Array-backed ZIP lookup: ZIPs live in a sorted array of ints, and each
+    string column is an array of indexes into a shared string table, so the
+    whole state fits in a few compact buffers. Lookups are a bisect, O(log n).
+    """
+
+    def __init__(self, rows: List[List[str]]):
+        rows = sorted(rows, key=lambda r: r[0])
+
+        self._strings: List[str] = []
+        string_ids: Dict[str, int] = {}
+
+        def intern(value: str) -> int:
+            idx = string_ids.get(value)
+            if idx is None:
+                idx = string_ids[value] = len(self._strings)
+                self._strings.append(value)
+            return idx
+
+        self.zips = array("I")
+        self._city = array("I")
+        self._state = array("I")
+        self._county = array("I")
+        self.lats = array("d")
+        self.lons = array("d")
+
+        for zip_code, city, state, county, lat, lon in rows:
+            self.zips.append(int(zip_code))
+            self._city.append(intern(city))
+            self._state.append(intern(state))
+            self._county.append(intern(county))
+            # NaN marks a missing centroid
+            self.lats.append(float(lat) if lat else float("nan"))
+            self.lons.append(float(lon) if lon else float("nan"))
+
+        self._grid = self._build_grid()
+
+    def __len__(self) -> int:
+        return len(self.zips)
+
+    def _position(self, zip_code: str) -> Optional[int]:
+        if len(zip_code) != 5 or not zip_code.isdigit():
+            return None
+        key = int(zip_code)
+        i = bisect_left(self.zips, key)
+        if i < len(self.zips) and self.zips[i] == key:
+            return i
+        return None
+
+    def entry_at(self, i: int) -> GazetteerEntry:
+        lat, lon = self.lats[i], self.lons[i]
+        return GazetteerEntry(
+            zip=f"{self.zips[i]:05d}",
+            city=self._strings[self._city[i]],
+            state=self._strings[self._state[i]],
+            county=self._strings[self._county[i]],
+            lat=None if lat != lat else lat,
+            lon=None if lon != lon else lon,
+        )
+
+    def lookup(self, zip_code: str) -> Optional[GazetteerEntry]:
+        i = self._position(zip_code)
+        return None if i is None else self.entry_at(i)
+
+    # -----------------------------------------------------------------------
+    # Spatial index
+    # -----------------------------------------------------------------------
+
+    def _build_grid(self) -> Dict[Tuple[int, int], array]:
+        """
+        Uniform lat/lon grid over ZIP centroids: {cell: array of row positions}.
+        Built with the gazetteer, so concurrent radius queries only read it.
+        """
+        grid: Dict[Tuple[int, int], array] = {}
+        for i, (lat, lon) in enumerate(zip(self.lats, self.lons)):
+            if lat == lat and lon == lon:  # skip NaN (no centroid)
+                cell = (math.floor(lat / GRID_CELL_DEGREES), math.floor(lon / GRID_CELL_DEGREES))
+                grid.setdefault(cell, array("I")).append(i)
+        return grid
+
+    def within_radius(self, zip_code: str, miles: float) -> List[Tuple[str, float]]:
+        """
+        ZIPs whose centroid lies within `miles` of zip_code's centroid, as
+        (zip, distance_miles) sorted nearest first (zip_code itself is first,
+        at 0.0). Only the grid cells overlapping the radius are scanned.
+        """
+        i = self._position(zip_code)
+        if i is None:
+            return []
+        lat0, lon0 = self.lats[i], self.lons[i]
+        if lat0 != lat0 or lon0 != lon0:
+            return [(zip_code, 0.0)]
+
+        grid = self._grid
+        dlat = math.degrees(miles / EARTH_RADIUS_MILES)
+        dlon = dlat / max(math.cos(math.radians(lat0)), 0.01)
+
+        lat_cells = range(math.floor((lat0 - dlat) / GRID_CELL_DEGREES), math.floor((lat0 + dlat) / GRID_CELL_DEGREES) + 1)
+        lon_cells = range(math.floor((lon0 - dlon) / GRID_CELL_DEGREES), math.floor((lon0 + dlon) / GRID_CELL_DEGREES) + 1)
+
+        found: List[Tuple[float, int]] = []
+        for cy in lat_cells:
+            for cx in lon_cells:
+                for j in grid.get((cy, cx), ()):
+                    d = _haversine_miles(lat0, lon0, self.lats[j], self.lons[j])
+                    if d <= miles:
+                        found.append((d, self.zips[j]))
+
+        found.sort()
+        return [(f"{z:05d}", d) for d, z in found]
+
+
+def _haversine_miles(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+_load_lock = threading.Lock()
+_gazetteer = None  # type: Optional[Gazetteer]
+
+
+def _read_gazetteer(path: str) -> Gazetteer:
+    rows: List[List[str]] = []
+    try:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f, delimiter="\t")
+            header = next(reader, None)
+            if header is not None and tuple(header) != GAZETTEER_COLUMNS:
+                raise ValueError(f"unexpected gazetteer header {header}")
+            for row in reader:
+                if len(row) == len(GAZETTEER_COLUMNS):
+                    rows.append(row)
+    except FileNotFoundError:
+        print(f"[gazetteer] File not found at {path}; ZIP lookups will return nothing.")
+    return Gazetteer(rows)
+
+
+def get_gazetteer() -> Gazetteer:
+    """
+    Load the bundled gazetteer on first use (once per process).
+    """
+    global _gazetteer
+
+    if _gazetteer is None:
+        with _load_lock:
+            if _gazetteer is None:
+                _gazetteer = _read_gazetteer(GAZETTEER_PATH)
+    return _gazetteer
+
+
+def lookup_zip(zip_code: str) -> Optional[GazetteerEntry]:
+    """
+    Return the gazetteer entry for a 5-digit ZIP, or None if we don't know it.
+    """
+    return get_gazetteer().lookup(zip_code.strip())
+
+
+def zips_within_radius(zip_code: str, miles: float) -> List[Tuple[str, float]]:
+    """
+    [(zip, distance_miles), ...] for every ZIP centroid within `miles`, nearest first.
+    """
+    return get_gazetteer().within_radius(zip_code.strip(), miles)
+
+
+# ---------------------------------------------------------------------------
+# Rebuild from a local source file
+# ---------------------------------------------------------------------------
+
+def _resolve_columns(header: List[str]) -> Dict[str, int]:
+    lowered = [h.strip().lower() for h in header]
+    positions: Dict[str, int] = {}
+    for column, aliases in _SOURCE_ALIASES.items():
+        for alias in aliases:
+            if alias in lowered:
+                positions[column] = lowered.index(alias)
+                break
+    missing = [c for c in ("zip", "city", "state") if c not in positions]
+    if missing:
+        raise ValueError(f"source file is missing required columns: {', '.join(missing)}")
+    return positions
+
+
+def _city_case(city: str) -> str:
+    # USPS-style sources are all caps; leave mixed-case names ("Beale AFB") alone
+    return city.title() if city.isupper() else city
+
+
+def rebuild_gazetteer(source_path: str, out_path: str = GAZETTEER_PATH, force: bool = False) -> int:
+    """
+    Rebuild the bundled gazetteer from a local CSV/TSV with at least ZIP, city
+    and state columns (county and centroid are optional). When a ZIP appears
+    more than once, the first row wins, so list preferred cities first.
+
+    Raises ValueError (and leaves the old file in place) if the source yields
+    fewer than GAZETTEER_MIN_ZIPS ZIPs, unless force is set.
+
+    Returns the number of ZIPs written.
+    """
+    with open(source_path, "r", encoding="utf-8-sig", newline="") as f:
+        first_line = f.readline()
+        f.seek(0)
+        reader = csv.reader(f, delimiter="\t" if "\t" in first_line else ",")
+        cols = _resolve_columns(next(reader))
+
+        def field(row: List[str], name: str) -> str:
+            i = cols.get(name)
+            return row[i].strip() if i is not None and i < len(row) else ""
+
+        by_zip: Dict[str, List[str]] = {}
+        for row in reader:
+            zip_code = field(row, "zip").split("-")[0].zfill(5)
+            if len(zip_code) != 5 or not zip_code.isdigit() or zip_code in by_zip:
+                continue
+            by_zip[zip_code] = [
+                zip_code,
+                _city_case(field(row, "city")),
+                field(row, "state").upper(),
+                field(row, "county"),
+                field(row, "lat"),
+                field(row, "lon"),
+            ]
+
+    if len(by_zip) < GAZETTEER_MIN_ZIPS and not force:
+        raise ValueError(
+            f"{source_path} has only {len(by_zip)} ZIPs (expected at least {GAZETTEER_MIN_ZIPS}); "
+            "pass --force to write it anyway"
+        )
+
+    tmp_path = f"{out_path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        writer.writerow(GAZETTEER_COLUMNS)
+        for zip_code in sorted(by_zip):
+            writer.writerow(by_zip[zip_code])
+    os.replace(tmp_path, out_path)
+
+    return len(by_zip)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="ZIP gazetteer tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = sub.add_parser("rebuild", help="Rebuild the gazetteer from a local CSV/TSV")
+    rebuild.add_argument("source", help="source file with zip, city, state[, county, lat, lon] columns")
+    rebuild.add_argument("--out", default=GAZETTEER_PATH, help=f"output path (default: {GAZETTEER_PATH})")
+    rebuild.add_argument(
+        "--force", action="store_true", help=f"write even if fewer than {GAZETTEER_MIN_ZIPS} ZIPs were found"
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.command == "rebuild":
+        count = rebuild_gazetteer(args.source, args.out, args.force)
+        print(f"[gazetteer] Wrote {count} ZIPs from {args.source} to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
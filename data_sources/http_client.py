@@ -0,0 +1,358 @@
+"""
+Shared HTTP client for the data_sources package.
+
+All outbound calls (Census API, Census geocoder, ProPublica) go through
+get_json so they share:
+
+  - one pooled, keep-alive requests.Session (no TCP+TLS handshake per call)
+  - jittered exponential-backoff retries on 429 / 5xx and connection errors
+  - per-host (connect, read) timeouts, cut short by the caller's deadline
+    (call_deadline) so abandoned work doesn't hold a worker past it
+  - a per-host circuit breaker that fails fast once an upstream is clearly down
+  - per-host token-bucket admission control with priority classes
+    (data_sources.rate_limit), so a burst of traffic can't blow the API quota
+
+Base URLs for each upstream live in the module that calls it and can be
+pointed at a local stub server through the environment.
+"""
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .rate_limit import RateLimited, acquire
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Attempts after the first one, for retryable failures.
+HTTP_MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_BASE = float(os.environ.get("HTTP_BACKOFF_BASE", "0.2"))
+HTTP_BACKOFF_MAX = float(os.environ.get("HTTP_BACKOFF_MAX", "2.0"))
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "32"))
+
+DEFAULT_TIMEOUT = (3.05, 10.0)  # (connect, read) seconds
+
+# Per-host (connect, read) timeouts; anything not listed uses DEFAULT_TIMEOUT.
+HOST_TIMEOUTS: Dict[str, Tuple[float, float]] = {
+    "api.census.gov": (3.05, 8.0),
+    "geocoding.geo.census.gov": (3.05, 5.0),
+    "projects.propublica.org": (3.05, 10.0),
+}
+
+# Extra or overriding per-host timeouts, "host=connect/read,..." (e.g. for a
+# local stub standing in for the Census hosts).
+for _item in os.environ.get("UPSTREAM_TIMEOUTS", "").split(","):
+    if "=" in _item:
+        _host, _, _value = _item.strip().partition("=")
+        _connect, _, _read = _value.partition("/")
+        HOST_TIMEOUTS[_host.strip()] = (float(_connect), float(_read or _connect))
+
+# Consecutive failures before a host's breaker opens, and how long it stays open.
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("HTTP_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("HTTP_BREAKER_RESET", "30"))
+
+
+class UpstreamError(Exception):
+    """
+    An upstream call failed (after retries, if it was retryable). retry_after
+    is the upstream's Retry-After in seconds, when it sent one.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        message: str,
+        status: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ):
+        super().__init__(f"{host}: {message}")
+        self.host = host
+        self.status = status
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamError):
+    """
+    The host's circuit breaker is open; the call was not attempted.
+    retry_after is the time left until the breaker lets a trial call through.
+    """
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after BREAKER_FAILURE_THRESHOLD consecutive failures.
+    Open -> half-open after BREAKER_RESET_SECONDS, letting a single trial call
+    through; its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None  # type: Optional[float]
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half_open"
+            return "open"
+
+    def open_remaining(self) -> float:
+        """
+        Seconds until an open breaker lets a trial through (0 if not open).
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """
+        Give back a half-open trial that never reached the upstream.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+# Monotonic time by which the current caller needs an answer (see call_deadline).
+_deadline: ContextVar[Optional[float]] = ContextVar("upstream_deadline", default=None)
+
+_session_lock = threading.Lock()
+_session = None  # type: Optional[requests.Session]
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def _get_session() -> requests.Session:
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=8,
+                    pool_maxsize=HTTP_POOL_SIZE,
+                    max_retries=0,  # retries are handled below, with jitter
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _breaker_for(host: str) -> CircuitBreaker:
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _session_lock:
+            breaker = _breakers.setdefault(
+                host, CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+            )
+    return breaker
+
+
+def _count(host: str, counter: str) -> None:
+    with _stats_lock:
+        host_stats = _stats.setdefault(
+            host, {"requests": 0, "errors": 0, "retries": 0, "circuit_open": 0}
+        )
+        host_stats[counter] += 1
+
+
+def upstream_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Per-host counters (requests, errors, retries, circuit_open) plus breaker state.
+    """
+    with _stats_lock:
+        snapshot = {host: dict(counters) for host, counters in _stats.items()}
+    for host, breaker in list(_breakers.items()):
+        snapshot.setdefault(host, {"requests": 0, "errors": 0, "retries": 0, "circuit_open": 0})
+        snapshot[host]["breaker"] = breaker.state
+    return snapshot
+
+
+@contextmanager
+def call_deadline(at: float):
+    """
+    Bound every get_json call in the block (rate-limit wait, timeouts,
+    retries) to finish by time.monotonic() == at.
+    """
+    token = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def _time_left() -> Optional[float]:
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def _within_deadline(timeout: Tuple[float, float], left: Optional[float]) -> Tuple[float, float]:
+    if left is None:
+        return timeout
+    left = max(left, 0.05)
+    return min(timeout[0], left), min(timeout[1], left)
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Retry-After (delta-seconds or an HTTP date) in seconds, or None.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def _backoff(attempt: int, retry_after: Optional[float]) -> float:
+    if retry_after is not None:
+        return retry_after
+    # "Full jitter": uniform in [0, base * 2^attempt], capped
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _circuit_open(host: str, breaker: CircuitBreaker) -> CircuitOpenError:
+    # retry_after: when the breaker will next let a trial call through
+    return CircuitOpenError(
+        host, "circuit open; upstream recently failing", retry_after=max(1.0, breaker.open_remaining())
+    )
+
+
+def get_json(
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    timeout: Optional[Tuple[float, float]] = None,
+) -> Any:
+    """
+    GET url and decode the JSON body. Returns None for an empty body (e.g. 204).
+
+    Raises CircuitOpenError without calling out if the host's breaker is open,
+    RateLimited if the host's rate limiter sheds the call or the upstream is
+    still throttling (429) after retries, and UpstreamError if the call fails
+    after retries. A Retry-After longer than HTTP_BACKOFF_MAX is not waited
+    out here: the call fails at once, carrying the upstream's retry_after.
+    Inside call_deadline, no attempt or retry runs past the deadline.
+    """
+    host = urlsplit(url).hostname or ""
+    breaker = _breaker_for(host)
+    timeout = timeout or HOST_TIMEOUTS.get(host, DEFAULT_TIMEOUT)
+
+    left = _time_left()
+    if left is not None and left <= 0:
+        raise UpstreamError(host, "caller deadline passed before the call")
+
+    # An open circuit fails fast, without queueing for quota. The half-open
+    # trial is only claimed once a token is granted, so a shed call can't
+    # leave it in flight
+    if breaker.state == "open":
+        _count(host, "circuit_open")
+        raise _circuit_open(host, breaker)
+    acquire(host, left)
+    if not breaker.allow():
+        _count(host, "circuit_open")
+        raise _circuit_open(host, breaker)
+
+    session = _get_session()
+    attempt = 0
+    while True:
+        _count(host, "requests")
+        retry_after = None
+        try:
+            resp = session.get(url, params=params, timeout=_within_deadline(timeout, _time_left()))
+        except requests.RequestException as e:
+            # Connection errors, timeouts, broken chunked bodies, redirect
+            # loops: all count against the breaker (and release a half-open trial)
+            error = UpstreamError(host, f"request failed: {e}")
+        else:
+            if resp.status_code not in RETRY_STATUSES:
+                # Anything else is the upstream answering; the breaker only
+                # cares that it's alive.
+                breaker.record_success()
+                if resp.status_code >= 400:
+                    _count(host, "errors")
+                    raise UpstreamError(host, f"HTTP {resp.status_code}", resp.status_code)
+                if not resp.content:
+                    return None
+                try:
+                    return resp.json()
+                except ValueError as e:
+                    _count(host, "errors")
+                    raise UpstreamError(host, f"invalid JSON: {e}", resp.status_code)
+
+            retry_after = _parse_retry_after(resp.headers.get("Retry-After"))
+            error = UpstreamError(host, f"HTTP {resp.status_code}", resp.status_code, retry_after)
+
+        # Don't retry sooner than the upstream asked; if it asked for longer
+        # than we'll wait, or the caller's deadline comes first, give up now
+        delay = _backoff(attempt, retry_after)
+        left = _time_left()
+        wait_too_long = retry_after is not None and retry_after > HTTP_BACKOFF_MAX
+        out_of_time = left is not None and delay >= left
+        if attempt >= HTTP_MAX_RETRIES or wait_too_long or out_of_time:
+            _count(host, "errors")
+            if error.status == 429:
+                # Throttling means the upstream is alive, just busy with us:
+                # it must not open the breaker
+                breaker.record_success()
+                raise RateLimited(host, max(1.0, retry_after or 1.0), "throttled upstream") from error
+            breaker.record_failure()
+            raise error
+
+        _count(host, "retries")
+        time.sleep(delay)
+        attempt += 1
+        try:
+            acquire(host, _time_left())  # retries spend quota too
+        except RateLimited:
+            # Our own quota, not the upstream's health: no breaker failure
+            _count(host, "errors")
+            breaker.release_trial()
+            raise
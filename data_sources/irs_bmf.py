@@ -1,49 +1,814 @@
+import argparse
 import csv
-from typing import List, Dict
+import glob
+import hashlib
+import io
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .categories import categorize_name
+from .files import file_stat
+from .zip_prefixes import state_for_zip
 
 # Path to your downloaded IRS BMF file for California.
 # Make sure eo_ca.csv is actually in the data_sources/ folder.
-BMF_PATH = "data_sources/eo_ca.csv"
+BMF_PATH = os.environ.get("BMF_PATH", "data_sources/eo_ca.csv")
 
+# State BMF_PATH covers (the IRS publishes per-state extracts); empty if it
+# may hold any state, e.g. a concatenated national extract.
+BMF_PATH_STATE = os.environ.get("BMF_PATH_STATE", "CA").upper()
 
-def load_bmf_rows(zip_code: str) -> List[Dict]:
+# The nonprofit store is sharded by state: one pre-built, ZIP-sorted index per
+# state at BMF_SHARD_DIR/eo_<state>.idx (see build_bmf_index below), so the
+# California shard is data_sources/eo_ca.idx. A state with no shard falls back
+# to scanning BMF_PATH, but only if that file can hold the state (see
+# _may_scan_csv); otherwise it simply has no orgs.
+BMF_SHARD_DIR = os.environ.get("BMF_SHARD_DIR", "data_sources")
+
+# Shards are mapped lazily, the first time a ZIP routed to them is requested,
+# and the least recently used ones are dropped once more than this many
+# megabytes are mapped.
+BMF_MEMORY_BUDGET_MB = float(os.environ.get("BMF_MEMORY_BUDGET_MB", "1024"))
+
+# How often (seconds) a running process checks whether a shard file has been
+# replaced by a refresh. Readers keep using the old mapping until the swap.
+BMF_RELOAD_INTERVAL = float(os.environ.get("BMF_RELOAD_INTERVAL", "5"))
+
+# Builds split each CSV into byte ranges of about this many megabytes and
+# parse them on BMF_INGEST_WORKERS processes (default: one per CPU).
+BMF_INGEST_CHUNK_MB = float(os.environ.get("BMF_INGEST_CHUNK_MB", "16"))
+BMF_INGEST_WORKERS = int(os.environ.get("BMF_INGEST_WORKERS", "0")) or None
+
+# ---------------------------------------------------------------------------
+# Index file layout
+# ---------------------------------------------------------------------------
+#
+#   header   : magic (8s) | version digest (16s) | zip count (I) | records offset (I)
+#   zip table: one fixed-width entry per ZIP, sorted by ZIP:
+#              zip (5s) | start (I) | end (I)   -- byte range inside the records block
+#   records  : one tab-separated line per org, grouped by ZIP, in RECORD_FIELDS order
+#              (category_mask is stored as a decimal string)
+#
+# All integers are little-endian. The file is mmap'd read-only, so every worker
+# process on the box shares the same page cache for it.
+INDEX_MAGIC = b"BMFIDX2\n"
+_HEADER = struct.Struct("<8s16sII")
+_ZIP_ENTRY = struct.Struct("<5sII")
+
+RECORD_FIELDS = (
+    "name",
+    "city",
+    "state",
+    "ein",
+    "subsection_code",
+    "classification",
+    "status",
+    "category_mask",
+)
+
+
+def shard_path(state: str, shard_dir: Optional[str] = None) -> str:
+    return os.path.join(shard_dir or BMF_SHARD_DIR, f"eo_{state.lower()}.idx")
+
+
+def _route(org_zip: str, org: Dict) -> str:
+    # Shards are chosen by ZIP prefix at read time, so build them the same way;
+    # the org's own STATE is only a fallback for unroutable ZIPs.
+    return state_for_zip(org_zip) or (org.get("state") or "").upper()
+
+
+# Source columns we read from a BMF CSV (first non-empty one wins); the other
+# ~20 columns are never materialized.
+_SOURCE_COLUMNS = (
+    ("name", ("NAME",)),
+    ("city", ("CITY",)),
+    ("state", ("STATE",)),
+    ("ein", ("EIN", "EIN_NUM")),
+    ("subsection_code", ("SUBSECTION",)),
+    ("classification", ("NTEE_CD",)),
+    ("status", ("STATUS",)),
+)
+# ZIP column can have extra formats
+_ZIP_COLUMNS = ("ZIP", "ZIP_CD", "ZIPCODE")
+
+
+class _RowProjector:
     """
-    Return all nonprofit orgs in the IRS BMF dataset that match the given ZIP.
-    Assumes a single-state IRS BMF CSV (e.g., California only).
+    Turns raw csv.reader rows into (zip, org) using only the columns we need,
+    with ZIP+4 stripping and title-casing done once here.
+    """
+
+    def __init__(self, header: List[str]):
+        positions = {name.strip(): i for i, name in enumerate(header)}
+        self.zip_cols = [positions[c] for c in _ZIP_COLUMNS if c in positions]
+        self.cols = [[positions[c] for c in candidates if c in positions] for _field, candidates in _SOURCE_COLUMNS]
+
+        # Usual case: every field maps to exactly one column, so a full-width
+        # row can be projected with plain indexing.
+        columns = self.cols + [self.zip_cols]
+        self.direct = [c[0] for c in columns] if all(len(c) == 1 for c in columns) else None
+        self.width = max((max(c) for c in columns if c), default=-1) + 1
+
+    @staticmethod
+    def _first(row: List[str], indexes: List[int]) -> str:
+        for i in indexes:
+            if i < len(row) and row[i]:
+                return row[i]
+        return ""
+
+    def values(self, row: List[str]) -> Tuple[str, List[str]]:
+        """
+        (zip, [name, city, state, ein, subsection, ntee, status]) for a row.
+        """
+        if self.direct is not None and len(row) >= self.width:
+            values = [row[i] for i in self.direct]
+            raw_zip = values.pop()
+        else:
+            values = [self._first(row, indexes) for indexes in self.cols]
+            raw_zip = self._first(row, self.zip_cols)
+
+        values[0] = values[0].title()
+        values[1] = values[1].title()
+        # Strip ZIP+4 (e.g., 92008-1234)
+        return raw_zip.strip().split("-")[0], values
+
+    def __call__(self, row: List[str]) -> Tuple[str, Dict]:
+        org_zip, values = self.values(row)
+        org = dict(zip((field for field, _ in _SOURCE_COLUMNS), values))
+        # Keyword categories (see data_sources/categories.py), tagged once at ingest
+        org["category_mask"] = categorize_name(org["name"])
+        return org_zip, org
+
+
+def _iter_bmf_csv(csv_path: str) -> Iterable[Tuple[str, Dict]]:
+    """
+    Yield (zip, org) pairs for every row of an IRS BMF CSV.
+    """
+    # IRS CSV tends to use latin-1 encoding
+    with open(csv_path, "r", encoding="latin-1", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        project = _RowProjector(header)
+        for row in reader:
+            yield project(row)
+
+
+def _scan_csv(zip_code: str) -> List[Dict]:
+    """
+    Slow path: linear scan of the raw CSV. Used only when no index has been built.
     """
     matches: List[Dict] = []
 
     try:
-        # IRS CSV tends to use latin-1 encoding
-        with open(BMF_PATH, "r", encoding="latin-1") as f:
-            reader = csv.DictReader(f)
-
-            for row in reader:
-                # ZIP column can have extra formats, normalize it
-                possible_zip_cols = ["ZIP", "ZIP_CD", "ZIPCODE"]
-                raw_zip = ""
-                for col in possible_zip_cols:
-                    if col in row and row[col]:
-                        raw_zip = row[col]
-                        break
-
-                # Strip ZIP+4 (e.g., 92008-1234)
-                org_zip = raw_zip.strip().split("-")[0]
-
-                if org_zip == zip_code:
-                    matches.append({
-                        "name": (row.get("NAME") or "").title(),
-                        "city": (row.get("CITY") or "").title(),
-                        "state": row.get("STATE") or "",
-                        "ein": row.get("EIN") or row.get("EIN_NUM") or "",
-                        "subsection_code": row.get("SUBSECTION") or "",
-                        "classification": row.get("NTEE_CD") or "",
-                        "status": row.get("STATUS") or "",
-                    })
-
+        for org_zip, org in _iter_bmf_csv(BMF_PATH):
+            if org_zip == zip_code:
+                matches.append(org)
     except FileNotFoundError:
         print(f"[IRS BMF] File not found at {BMF_PATH}. Did you put eo_ca.csv in data_sources/?")
     except Exception as e:
         print("[IRS BMF] Error reading IRS BMF file:", e)
 
     return matches
+
+
+# ---------------------------------------------------------------------------
+# Build step
+# ---------------------------------------------------------------------------
+
+def _encode_fields(fields: List[str]) -> bytes:
+    line = "\t".join(fields)
+    # Tabs / newlines are our separators, so they must never appear in a field
+    # (checked on the joined line: the common clean case costs one count)
+    if line.count("\t") != len(RECORD_FIELDS) - 1 or "\n" in line or "\r" in line:
+        line = "\t".join(f.replace("\t", " ").replace("\n", " ").replace("\r", " ") for f in fields)
+    return (line + "\n").encode("utf-8")
+
+
+def _encode_record(org: Dict) -> bytes:
+    return _encode_fields([str(org.get(k) or "") for k in RECORD_FIELDS])
+
+
+def _indexable_zip(org_zip: str) -> bool:
+    # Blank or malformed ZIPs can't go in the fixed-width zip table
+    return len(org_zip) == 5 and org_zip.isascii()
+
+
+def _write_index_lines(lines_by_zip: Dict[str, List[bytes]], index_path: str) -> int:
+    zips = sorted(z for z in lines_by_zip if _indexable_zip(z))
+
+    records = bytearray()
+    table = bytearray()
+    for z in zips:
+        start = len(records)
+        for line in lines_by_zip[z]:
+            records += line
+        table += _ZIP_ENTRY.pack(z.encode("ascii"), start, len(records))
+
+    digest = hashlib.blake2b(bytes(table) + bytes(records), digest_size=16).digest()
+    records_offset = _HEADER.size + len(table)
+    header = _HEADER.pack(INDEX_MAGIC, digest, len(zips), records_offset)
+
+    tmp_path = f"{index_path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(table)
+        f.write(records)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, index_path)
+
+    return len(zips)
+
+
+def write_bmf_index(orgs_by_zip: Dict[str, List[Dict]], index_path: str) -> int:
+    """
+    Write a ZIP-sorted index file for the given {zip: [org, ...]} mapping.
+
+    The file is written next to its final location and renamed into place,
+    so readers never observe a half-written index. Returns the number of ZIPs.
+    """
+    return _write_index_lines(
+        {z: [_encode_record(org) for org in orgs] for z, orgs in orgs_by_zip.items()},
+        index_path,
+    )
+
+
+def _csv_chunks(csv_path: str, chunk_bytes: int) -> Tuple[List[str], List[Tuple[int, int]]]:
+    """
+    Split a CSV into (start, end) byte ranges that each end on a line break.
+    Returns (header, ranges). BMF extracts never quote a line break inside a
+    field, so a line break always ends a row.
+    """
+    with open(csv_path, "rb") as f:
+        header_line = f.readline()
+        size = os.fstat(f.fileno()).st_size
+
+        ranges: List[Tuple[int, int]] = []
+        pos = f.tell()
+        while pos < size:
+            f.seek(min(pos + chunk_bytes, size))
+            f.readline()  # run on to the end of the current row
+            end = f.tell()
+            ranges.append((pos, end))
+            pos = end
+
+    header = next(csv.reader([header_line.decode("latin-1")]), [])
+    return header, ranges
+
+
+def _ingest_chunk(task: Tuple[str, List[str], int, int]) -> List[Tuple[str, str, str, bytes]]:
+    """
+    Parse one byte range of a BMF CSV into (state, zip, org key, encoded
+    record) rows. Runs in a worker process; records are encoded here so only
+    compact bytes travel back to the parent.
+    """
+    csv_path, header, start, end = task
+    with open(csv_path, "rb") as f:
+        f.seek(start)
+        text = f.read(end - start).decode("latin-1")
+
+    project = _RowProjector(header)
+    rows: List[Tuple[str, str, str, bytes]] = []
+    for raw in csv.reader(io.StringIO(text, newline="")):
+        # Same result as _encode_record(org) on the projected org, without
+        # building the dict
+        org_zip, values = project.values(raw)
+        if not _indexable_zip(org_zip):
+            continue
+        state = state_for_zip(org_zip) or values[2].upper()
+        if state:
+            key = values[3] or f"{org_zip}:{values[0]}"  # as _org_key
+            mask = categorize_name(values[0])
+            values.append(str(mask) if mask else "")
+            rows.append((state, org_zip, key, _encode_fields(values)))
+    return rows
+
+
+def build_bmf_index(
+    csv_paths: Optional[List[str]] = None,
+    shard_dir: Optional[str] = None,
+    workers: Optional[int] = BMF_INGEST_WORKERS,
+) -> Dict[str, int]:
+    """
+    Turn one or more IRS BMF CSVs (a state file, or the national eo1-eo4
+    extracts) into per-state, ZIP-sorted shards served by load_bmf_rows.
+
+    Each file is split into byte-range chunks that are parsed in parallel on
+    a process pool; chunks are merged back in file order, so row order within
+    each ZIP is preserved. An org listed more than once (by EIN) keeps its
+    first position and its last row, as refresh_bmf_index treats a drop, so
+    a refresh with the same files finds nothing to change. Rows without a
+    5-character ZIP are skipped. Returns {state: ZIPs indexed}.
+    """
+    chunk_bytes = max(1, int(BMF_INGEST_CHUNK_MB * 1024 * 1024))
+    tasks = []
+    for csv_path in csv_paths or [BMF_PATH]:
+        header, ranges = _csv_chunks(csv_path, chunk_bytes)
+        tasks.extend((csv_path, header, start, end) for start, end in ranges)
+
+    by_state: Dict[str, Dict[str, Tuple[str, bytes]]] = {}  # state -> key -> (zip, line)
+
+    def merge(rows: List[Tuple[str, str, str, bytes]]) -> None:
+        for state, org_zip, key, line in rows:
+            by_state.setdefault(state, {})[key] = (org_zip, line)
+
+    if len(tasks) <= 1 or workers == 1:
+        for task in tasks:
+            merge(_ingest_chunk(task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for rows in pool.map(_ingest_chunk, tasks):
+                merge(rows)
+
+    shard_dir = shard_dir or BMF_SHARD_DIR
+    os.makedirs(shard_dir, exist_ok=True)
+    counts: Dict[str, int] = {}
+    for state, orgs in sorted(by_state.items()):
+        lines_by_zip: Dict[str, List[bytes]] = {}
+        for org_zip, line in orgs.values():
+            lines_by_zip.setdefault(org_zip, []).append(line)
+        counts[state] = _write_index_lines(lines_by_zip, shard_path(state, shard_dir))
+    return counts
+
+
+# ---------------------------------------------------------------------------
+# Read path
+# ---------------------------------------------------------------------------
+
+class BmfShard:
+    """
+    One mapped state shard (see load_shard). Other modules read it through
+    its methods, never through the file layout: records are addressed by an
+    opaque offset from iter_records, valid until the shard's version changes.
+    """
+
+    __slots__ = ("state", "path", "mm", "zip_count", "records_offset", "stat", "size", "checked_at")
+
+    def __init__(self, state: str, path: str, mm: mmap.mmap, stat: Tuple[int, int], checked_at: float):
+        _magic, _digest, zip_count, records_offset = _HEADER.unpack_from(mm, 0)
+        self.state = state
+        self.path = path
+        self.mm = mm
+        self.zip_count = zip_count
+        self.records_offset = records_offset
+        self.stat = stat
+        self.size = len(mm)
+        self.checked_at = checked_at
+
+    @property
+    def version(self) -> str:
+        return _HEADER.unpack_from(self.mm, 0)[1].hex()
+
+    def zip_at(self, i: int) -> str:
+        return _ZIP_ENTRY.unpack_from(self.mm, _HEADER.size + i * _ZIP_ENTRY.size)[0].decode("ascii")
+
+    def zips(self) -> List[str]:
+        """
+        Every ZIP in the shard, sorted.
+        """
+        return [self.zip_at(i) for i in range(self.zip_count)]
+
+    def orgs_in_zip(self, zip_code: str) -> List[Dict]:
+        found = _find_zip_range(self.mm, self.zip_count, zip_code.encode("ascii"))
+        if found is None:
+            return []
+        start, end = found
+        return _decode_records(self.mm[self.records_offset + start:self.records_offset + end])
+
+    def iter_records(self, fields: Tuple[str, ...]) -> Iterator[Tuple[str, int, List[str]]]:
+        """
+        (zip, offset, [field values as str]) for every record, in ZIP order,
+        decoding only the requested RECORD_FIELDS. Pass offset to record_at.
+        """
+        columns = [RECORD_FIELDS.index(f) for f in fields]
+        last = max(columns) + 1
+        for i in range(self.zip_count):
+            z, start, end = _ZIP_ENTRY.unpack_from(self.mm, _HEADER.size + i * _ZIP_ENTRY.size)
+            z = z.decode("ascii")
+            block = self.mm[self.records_offset + start:self.records_offset + end]
+            pos = 0
+            for line in block.split(b"\n"):
+                if line:
+                    values = line.decode("utf-8").split("\t", last)
+                    yield z, start + pos, [values[c] for c in columns]
+                pos += len(line) + 1
+
+    def record_at(self, offset: int) -> Dict:
+        """
+        The org whose record starts at offset (from iter_records).
+        """
+        start = self.records_offset + offset
+        end = self.mm.find(b"\n", start)
+        return _decode_records(self.mm[start:end])[0]
+
+
+def _map_file(path: str) -> Optional[mmap.mmap]:
+    try:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        # ValueError: empty file cannot be mapped
+        return None
+
+    if mm[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+        print(
+            f"[IRS BMF] {path} is not a current BMF index "
+            "(rebuild it with: python -m data_sources.irs_bmf build); falling back to CSV scan."
+        )
+        mm.close()
+        return None
+
+    return mm
+
+
+class _ShardStore:
+    """
+    Lazily mapped per-state shards with LRU eviction under a memory budget.
+
+    Each shard is re-mapped when a refresh replaces its file on disk. Swaps and
+    evictions only drop the store's reference: in-flight readers finish on the
+    old mapping, which is released once they let go of it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._shards = OrderedDict()  # type: OrderedDict[str, BmfShard]
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, state: str) -> Optional[BmfShard]:
+        now = time.monotonic()
+        with self._lock:
+            shard = self._shards.get(state)
+            if shard is not None and now - shard.checked_at < BMF_RELOAD_INTERVAL:
+                self._shards.move_to_end(state)
+                return shard
+
+            path = shard_path(state)
+            stat = file_stat(path)
+            if shard is not None and stat == shard.stat:
+                shard.checked_at = now
+                self._shards.move_to_end(state)
+                return shard
+
+            self._shards.pop(state, None)
+            mm = _map_file(path) if stat is not None else None
+            if mm is None:
+                return None
+
+            new_shard = BmfShard(state, path, mm, stat, now)
+            if shard is not None:
+                print(f"[IRS BMF] Reloaded shard {path} (version {new_shard.version})")
+            self._shards[state] = new_shard
+            self.loads += 1
+            self._evict_over_budget(keep=state)
+            return new_shard
+
+    def _evict_over_budget(self, keep: str) -> None:
+        budget = BMF_MEMORY_BUDGET_MB * 1024 * 1024
+        while sum(s.size for s in self._shards.values()) > budget:
+            oldest = next(iter(self._shards))
+            if oldest == keep:
+                break
+            del self._shards[oldest]
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "loaded": len(self._shards),
+                "mapped_bytes": sum(s.size for s in self._shards.values()),
+                "budget_bytes": int(BMF_MEMORY_BUDGET_MB * 1024 * 1024),
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+
+_store = _ShardStore()
+
+
+def load_shard(state: str) -> Optional[BmfShard]:
+    """
+    The current shard for state (mapped on first use, reloaded after a build
+    or refresh), or None if it hasn't been built.
+    """
+    return _store.get(state)
+
+
+def shard_states(shard_dir: Optional[str] = None) -> List[str]:
+    """
+    States with a built shard, sorted.
+    """
+    paths = glob.glob(shard_path("*", shard_dir))
+    return sorted(os.path.basename(p)[3:-4].upper() for p in paths)
+
+
+def _shard_for_zip(zip_code: str) -> Optional[BmfShard]:
+    state = state_for_zip(zip_code)
+    if state is None:
+        return None
+    return _store.get(state)
+
+
+def bmf_store_stats() -> Dict[str, int]:
+    return _store.stats()
+
+
+def bmf_data_version(zip_code: str) -> str:
+    """
+    Version digest of the shard serving zip_code ("" when there is none).
+    Changes whenever a build or refresh changes that shard's data.
+    """
+    shard = _shard_for_zip(zip_code)
+    return shard.version if shard is not None else ""
+
+
+def _find_zip_range(mm: mmap.mmap, zip_count: int, key: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Binary search the fixed-width zip table for key.
+    """
+    lo, hi = 0, zip_count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        z, start, end = _ZIP_ENTRY.unpack_from(mm, _HEADER.size + mid * _ZIP_ENTRY.size)
+        if z < key:
+            lo = mid + 1
+        elif z > key:
+            hi = mid
+        else:
+            return start, end
+    return None
+
+
+def bmf_zip_codes(state: str = "CA") -> List[str]:
+    """
+    All ZIPs present in a state's shard, sorted ([] when it has no shard).
+    """
+    shard = _store.get(state)
+    return shard.zips() if shard is not None else []
+
+
+def _decode_records(block: bytes) -> List[Dict]:
+    orgs: List[Dict] = []
+    for line in block.decode("utf-8").split("\n"):
+        if line:
+            org = dict(zip(RECORD_FIELDS, line.split("\t")))
+            org["category_mask"] = int(org["category_mask"] or 0)
+            orgs.append(org)
+    return orgs
+
+
+_shards_seen = (None, False)  # type: Tuple[Optional[float], bool]
+
+
+def _any_shards_built() -> bool:
+    # Re-listed at most every BMF_RELOAD_INTERVAL seconds
+    global _shards_seen
+
+    checked_at, found = _shards_seen
+    now = time.monotonic()
+    if checked_at is None or now - checked_at >= BMF_RELOAD_INTERVAL:
+        found = bool(shard_states())
+        _shards_seen = (now, found)
+    return found
+
+
+def _may_scan_csv(state: str) -> bool:
+    """
+    Whether a state with no shard should fall back to scanning BMF_PATH: only
+    when the file is that state's extract, or it may hold any state and no
+    shards have been built at all.
+    """
+    if BMF_PATH_STATE:
+        return state == BMF_PATH_STATE
+    return not _any_shards_built()
+
+
+def load_bmf_rows(zip_code: str) -> List[Dict]:
+    """
+    Return all nonprofit orgs in the IRS BMF dataset that match the given ZIP.
+
+    The ZIP's prefix picks the state shard, so a lookup only ever maps the one
+    shard it needs. Served from that mmap'd shard when it has been built
+    (python -m data_sources.irs_bmf build), otherwise from a full scan of
+    BMF_PATH if that file can hold the ZIP's state.
+    """
+    if len(zip_code) != 5 or not zip_code.isdigit():
+        return []
+
+    state = state_for_zip(zip_code)
+    if state is None:
+        return []
+
+    shard = _store.get(state)
+    if shard is None:
+        return _scan_csv(zip_code) if _may_scan_csv(state) else []
+
+    return shard.orgs_in_zip(zip_code)
+
+
+# ---------------------------------------------------------------------------
+# Incremental refresh
+# ---------------------------------------------------------------------------
+
+def _read_index_blocks(index_path: str) -> Dict[str, bytes]:
+    """
+    Read an index file into {zip: raw records block}, without decoding them.
+    """
+    blocks: Dict[str, bytes] = {}
+    with open(index_path, "rb") as f:
+        data = f.read()
+
+    magic, _digest, zip_count, records_offset = _HEADER.unpack_from(data, 0)
+    if magic != INDEX_MAGIC:
+        raise ValueError(f"{index_path} is not a BMF index")
+
+    for i in range(zip_count):
+        z, start, end = _ZIP_ENTRY.unpack_from(data, _HEADER.size + i * _ZIP_ENTRY.size)
+        blocks[z.decode("ascii")] = data[records_offset + start:records_offset + end]
+
+    return blocks
+
+
+def read_bmf_index(index_path: str) -> Dict[str, List[Dict]]:
+    """
+    Read a whole index file back into a {zip: [org, ...]} mapping.
+    """
+    return {z: _decode_records(block) for z, block in _read_index_blocks(index_path).items()}
+
+
+def _org_key(org_zip: str, org: Dict) -> str:
+    # EIN identifies an org; the rare row without one falls back to ZIP + name
+    return org.get("ein") or f"{org_zip}:{org.get('name')}"
+
+
+def _apply_delta(
+    current: Dict[str, List[Dict]],
+    incoming: Dict[str, Tuple[str, Dict]],
+) -> Tuple[Dict[str, List[Dict]], Dict[str, int]]:
+    """
+    Merge {key: (zip, org)} from a new drop into a shard's {zip: [org, ...]}.
+    Returns (merged shard, delta counts).
+    """
+    seen = set()
+    changed = status_changed = removed = 0
+    merged: Dict[str, List[Dict]] = {}
+    moved: List[Tuple[str, Dict]] = []
+
+    for org_zip, orgs in current.items():
+        kept: List[Dict] = []
+        for org in orgs:
+            key = _org_key(org_zip, org)
+            seen.add(key)
+            new = incoming.get(key)
+            if new is None:
+                removed += 1
+                continue
+
+            new_zip, new_org = new
+            if new_org != org or new_zip != org_zip:
+                changed += 1
+                if new_org.get("status") != org.get("status"):
+                    status_changed += 1
+
+            if new_zip == org_zip:
+                kept.append(new_org)
+            else:
+                moved.append(new)
+        if kept:
+            merged[org_zip] = kept
+
+    added = 0
+    for key, (org_zip, org) in incoming.items():
+        if key not in seen:
+            added += 1
+            moved.append((org_zip, org))
+
+    for org_zip, org in moved:
+        merged.setdefault(org_zip, []).append(org)
+
+    delta = {
+        "added": added,
+        "removed": removed,
+        "changed": changed,
+        "status_changed": status_changed,
+    }
+    return merged, delta
+
+
+def _affected_zips(current: Dict[str, bytes], incoming_by_zip: Dict[str, Dict[str, Dict]]) -> List[str]:
+    """
+    ZIPs whose records differ between a shard's raw blocks and a new drop.
+    An org that moved ZIPs makes both its old and new ZIP differ.
+    """
+    affected = []
+    for z in set(current) | set(incoming_by_zip):
+        old_lines = sorted(current.get(z, b"").splitlines(keepends=True))
+        new_lines = sorted(_encode_record(org) for org in incoming_by_zip.get(z, {}).values())
+        if old_lines != new_lines:
+            affected.append(z)
+    return affected
+
+
+def refresh_bmf_index(
+    csv_paths: List[str],
+    shard_dir: Optional[str] = None,
+) -> Dict[str, Dict[str, int]]:
+    """
+    Apply a new monthly IRS BMF drop to the existing shards.
+
+    Each ZIP's records in the drop are compared with its block in the shard,
+    and only the ZIPs that differ are decoded and patched: orgs are diffed by
+    EIN into added / removed / changed (a STATUS change is also counted on
+    its own), unchanged orgs keep their place, changed orgs are updated in
+    place (or moved if their ZIP changed), and new orgs are appended to their
+    ZIP. Every other ZIP's block is copied over byte for byte. Only states
+    present in the drop are touched, so a single-state file never empties
+    other shards, and a shard with no affected ZIPs isn't written at all.
+    A patched shard is renamed over the old one (mmap readers need the whole
+    file consistent), and running processes pick it up within
+    BMF_RELOAD_INTERVAL seconds without a restart.
+
+    Returns {state: delta counts}.
+    """
+    shard_dir = shard_dir or BMF_SHARD_DIR
+
+    incoming: Dict[str, Dict[str, Tuple[str, Dict]]] = {}
+    for csv_path in csv_paths:
+        for org_zip, org in _iter_bmf_csv(csv_path):
+            # Same filter and EIN de-duplication as build_bmf_index, so rows
+            # the shard can't hold don't look like changes on every refresh
+            state = _route(org_zip, org) if _indexable_zip(org_zip) else ""
+            if state:
+                incoming.setdefault(state, {})[_org_key(org_zip, org)] = (org_zip, org)
+
+    deltas: Dict[str, Dict[str, int]] = {}
+    for state, state_incoming in sorted(incoming.items()):
+        incoming_by_zip: Dict[str, Dict[str, Dict]] = {}
+        for key, (org_zip, org) in state_incoming.items():
+            incoming_by_zip.setdefault(org_zip, {})[key] = org
+
+        path = shard_path(state, shard_dir)
+        current = _read_index_blocks(path) if os.path.exists(path) else {}
+        affected = set(_affected_zips(current, incoming_by_zip))
+
+        merged, delta = _apply_delta(
+            {z: _decode_records(current[z]) for z in affected if z in current},
+            {
+                key: (z, org)
+                for z in affected
+                for key, org in incoming_by_zip.get(z, {}).items()
+            },
+        )
+        if affected:
+            lines_by_zip = {z: [block] for z, block in current.items() if z not in affected}
+            for z, orgs in merged.items():
+                lines_by_zip[z] = [_encode_record(org) for org in orgs]
+            _write_index_lines(lines_by_zip, path)
+        deltas[state] = delta
+
+    return deltas
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="IRS BMF index tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Build per-state ZIP shards from IRS BMF CSVs")
+    build.add_argument(
+        "--csv",
+        action="append",
+        help=f"source CSV; repeat for the national eo1-eo4 extracts (default: {BMF_PATH})",
+    )
+    build.add_argument("--out-dir", default=BMF_SHARD_DIR, help=f"shard directory (default: {BMF_SHARD_DIR})")
+    build.add_argument("--workers", type=int, default=BMF_INGEST_WORKERS, help="parser processes (default: CPU count)")
+
+    refresh = sub.add_parser("refresh", help="Apply a new IRS BMF drop to the existing shards")
+    refresh.add_argument("csv", nargs="+", help="new IRS BMF CSV(s)")
+    refresh.add_argument("--dir", default=BMF_SHARD_DIR, help=f"shard directory (default: {BMF_SHARD_DIR})")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        counts = build_bmf_index(args.csv, args.out_dir, args.workers)
+        for state, count in counts.items():
+            print(f"[IRS BMF] Indexed {count} ZIPs into {shard_path(state, args.out_dir)}")
+    elif args.command == "refresh":
+        for state, delta in refresh_bmf_index(args.csv, args.dir).items():
+            print(
+                f"[IRS BMF] Refreshed {shard_path(state, args.dir)}: "
+                f"{delta['added']} added, {delta['removed']} removed, "
+                f"{delta['changed']} changed ({delta['status_changed']} STATUS changes)"
+            )
+
+
+if __name__ == "__main__":
+    main()
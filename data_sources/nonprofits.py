@@ -1,6 +1,8 @@
-import requests
+import os
 
-BASE_URL = "https://projects.propublica.org/nonprofits/api/v2"
+from .http_client import get_json
+
+BASE_URL = os.environ.get("PROPUBLICA_API_BASE", "https://projects.propublica.org") + "/nonprofits/api/v2"
 
 def search_nonprofits_by_city(city: str, state: str, limit: int = 20) -> list[dict]:
     """
@@ -17,9 +19,7 @@ def search_nonprofits_by_city(city: str, state: str, limit: int = 20) -> list[di
         "q": f"{city} {state}",
     }
 
-    resp = requests.get(url, params=params)
-    resp.raise_for_status()
-    data = resp.json()
+    data = get_json(url, params=params) or {}
 
     orgs = data.get("organizations", []) or []
 
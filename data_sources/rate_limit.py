@@ -0,0 +1,223 @@
+"""
+Outbound admission control for quota-limited upstreams (the Census API).
+
+Every get_json call to a limited host takes a token from that host's bucket.
+When the bucket is empty, callers wait in a bounded queue ordered by priority
+class (interactive requests before batch jobs before warmup), each for at most
+its class's wait budget. A caller that can't get a token in time, or that
+finds the queue full of higher-priority work, gets RateLimited instead of
+piling more load onto the upstream.
+
+The bucket is per process: with N workers, set each one's rate to
+(your quota) / N.
+"""
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# Priority classes; lower is more important.
+INTERACTIVE = 0
+BATCH = 1
+BACKGROUND = 2
+
+# "host=rate[/burst],..." in requests per second, e.g.
+# "api.census.gov=10/20,geocoding.geo.census.gov=5". Hosts not listed are
+# not limited.
+UPSTREAM_RATE_LIMITS = os.environ.get(
+    "UPSTREAM_RATE_LIMITS", "api.census.gov=10/20,geocoding.geo.census.gov=5/10"
+)
+
+# Callers allowed to wait per host; beyond that, new work is shed.
+RATE_LIMIT_MAX_WAITERS = int(os.environ.get("RATE_LIMIT_MAX_WAITERS", "64"))
+
+# Longest each class waits for a token (seconds). Keep these under
+# LEARN_ZIP_STAGE_TIMEOUT, or the stage gives up first.
+RATE_LIMIT_WAIT: Dict[int, float] = {
+    INTERACTIVE: float(os.environ.get("RATE_LIMIT_WAIT_INTERACTIVE", "2")),
+    BATCH: float(os.environ.get("RATE_LIMIT_WAIT_BATCH", "5")),
+    BACKGROUND: float(os.environ.get("RATE_LIMIT_WAIT_BACKGROUND", "10")),
+}
+
+_priority: ContextVar[int] = ContextVar("upstream_priority", default=INTERACTIVE)
+
+
+class RateLimited(Exception):
+    """An outbound call was shed by admission control or throttled upstream."""
+
+    def __init__(self, host: str, retry_after: float, message: str = "rate limited"):
+        super().__init__(f"{host}: {message}")
+        self.host = host
+        self.retry_after = retry_after
+
+
+@contextmanager
+def priority(level: int):
+    """
+    Run a block's outbound calls at the given priority class.
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+class _Waiter:
+    __slots__ = ("rejected",)
+
+    def __init__(self):
+        self.rejected = False
+
+
+class TokenBucket:
+    """
+    Token bucket with a priority-ordered wait queue. Only the head of the
+    queue may take a token, so a stream of low-priority callers can't starve
+    a high-priority one that arrives later.
+    """
+
+    def __init__(self, host: str, rate: float, burst: float, max_waiters: int):
+        self.host = host
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_waiters = max_waiters
+
+        self._cond = threading.Condition()
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._waiters: List[Tuple[int, int, _Waiter]] = []  # heap of (priority, seq, waiter)
+        self._seq = itertools.count()
+
+        self.admitted = 0
+        self.waited = 0
+        self.shed = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _retry_after(self) -> float:
+        return max(1.0, math.ceil((len(self._waiters) + 1) / self.rate))
+
+    def _shed(self, reason: str) -> RateLimited:
+        self.shed += 1
+        return RateLimited(self.host, self._retry_after(), reason)
+
+    def acquire(self, level: int, max_wait: float) -> None:
+        """
+        Take one token, waiting up to max_wait seconds. Raises RateLimited.
+        """
+        deadline = time.monotonic() + max_wait
+        with self._cond:
+            self._refill()
+            if not self._waiters and self._tokens >= 1.0:
+                self._tokens -= 1.0
+                self.admitted += 1
+                return
+
+            if len(self._waiters) >= self.max_waiters:
+                worst = max(self._waiters)
+                if worst[0] <= level:
+                    raise self._shed("wait queue full")
+                # Make room by bumping the least important waiter
+                self._waiters.remove(worst)
+                heapq.heapify(self._waiters)
+                worst[2].rejected = True
+                self._cond.notify_all()
+
+            waiter = _Waiter()
+            entry = (level, next(self._seq), waiter)
+            heapq.heappush(self._waiters, entry)
+            self.waited += 1
+
+            while True:
+                if waiter.rejected:
+                    raise self._shed("displaced by higher-priority work")
+
+                pause = deadline - time.monotonic()
+                if self._waiters[0] is entry:
+                    self._refill()
+                    if self._tokens >= 1.0:
+                        self._tokens -= 1.0
+                        heapq.heappop(self._waiters)
+                        self.admitted += 1
+                        self._cond.notify_all()
+                        return
+                    pause = min(pause, (1.0 - self._tokens) / self.rate)
+
+                if deadline - time.monotonic() <= 0:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                    raise self._shed("no capacity before deadline")
+
+                self._cond.wait(max(pause, 0.001))
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "admitted": self.admitted,
+                "waited": self.waited,
+                "shed": self.shed,
+                "queued": len(self._waiters),
+            }
+
+
+def _parse_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    limits: Dict[str, Tuple[float, float]] = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        host, _, value = item.strip().partition("=")
+        rate, _, burst = value.partition("/")
+        limits[host.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+
+_buckets: Dict[str, TokenBucket] = {
+    host: TokenBucket(host, rate, burst, RATE_LIMIT_MAX_WAITERS)
+    for host, (rate, burst) in _parse_limits(UPSTREAM_RATE_LIMITS).items()
+    if rate > 0
+}
+
+
+def acquire(host: str, max_wait: Optional[float] = None) -> None:
+    """
+    Admit one outbound call to host at the caller's priority class, waiting
+    at most the class's budget (or max_wait, if shorter). No-op for hosts
+    without a limit; raises RateLimited when shed.
+    """
+    bucket = _buckets.get(host)
+    if bucket is None:
+        return
+    level = current_priority()
+    wait = RATE_LIMIT_WAIT.get(level, RATE_LIMIT_WAIT[INTERACTIVE])
+    if max_wait is not None:
+        wait = max(0.0, min(wait, max_wait))
+    bucket.acquire(level, wait)
+
+
+def rate_limit_stats() -> Dict[str, int]:
+    """
+    Totals across limited hosts: admitted, waited, shed, queued.
+    """
+    totals = {"admitted": 0, "waited": 0, "shed": 0, "queued": 0}
+    for bucket in _buckets.values():
+        for key, value in bucket.stats().items():
+            totals[key] += value
+    return totals
+
+
+def retry_after_header(seconds: Optional[float]) -> str:
+    return str(max(1, int(math.ceil(seconds or 1))))
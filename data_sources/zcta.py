@@ -0,0 +1,214 @@
+"""
+Valid-ZCTA bitmap: one bit per possible 5-digit ZIP (100,000 bits, 12.5 KB),
+set for every ZIP we can serve. The server checks it before doing any work, so
+a ZIP that can't exist costs a byte lookup instead of a Census call, a geocoder
+call and a BMF read.
+
+Build it from the ACS snapshot and the ZIP gazetteer (plus, optionally, a
+Census ZCTA list):
+
+    python -m data_sources.zcta build
+    python -m data_sources.zcta build --from-file 2020_Gaz_zcta_national.txt
+
+Until the file exists every well-formed ZIP passes, as before. Rebuild it
+after a new snapshot or gazetteer, or ZIPs they added will be turned away;
+running servers pick up the new file within ZCTA_RELOAD_INTERVAL seconds.
+
+The build refuses to write a bitmap that would turn away nearly every ZIP
+(fewer than ZCTA_MIN_ZIPS ZIPs, e.g. from a sample gazetteer), unless forced.
+"""
+import argparse
+import csv
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from .census import ACS_VINTAGE, load_census_snapshot
+from .files import file_stat
+from .gazetteer import get_gazetteer
+
+ZCTA_BITMAP_PATH = os.environ.get("ZCTA_BITMAP_PATH", "data_sources/valid_zctas.bin")
+
+# Seconds between checks of the bitmap file for a rebuild.
+ZCTA_RELOAD_INTERVAL = float(os.environ.get("ZCTA_RELOAD_INTERVAL", "5"))
+
+# Smallest bitmap build_zcta_bitmap writes without force (the US has ~33,000 ZCTAs).
+ZCTA_MIN_ZIPS = int(os.environ.get("ZCTA_MIN_ZIPS", "1000"))
+
+ZIP_SPACE = 100000
+
+_MAGIC = b"ZCTABMP1"
+
+
+class ZctaBitmap:
+    """
+    Membership test for 5-digit ZIPs, bit i set when f"{i:05d}" is known.
+    """
+
+    def __init__(self, bits: bytes):
+        if len(bits) != ZIP_SPACE // 8:
+            raise ValueError(f"expected {ZIP_SPACE // 8} bitmap bytes, got {len(bits)}")
+        self.bits = bytes(bits)
+        self.count = sum(bin(b).count("1") for b in self.bits)
+
+    @classmethod
+    def from_zips(cls, zips: Iterable[int]) -> "ZctaBitmap":
+        bits = bytearray(ZIP_SPACE // 8)
+        for z in zips:
+            if 0 <= z < ZIP_SPACE:
+                bits[z >> 3] |= 1 << (z & 7)
+        return cls(bytes(bits))
+
+    def __contains__(self, zip_code: str) -> bool:
+        z = int(zip_code)
+        return bool(self.bits[z >> 3] & (1 << (z & 7)))
+
+    def __len__(self) -> int:
+        return self.count
+
+
+_load_lock = threading.Lock()
+_bitmap = None  # type: Optional[ZctaBitmap]
+_bitmap_stat = None  # (inode, mtime) of the loaded file
+_checked_at = None  # type: Optional[float]
+_stats_lock = threading.Lock()
+_stats = {"rejected": 0}
+
+
+def load_zcta_bitmap() -> Optional[ZctaBitmap]:
+    """
+    The current bitmap, or None if it hasn't been built. The file is re-read
+    when a rebuild replaces it (checked every ZCTA_RELOAD_INTERVAL seconds).
+    """
+    global _bitmap, _bitmap_stat, _checked_at
+
+    now = time.monotonic()
+    checked_at = _checked_at
+    if checked_at is not None and now - checked_at < ZCTA_RELOAD_INTERVAL:
+        return _bitmap
+
+    with _load_lock:
+        if _checked_at is not None and now - _checked_at < ZCTA_RELOAD_INTERVAL:
+            return _bitmap
+
+        stat = file_stat(ZCTA_BITMAP_PATH)
+        if _checked_at is None or stat != _bitmap_stat:
+            bitmap = None
+            if stat is not None:
+                try:
+                    with open(ZCTA_BITMAP_PATH, "rb") as f:
+                        data = f.read()
+                    if data[:len(_MAGIC)] != _MAGIC:
+                        raise ValueError("bad magic")
+                    bitmap = ZctaBitmap(data[len(_MAGIC):])
+                except FileNotFoundError:
+                    stat = None
+                except (OSError, ValueError) as e:
+                    print(f"[zcta] Ignoring unreadable {ZCTA_BITMAP_PATH}: {e}")
+            if _checked_at is not None:
+                print(f"[zcta] Reloaded {ZCTA_BITMAP_PATH} ({len(bitmap) if bitmap else 0} ZIPs)")
+            _bitmap, _bitmap_stat = bitmap, stat
+
+        _checked_at = now
+        return _bitmap
+
+
+def is_known_zip(zip_code: str) -> bool:
+    """
+    False only if the bitmap has been built and zip_code (5 digits) isn't in it.
+    """
+    bitmap = load_zcta_bitmap()
+    if bitmap is None or zip_code in bitmap:
+        return True
+    with _stats_lock:
+        _stats["rejected"] += 1
+    return False
+
+
+def zcta_stats() -> Dict[str, int]:
+    bitmap = load_zcta_bitmap()
+    return {
+        "loaded": int(bitmap is not None),
+        "zctas": len(bitmap) if bitmap is not None else 0,
+        "rejected": _stats["rejected"],
+    }
+
+
+def _read_zcta_list(path: str) -> List[int]:
+    """
+    ZIPs from a Census ZCTA gazetteer file (GEOID column, tab-separated) or a
+    plain list with one ZIP per line.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        rows = list(csv.reader(f, delimiter="\t"))
+
+    col = 0
+    if rows and rows[0] and not rows[0][0].strip().isdigit():
+        header = [h.strip().upper() for h in rows.pop(0)]
+        col = header.index("GEOID") if "GEOID" in header else 0
+
+    return [
+        int(row[col].strip())
+        for row in rows
+        if len(row) > col and len(row[col].strip()) == 5 and row[col].strip().isdigit()
+    ]
+
+
+def build_zcta_bitmap(
+    out_path: str = ZCTA_BITMAP_PATH,
+    source_file: Optional[str] = None,
+    vintage: str = ACS_VINTAGE,
+    force: bool = False,
+) -> int:
+    """
+    Write the bitmap from the ACS snapshot, the gazetteer and source_file.
+
+    Raises ValueError (and leaves any existing file alone) when the result
+    has fewer than ZCTA_MIN_ZIPS, unless force is set. Returns the number of
+    ZIPs set.
+    """
+    zips = set(get_gazetteer().zips)
+
+    snapshot = load_census_snapshot(vintage)
+    if snapshot:
+        zips.update(int(z) for z in snapshot if z.isdigit())
+
+    if source_file:
+        zips.update(_read_zcta_list(source_file))
+
+    if not force and len(zips) < ZCTA_MIN_ZIPS:
+        raise ValueError(
+            f"only {len(zips)} ZIPs found (expected at least {ZCTA_MIN_ZIPS}); "
+            "pass --force to write it anyway"
+        )
+    if not zips:
+        raise ValueError("no ZIPs found")
+
+    bitmap = ZctaBitmap.from_zips(zips)
+    tmp_path = f"{out_path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(_MAGIC + bitmap.bits)
+    os.replace(tmp_path, out_path)
+    return len(bitmap)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Valid-ZCTA bitmap tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Build the bitmap from the ACS snapshot and gazetteer")
+    build.add_argument("--from-file", help="also include ZIPs from a Census ZCTA list / gazetteer file")
+    build.add_argument("--vintage", default=ACS_VINTAGE, help=f"ACS snapshot vintage (default: {ACS_VINTAGE})")
+    build.add_argument("--out", default=ZCTA_BITMAP_PATH, help=f"output path (default: {ZCTA_BITMAP_PATH})")
+    build.add_argument("--force", action="store_true", help="write even from few or unreliable sources")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        count = build_zcta_bitmap(args.out, args.from_file, args.vintage, args.force)
+        print(f"[zcta] Wrote {count} ZIPs to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
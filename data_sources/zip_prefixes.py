@@ -0,0 +1,47 @@
+from typing import List, Optional, Tuple
+
+# USPS ZIP3 prefix ranges -> state (inclusive). Military (AA/AE/AP) and a
+# few unassigned prefixes are left out on purpose.
+ZIP3_RANGES: List[Tuple[int, int, str]] = [
+    (5, 5, "NY"), (6, 7, "PR"), (8, 8, "VI"), (9, 9, "PR"),
+    (10, 27, "MA"), (28, 29, "RI"), (30, 38, "NH"), (39, 49, "ME"),
+    (50, 54, "VT"), (55, 55, "MA"), (56, 59, "VT"), (60, 69, "CT"),
+    (70, 89, "NJ"), (100, 149, "NY"), (150, 196, "PA"), (197, 199, "DE"),
+    (200, 200, "DC"), (201, 201, "VA"), (202, 205, "DC"), (206, 219, "MD"),
+    (220, 246, "VA"), (247, 268, "WV"), (270, 289, "NC"), (290, 299, "SC"),
+    (300, 319, "GA"), (320, 339, "FL"), (341, 342, "FL"), (344, 344, "FL"),
+    (346, 347, "FL"), (349, 349, "FL"), (350, 369, "AL"), (370, 385, "TN"),
+    (386, 397, "MS"), (398, 399, "GA"), (400, 427, "KY"), (430, 459, "OH"),
+    (460, 479, "IN"), (480, 499, "MI"), (500, 528, "IA"), (530, 549, "WI"),
+    (550, 567, "MN"), (569, 569, "DC"), (570, 577, "SD"), (580, 588, "ND"),
+    (590, 599, "MT"), (600, 629, "IL"), (630, 658, "MO"), (660, 679, "KS"),
+    (680, 693, "NE"), (700, 714, "LA"), (716, 729, "AR"), (730, 732, "OK"),
+    (733, 733, "TX"), (734, 749, "OK"), (750, 799, "TX"), (800, 816, "CO"),
+    (820, 831, "WY"), (832, 838, "ID"), (840, 847, "UT"), (850, 865, "AZ"),
+    (870, 884, "NM"), (885, 885, "TX"), (889, 898, "NV"), (900, 961, "CA"),
+    (967, 968, "HI"), (969, 969, "GU"), (970, 979, "OR"), (980, 994, "WA"),
+    (995, 999, "AK"),
+]
+
+# Flat 1000-slot lookup table built once at import: index = ZIP3.
+_STATE_BY_ZIP3: List[Optional[str]] = [None] * 1000
+for _lo, _hi, _state in ZIP3_RANGES:
+    for _prefix in range(_lo, _hi + 1):
+        _STATE_BY_ZIP3[_prefix] = _state
+
+
+def state_for_zip(zip_code: str) -> Optional[str]:
+    """
+    Route a ZIP to its state from the first three digits, or None if the
+    prefix isn't assigned to a state.
+    """
+    if len(zip_code) < 3 or not zip_code[:3].isdigit():
+        return None
+    return _STATE_BY_ZIP3[int(zip_code[:3])]
+
+
+def zip3_prefixes(state: str) -> List[str]:
+    """
+    All ZIP3 prefixes ("900", "901", ...) that route to state.
+    """
+    return [f"{p:03d}" for p, s in enumerate(_STATE_BY_ZIP3) if s == state]
@@ -1,43 +1,32 @@
+import os
 from typing import Optional, Tuple
 
-# Minimal ZIP → (city, state) mapping to start.
-# You can expand this over time or swap it for a more complete dataset.
-ZIP_CITY_STATE = {
-    "92008": ("Carlsbad", "CA"),
-    "90210": ("Beverly Hills", "CA"),
-    # Add more known ZIPs here as needed
-}
+from .census import get_city_state_from_zip
+from .gazetteer import lookup_zip
+
+# Ask the Census geocoder for ZIPs the bundled gazetteer doesn't have. The
+# gazetteer in the repo covers every US ZIP, so this is off unless you've
+# swapped in a partial one.
+GEOCODER_FALLBACK = os.environ.get("GEOCODER_FALLBACK", "0").lower() not in ("0", "false", "no")
 
 
 def lookup_city_state_locally(zip_code: str) -> Tuple[Optional[str], Optional[str]]:
     """
-    Check our local ZIP -> (city, state) mapping.
+    Check the bundled ZIP gazetteer (data_sources/zip_gazetteer.tsv).
     Returns (city, state) or (None, None) if we don't know this ZIP.
     """
-    return ZIP_CITY_STATE.get(zip_code, (None, None))
-
-
-# ---------------------------------------------------------------------------
-# Optional Census geocoder integration
-# ---------------------------------------------------------------------------
-
-# We try to import a geocode_zip helper from census.py.
-# This is wrapped in a try/except so that zip_utils.py never crashes
-# even if census.py doesn't have it yet or something goes wrong.
-try:
-    from .census import geocode_zip  # type: ignore
-except Exception:  # pragma: no cover - purely defensive
-    geocode_zip = None  # type: ignore
+    entry = lookup_zip(zip_code)
+    if entry is None:
+        return None, None
+    return entry.city or None, entry.state or None
 
 
 def get_city_state(zip_code: str) -> Tuple[Optional[str], Optional[str]]:
     """
     Resolve a ZIP code to (city, state_abbrev).
 
-    Lookup order:
-    1. Local mapping via lookup_city_state_locally
-    2. Census geocoder via census.geocode_zip (if available)
-    3. Fallback: (None, None)
+    This is a local O(log n) lookup in the bundled gazetteer. ZIPs it doesn't
+    have go to the Census geocoder (cached on disk) if GEOCODER_FALLBACK is on.
 
     Parameters
     ----------
@@ -49,34 +38,18 @@ def get_city_state(zip_code: str) -> Tuple[Optional[str], Optional[str]]:
     (city, state_abbrev): tuple[Optional[str], Optional[str]]
         - city: e.g. "Los Angeles"
         - state_abbrev: e.g. "CA"
-        - If lookup fails, returns (None, None).
+        - If neither source knows the ZIP, returns (None, None).
+
+    Raises RateLimited or UpstreamError if the geocoder fallback failed.
     """
     if not zip_code:
         return None, None
 
-    z = zip_code.strip()
-
-    # 1) Local lookup first (keeps your existing behavior)
-    city, state = lookup_city_state_locally(z)
-    if city or state:
-        return city, state
-
-    # 2) Try Census geocoder if available
-    if geocode_zip is not None:
-        try:
-            geo = geocode_zip(z)
-        except Exception:
-            geo = None
-
-        if isinstance(geo, dict):
-            # Expect something like {"city": "Los Angeles", "state": "CA"}
-            city_val = geo.get("city")
-            state_val = geo.get("state")
-            if city_val or state_val:
-                return city_val, state_val
-
-    # 3) Nothing found
-    return None, None
+    zip_code = zip_code.strip()
+    city, state = lookup_city_state_locally(zip_code)
+    if city is None and state is None and GEOCODER_FALLBACK:
+        return get_city_state_from_zip(zip_code)
+    return city, state
 
 
 def get_area_label(zip_code: str) -> str:
@@ -0,0 +1,16 @@
+"""
+gunicorn settings picked up automatically from the working directory
+(gunicorn server:app).
+
+Warmup (logic/warmup.py) starts in each worker as soon as it has loaded the
+app, so a worker is warm before, not after, its first requests, and one that
+gets no traffic warms all the same. Starting it here rather than at import
+keeps it out of the master under --preload, whose threads don't survive the
+fork.
+"""
+
+
+def post_worker_init(worker):
+    from logic.warmup import start_warmup
+
+    start_warmup()
@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class ResultCache:
+    """
+    Bounded in-process cache with LRU eviction, a per-entry TTL and
+    stale-while-revalidate.
+
+    - Fresh entries (younger than ttl) are returned as-is.
+    - Stale entries (older than ttl, younger than ttl + stale_ttl) are returned
+      immediately while a background thread recomputes them.
+    - Anything older is treated as a miss.
+
+    Cached values are shared between callers, so they must not be mutated.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, stale_ttl: float = 0.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # type: OrderedDict[Hashable, tuple]
+        self._refreshing = set()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refresh_errors = 0
+
+    def get_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Any],
+        should_cache: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        Return the cached value for key, computing (and caching) it on a miss.
+        should_cache lets the caller keep e.g. empty/error results out of the cache.
+        """
+        if self.max_entries <= 0:
+            return compute()
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                age = now - stored_at
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        threading.Thread(
+                            target=self._refresh,
+                            args=(key, compute, should_cache),
+                            daemon=True,
+                        ).start()
+                    return value
+                del self._entries[key]
+            self.misses += 1
+
+        value = compute()
+        if should_cache is None or should_cache(value):
+            self._store(key, value)
+        return value
+
+    def peek(self, key: Hashable) -> Any:
+        """
+        The cached value for key (fresh or stale), or None. Doesn't refresh,
+        store or change the entry's LRU position, so bulk readers can use the
+        cache without pushing out what live traffic keeps in it.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry[1] >= self.ttl + self.stale_ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def _refresh(self, key: Hashable, compute: Callable[[], Any], should_cache) -> None:
+        try:
+            value = compute()
+            if should_cache is None or should_cache(value):
+                self._store(key, value)
+        except Exception as e:
+            # Keep serving the stale value; the next stale hit will try again
+            print(f"[cache] Background refresh failed for {key!r}: {e}")
+            with self._lock:
+                self.refresh_errors += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "refresh_errors": self.refresh_errors,
+            }
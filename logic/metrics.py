@@ -0,0 +1,181 @@
+"""
+Lightweight per-stage latency instrumentation.
+
+  - stage(name) times a block, adds it to the current request's timings
+    (emitted as a Server-Timing header) and to a per-stage histogram.
+  - render_prometheus() renders the histograms, upstream HTTP counters and any
+    registered stats (e.g. the result cache) in Prometheus text format.
+
+Recording is a perf_counter pair, a bisect and a locked increment, cheap
+enough to stay on permanently.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from data_sources.http_client import upstream_stats
+
+# Histogram bucket upper bounds, in seconds.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, seconds: float) -> None:
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += seconds
+            self._count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self._counts), self._sum, self._count
+
+
+_registry_lock = threading.Lock()
+_stage_histograms: Dict[str, Histogram] = {}
+_request_histograms: Dict[Tuple[str, str], Histogram] = {}
+_stats_providers: List[Tuple[str, Callable[[], Dict], Tuple[str, ...]]] = []
+
+
+def _histogram(registry: Dict, key) -> Histogram:
+    hist = registry.get(key)
+    if hist is None:
+        with _registry_lock:
+            hist = registry.setdefault(key, Histogram())
+    return hist
+
+
+# ---------------------------------------------------------------------------
+# Recording
+# ---------------------------------------------------------------------------
+
+def start_request():
+    """
+    Begin collecting stage timings for the current request.
+    Returns a token for end_request.
+    """
+    return _request_timings.set({})
+
+
+def end_request(token) -> None:
+    _request_timings.reset(token)
+
+
+def request_timings() -> Dict[str, float]:
+    """
+    {stage: milliseconds} recorded so far for the current request.
+    """
+    return _request_timings.get() or {}
+
+
+def record_stage(name: str, seconds: float) -> None:
+    _histogram(_stage_histograms, name).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds * 1000.0
+
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def record_request(endpoint: str, status: int, seconds: float) -> None:
+    _histogram(_request_histograms, (endpoint, str(status))).observe(seconds)
+
+
+def register_stats(prefix: str, provider: Callable[[], Dict], gauges: Iterable[str] = ()) -> None:
+    """
+    Expose provider()'s numeric values on /metrics as taxbreaks_<prefix>_<key>.
+    Keys listed in gauges are gauges; everything else is a counter.
+    """
+    _stats_providers.append((prefix, provider, tuple(gauges)))
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in timings.items())
+
+
+# ---------------------------------------------------------------------------
+# Prometheus exposition
+# ---------------------------------------------------------------------------
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels.items()
+    )
+    return "{" + inner + "}"
+
+
+def _render_histogram(lines: List[str], name: str, labels: Dict[str, str], hist: Histogram) -> None:
+    counts, total, count = hist.snapshot()
+    cumulative = 0
+    for bound, bucket_count in zip(hist.buckets + (float("inf"),), counts):
+        cumulative += bucket_count
+        le = "+Inf" if bound == float("inf") else repr(bound)
+        lines.append(f"{name}_bucket{_labels(dict(labels, le=le))} {cumulative}")
+    lines.append(f"{name}_sum{_labels(labels)} {total}")
+    lines.append(f"{name}_count{_labels(labels)} {count}")
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+
+    lines.append("# HELP taxbreaks_stage_duration_seconds Time spent in each pipeline stage.")
+    lines.append("# TYPE taxbreaks_stage_duration_seconds histogram")
+    for name, hist in sorted(_stage_histograms.items()):
+        _render_histogram(lines, "taxbreaks_stage_duration_seconds", {"stage": name}, hist)
+
+    lines.append("# HELP taxbreaks_request_duration_seconds HTTP request latency by endpoint and status.")
+    lines.append("# TYPE taxbreaks_request_duration_seconds histogram")
+    for (endpoint, status), hist in sorted(_request_histograms.items()):
+        _render_histogram(
+            lines, "taxbreaks_request_duration_seconds", {"endpoint": endpoint, "status": status}, hist
+        )
+
+    upstream = upstream_stats()
+    for counter in ("requests", "errors", "retries", "circuit_open"):
+        name = f"taxbreaks_upstream_{counter}_total"
+        lines.append(f"# HELP {name} Outbound HTTP {counter.replace('_', ' ')} by upstream host.")
+        lines.append(f"# TYPE {name} counter")
+        for host, stats in sorted(upstream.items()):
+            lines.append(f"{name}{_labels({'host': host})} {stats.get(counter, 0)}")
+
+    lines.append("# HELP taxbreaks_upstream_breaker_open Whether the host's circuit breaker is open (1) or not (0).")
+    lines.append("# TYPE taxbreaks_upstream_breaker_open gauge")
+    for host, stats in sorted(upstream.items()):
+        if "breaker" in stats:
+            lines.append(f"taxbreaks_upstream_breaker_open{_labels({'host': host})} {int(stats['breaker'] == 'open')}")
+
+    for prefix, provider, gauges in _stats_providers:
+        for key, value in provider().items():
+            if not isinstance(value, (int, float)):
+                continue
+            if key in gauges:
+                name = f"taxbreaks_{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+            else:
+                name = f"taxbreaks_{prefix}_{key}_total"
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
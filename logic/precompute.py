@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from data_sources.census import load_census_snapshot
+from data_sources.gazetteer import get_gazetteer
+from data_sources.irs_bmf import bmf_zip_codes
+from logic.recommendations import (
+    RESPONSE_VERSION,
+    data_version,
+    generate_tax_breaks,
+    is_degraded,
+    tax_breaks_payload,
+)
+
+# Versioned SQLite artifact holding the serialized /api/tax-breaks response for
+# every known ZIP. Built by `python -m logic.precompute build`.
+ARTIFACT_PATH = os.environ.get("TAX_BREAKS_ARTIFACT", "data_sources/tax_breaks.sqlite")
+
+# California ZIPs are 900xx-961xx.
+CA_ZIP_RANGE = ("90000", "96199")
+
+
+def encode_payload(payload: dict) -> bytes:
+    """
+    Serialize a response body the same way Flask's jsonify does in production
+    (sorted keys, compact separators, trailing newline), so precomputed and
+    live responses are byte-identical.
+    """
+    return (json.dumps(payload, sort_keys=True, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def known_zip_codes(zip_range: Tuple[str, str] = CA_ZIP_RANGE) -> List[str]:
+    """
+    Every ZIP we have any data for (ACS snapshot, BMF shard, gazetteer) in zip_range.
+    """
+    lo, hi = zip_range
+    zips = set(bmf_zip_codes("CA"))
+    zips.update(load_census_snapshot() or {})
+
+    gazetteer = get_gazetteer()
+    zips.update(gazetteer.entry_at(i).zip for i in range(len(gazetteer)))
+
+    return sorted(z for z in zips if lo <= z <= hi)
+
+
+def _artifact_version(zip_code: str) -> str:
+    """
+    What a stored body was built from: the payload shape and the ZIP's data.
+    """
+    return f"{RESPONSE_VERSION}:{data_version(zip_code)}"
+
+
+def _compute(zip_code: str) -> Tuple[str, Optional[bytes], str]:
+    version = _artifact_version(zip_code)
+    try:
+        result = generate_tax_breaks(zip_code)
+    except Exception as e:
+        print(f"[precompute] {zip_code} failed: {e}")
+        return zip_code, None, version
+    if is_degraded(result):
+        # A partial result would be served as complete until the next build
+        print(f"[precompute] {zip_code} degraded ({', '.join(result['profile']['degraded'])}); skipped")
+        return zip_code, None, version
+    payload = tax_breaks_payload(result)
+    return zip_code, None if payload is None else encode_payload(payload), version
+
+
+def build_artifact(
+    out_path: str = ARTIFACT_PATH,
+    zips: Optional[List[str]] = None,
+    workers: Optional[int] = None,
+) -> int:
+    """
+    Run generate_tax_breaks for every known ZIP across worker processes and
+    write the responses to a fresh SQLite artifact, each tagged with the
+    RESPONSE_VERSION and data_version() it was built from. Degraded results
+    are left out like failures.
+    ZIPs with no Census data are left out, so the server falls back to live
+    computation for them. Returns the number of ZIPs stored.
+    """
+    zips = zips if zips is not None else known_zip_codes()
+
+    tmp_path = f"{out_path}.tmp.{os.getpid()}"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    conn.execute(
+        "CREATE TABLE responses (zip TEXT PRIMARY KEY, version TEXT NOT NULL, body BLOB NOT NULL) WITHOUT ROWID"
+    )
+
+    stored = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for zip_code, body, version in pool.map(_compute, zips, chunksize=16):
+            if body is not None:
+                conn.execute(
+                    "INSERT INTO responses (zip, version, body) VALUES (?, ?, ?)",
+                    (zip_code, version, body),
+                )
+                stored += 1
+
+    conn.executemany(
+        "INSERT INTO meta (key, value) VALUES (?, ?)",
+        [("built_at", str(int(time.time()))), ("zip_count", str(stored))],
+    )
+    conn.commit()
+    conn.close()
+    os.replace(tmp_path, out_path)
+
+    return stored
+
+
+# ---------------------------------------------------------------------------
+# Serving from the artifact
+# ---------------------------------------------------------------------------
+
+_local = threading.local()
+
+
+def _connection() -> Optional[sqlite3.Connection]:
+    """
+    One read-only connection per thread, reopened when the artifact file is replaced.
+    Returns None if there is no artifact.
+    """
+    try:
+        mtime = os.stat(ARTIFACT_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    cached = getattr(_local, "conn", None)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    if cached is not None:
+        cached[1].close()
+
+    conn = sqlite3.connect(f"file:{ARTIFACT_PATH}?mode=ro", uri=True)
+    _local.conn = (mtime, conn)
+    return conn
+
+
+def lookup_precomputed(zip_code: str) -> Optional[bytes]:
+    """
+    Serialized response body for zip_code, or None when the artifact is
+    missing, doesn't cover this ZIP, or was built from older data or code.
+    """
+    try:
+        conn = _connection()
+        if conn is None:
+            return None
+        row = conn.execute("SELECT version, body FROM responses WHERE zip = ?", (zip_code,)).fetchone()
+    except sqlite3.Error as e:
+        print(f"[precompute] Error reading {ARTIFACT_PATH}: {e}")
+        return None
+
+    if row is None or row[0] != _artifact_version(zip_code):
+        return None
+    return row[1]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Precompute /api/tax-breaks responses")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Materialize responses for every known CA ZIP")
+    build.add_argument("--out", default=ARTIFACT_PATH, help=f"artifact path (default: {ARTIFACT_PATH})")
+    build.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    build.add_argument("zips", nargs="*", help="only these ZIPs (default: every known CA ZIP)")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        started = time.monotonic()
+        count = build_artifact(args.out, args.zips or None, args.workers)
+        print(f"[precompute] Stored {count} ZIPs in {args.out} in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
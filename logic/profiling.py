@@ -1,8 +1,39 @@
-from typing import Dict, List, Optional, Tuple
+import contextvars
+import os
+import time
+from collections import Counter
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+from data_sources.categories import ANIMAL, EDUCATION, FAITH, PHILANTHROPY, org_categories
 from data_sources.census import get_census_by_zip
+from data_sources.gazetteer import zips_within_radius
+from data_sources.http_client import UpstreamError, call_deadline
 from data_sources.irs_bmf import load_bmf_rows
+from data_sources.rate_limit import INTERACTIVE, RateLimited, current_priority
 from data_sources.zip_utils import get_city_state
+from logic.metrics import stage
+
+# Shared pool for the independent data-source stages of learn_zip.
+# Bounded so a burst of requests can't spawn unbounded upstream calls.
+_STAGE_POOL = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("LEARN_ZIP_WORKERS", "16")),
+    thread_name_prefix="learn_zip",
+)
+
+# Stages of batch and warmup builds run here instead, so they can never hold
+# the workers interactive requests need to meet STAGE_TIMEOUT. Each build runs
+# three stages; keep this at 3x the server's BATCH_WORKERS.
+_BULK_STAGE_POOL = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("LEARN_ZIP_BULK_WORKERS", "12")),
+    thread_name_prefix="learn_zip_bulk",
+)
+
+# Seconds each stage may take before learn_zip gives up on it and uses empty data.
+# Upstream calls inside a stage are cut off at the same deadline, so a stage
+# that misses it frees its pool worker instead of running on unobserved.
+STAGE_TIMEOUT = float(os.environ.get("LEARN_ZIP_STAGE_TIMEOUT", "12"))
 
 
 def classify_psychographics(profile: Dict) -> List[str]:
@@ -61,30 +92,21 @@ def classify_psychographics(profile: Dict) -> List[str]:
     # -----------------------------
     # NONPROFIT NAME TAGS
     # -----------------------------
-    names = " ".join([(n.get("name") or "") for n in nonprofits]).lower()
-
-    faith_terms = [
-        "church",
-        "temple",
-        "synagogue",
-        "ministries",
-        "mosque",
-        "catholic",
-        "lutheran",
-        "baptist",
-    ]
-    if any(t in names for t in faith_terms):
+    # Category bits were tagged once per org at ingest; OR them together
+    present = 0
+    for org in nonprofits:
+        present |= org_categories(org)
+
+    if present & FAITH:
         tags.append("faith_community_present")
 
-    if "foundation" in names:
+    if present & PHILANTHROPY:
         tags.append("philanthropy_culture")
 
-    education_terms = ["school", "academy", "education", "pta"]
-    if any(t in names for t in education_terms):
+    if present & EDUCATION:
         tags.append("education_present")
 
-    animal_terms = ["animal", "humane", "rescue", "spca"]
-    if any(t in names for t in animal_terms):
+    if present & ANIMAL:
         tags.append("animal_welfare_present")
 
     return tags
@@ -94,7 +116,7 @@ def _fallback_city_state_from_nonprofits(
     nonprofits: List[Dict]
 ) -> Tuple[Optional[str], Optional[str]]:
     """
-    If Census/geocoder doesn't give us a city/state, try to infer it from the
+    If the gazetteer doesn't give us a city/state, try to infer it from the
     nonprofits loaded from the IRS BMF CSV.
 
     We look for 'city' and 'state' keys on the nonprofit dicts.
@@ -102,22 +124,52 @@ def _fallback_city_state_from_nonprofits(
     if not nonprofits:
         return None, None
 
-    cities = set(
+    # Most common value wins; ties go to whichever appears first, so the
+    # result doesn't depend on set ordering.
+    cities = Counter(
         (n.get("city") or "").strip()
         for n in nonprofits
         if n.get("city")
     )
-    states = set(
+    states = Counter(
         (n.get("state") or "").strip()
         for n in nonprofits
         if n.get("state")
     )
 
-    city = next(iter(cities)) if cities else None
-    state = next(iter(states)) if states else None
+    city = cities.most_common(1)[0][0] if cities else None
+    state = states.most_common(1)[0][0] if states else None
     return city, state
 
 
+def load_nearby_nonprofits(zip_code: str, radius_miles: float) -> List[Dict]:
+    """
+    BMF nonprofits in every ZIP whose centroid is within radius_miles of
+    zip_code, nearest ZIP first. Each org gets a "distance_miles" (ZIP centroid
+    to ZIP centroid). ZIPs the gazetteer can't place fall back to the exact ZIP.
+    """
+    neighbors = zips_within_radius(zip_code, radius_miles) or [(zip_code, 0.0)]
+
+    nonprofits: List[Dict] = []
+    for neighbor, distance in neighbors:
+        for org in load_bmf_rows(neighbor):
+            org["distance_miles"] = round(distance, 1)
+            nonprofits.append(org)
+    return nonprofits
+
+
+def _city_state_or_none(zip_code: str) -> Optional[Tuple[Optional[str], Optional[str]]]:
+    """
+    get_city_state, or None if its geocoder fallback failed upstream (as
+    opposed to not knowing the ZIP).
+    """
+    try:
+        return get_city_state(zip_code)
+    except (RateLimited, UpstreamError) as e:
+        print(f"[learn_zip] City lookup for {zip_code} failed upstream: {e}")
+        return None
+
+
 def _build_area_label(city: Optional[str], state: Optional[str]) -> str:
     """
     Turn city/state into a human-friendly label.
@@ -129,31 +181,87 @@ def _build_area_label(city: Optional[str], state: Optional[str]) -> str:
     return "Unknown area"
 
 
-def learn_zip(zip_code: str) -> Dict:
+def _await_stage(name: str, future, deadline: float, default: Any, missed: List[str]) -> Any:
+    """
+    Wait for a stage until the shared deadline. A stage that misses it degrades
+    to default (and is cancelled if it never got a worker) and is added to
+    missed; errors raised by the stage itself propagate as before.
+    """
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeoutError:
+        future.cancel()
+        missed.append(name)
+        print(f"[learn_zip] Stage {name} missed its {STAGE_TIMEOUT:g}s deadline; using empty data.")
+        return default
+
+
+def _timed_stage(name: str, fn: Callable, zip_code: str, deadline: float) -> Any:
+    with stage(name), call_deadline(deadline):
+        return fn(zip_code)
+
+
+def _run_stages(
+    zip_code: str, stages: Dict[str, Tuple[Callable, Any]]
+) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Run {name: (fn, default)} concurrently with fn(zip_code), on the stage
+    pool of the caller's priority class.
+    Each stage runs in a copy of the caller's context so its timing lands on
+    the caller's request, and its upstream calls end by the shared deadline.
+    Returns the results and the names of stages that fell back to default.
+    """
+    pool = _STAGE_POOL if current_priority() == INTERACTIVE else _BULK_STAGE_POOL
+    deadline = time.monotonic() + STAGE_TIMEOUT
+    futures = {
+        name: pool.submit(contextvars.copy_context().run, _timed_stage, name, fn, zip_code, deadline)
+        for name, (fn, _default) in stages.items()
+    }
+    missed: List[str] = []
+    results = {
+        name: _await_stage(name, futures[name], deadline, default, missed)
+        for name, (_fn, default) in stages.items()
+    }
+    return results, missed
+
+
+def learn_zip(zip_code: str, radius_miles: Optional[float] = None) -> Dict:
     """
     Build a ZIP profile.
 
     FLOW:
       ZIP → Census stats
-      ZIP → (city, state) via Census/geocoder
-      ZIP → IRS BMF nonprofits (exact ZIP)
+      ZIP → (city, state) via the bundled ZIP gazetteer
+      ZIP → IRS BMF nonprofits (exact ZIP, or every ZIP within radius_miles)
       City/State fallback from nonprofit CSV if needed
       → Psychographic tags (from census + nonprofits)
-    """
-    # -----------------------------
-    # CENSUS DATA
-    # -----------------------------
-    census_info = get_census_by_zip(zip_code)
 
+    The first three stages don't depend on each other, so they run
+    concurrently; each one that misses STAGE_TIMEOUT falls back to empty data
+    and is listed in the profile's "degraded", as is a city lookup whose
+    geocoder call failed.
+    """
     # -----------------------------
-    # CITY / STATE (PRIMARY: CENSUS/GEOCODER)
+    # CENSUS DATA / CITY, STATE (PRIMARY: ZIP GAZETTEER) / IRS NONPROFITS BY ZIP
     # -----------------------------
-    city, state = get_city_state(zip_code)
+    if radius_miles:
+        load_nonprofits = partial(load_nearby_nonprofits, radius_miles=radius_miles)
+    else:
+        load_nonprofits = load_bmf_rows
 
-    # -----------------------------
-    # IRS NONPROFIT LOOKUP BY ZIP
-    # -----------------------------
-    nonprofits = load_bmf_rows(zip_code)
+    stages, degraded = _run_stages(zip_code, {
+        "census": (get_census_by_zip, {}),
+        "city_state": (_city_state_or_none, (None, None)),
+        "nonprofits": (load_nonprofits, []),
+    })
+    census_info = stages["census"]
+    city_state = stages["city_state"]
+    if city_state is None:
+        # A failed geocoder call isn't "unknown area": degrade, don't cache
+        degraded.append("city_state")
+        city_state = (None, None)
+    city, state = city_state
+    nonprofits = stages["nonprofits"]
 
     # -----------------------------
     # CITY / STATE FALLBACK FROM NONPROFITS
@@ -178,9 +286,13 @@ def learn_zip(zip_code: str) -> Dict:
         "area_label": area_label,
         "census": census_info,
         "nonprofits": nonprofits,
+        # Stages that missed the deadline: the profile is partial, so it
+        # mustn't be cached or validated like a complete one
+        "degraded": degraded,
     }
 
     # Psychographics derived from census + nonprofits
-    base["psychographics"] = classify_psychographics(base)
+    with stage("psychographics"):
+        base["psychographics"] = classify_psychographics(base)
 
     return base
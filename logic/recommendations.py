@@ -1,31 +1,138 @@
-from typing import List, Dict, Optional
+import os
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
+
+from data_sources.categories import ANIMAL, EDUCATION, ENVIRONMENT, FAITH, SCHOOL_SUPPORT
+from data_sources.census import ACS_VINTAGE
+from data_sources.disk_cache import upstream_cache_stats
+from data_sources.gazetteer import zips_within_radius
+from data_sources.irs_bmf import bmf_data_version, bmf_store_stats
+from data_sources.rate_limit import current_priority, priority, rate_limit_stats
+from data_sources.zip_prefixes import state_for_zip
+from logic.cache import ResultCache
+from logic.metrics import register_stats, stage
 from logic.profiling import learn_zip
+from logic.scoring import top_nonprofits
+from logic.singleflight import SingleFlight
+
+# Version of the tax_breaks_payload shape. Bump it in any change to what the
+# payload contains (fields, ranking, filtering), so ETags and precomputed
+# bodies from the old code stop matching.
+RESPONSE_VERSION = "3"
+
+# Org fields used internally (ranking) that the response leaves out.
+INTERNAL_ORG_FIELDS = ("category_mask",)
+
+# Result cache for generate_tax_breaks. Set TAX_BREAKS_CACHE_SIZE=0 to disable.
+RESULT_CACHE = ResultCache(
+    max_entries=int(os.environ.get("TAX_BREAKS_CACHE_SIZE", "2048")),
+    ttl=float(os.environ.get("TAX_BREAKS_CACHE_TTL", "3600")),
+    stale_ttl=float(os.environ.get("TAX_BREAKS_CACHE_STALE_TTL", "86400")),
+)
+register_stats("result_cache", RESULT_CACHE.stats, gauges=("size", "max_entries"))
+# Concurrent builds of the same (zip, data version) share one computation.
+IN_FLIGHT = SingleFlight()
+
+register_stats("single_flight", IN_FLIGHT.stats, gauges=("in_flight",))
+register_stats("bmf_shards", bmf_store_stats, gauges=("loaded", "mapped_bytes", "budget_bytes"))
+register_stats("upstream_cache", upstream_cache_stats)
+register_stats("rate_limit", rate_limit_stats, gauges=("queued",))
+
+
+# Category bits (see data_sources/categories.py) for each recommendation slot;
+# 0 means any nonprofit (the fallback).
+RECOMMENDATION_GROUPS = {
+    "education": EDUCATION | SCHOOL_SUPPORT,
+    "faith": FAITH,
+    "animal": ANIMAL,
+    "environment": ENVIRONMENT,
+    "any": 0,
+}
 
 
-def _find_org(nonprofits: List[Dict], keywords: List[str]) -> Optional[Dict]:
+@lru_cache(maxsize=4096)
+def _radius_shard_zips(zip_code: str, radius_miles: float) -> Tuple[str, ...]:
     """
-    Simple helper to find the first nonprofit whose name contains
-    any of the keywords.
+    One ZIP per BMF shard (state) that the radius around zip_code reaches.
+    The gazetteer doesn't change while the process runs, so the radius search
+    is done once per (zip, radius), not on every request.
     """
-    lowered = [k.lower() for k in keywords]
+    neighbors = [z for z, _ in zips_within_radius(zip_code, radius_miles)] or [zip_code]
+    by_state: Dict[Optional[str], str] = {}
+    for z in neighbors:
+        by_state.setdefault(state_for_zip(z), z)
+    return tuple(by_state.values())
 
-    for org in nonprofits:
-        name = (org.get("name") or "").lower()
-        if any(word in name for word in lowered):
-            return org
 
-    return None
+def data_version(zip_code: str, radius_miles: Optional[float] = None) -> str:
+    """
+    Identifies the data a ZIP's result is built from (digest of the BMF shard
+    serving it + ACS vintage). Bumping either one naturally invalidates
+    cached results. Radius results depend on every shard the radius reaches.
+    """
+    if not radius_miles:
+        return f"{bmf_data_version(zip_code)}:{ACS_VINTAGE}"
+
+    versions = [bmf_data_version(z) for z in _radius_shard_zips(zip_code, radius_miles)]
+    return f"{'+'.join(versions)}:{ACS_VINTAGE}"
 
 
-def generate_tax_breaks(zip_code: str) -> Dict:
+def cache_stats() -> Dict[str, int]:
+    return RESULT_CACHE.stats()
+
+
+def generate_tax_breaks(zip_code: str, radius_miles: Optional[float] = None, store: bool = True) -> Dict:
+    """
+    Cached entry point for _build_tax_breaks, keyed by ZIP, radius and data version.
+    With store=False (batch jobs) a cached result is used but a new one isn't
+    kept, so a large batch can't evict the entries live traffic relies on.
+
+    On a miss, concurrent callers for the same key and priority class wait on
+    a single build and share its result or error. Builds aren't shared across
+    classes, so a warmup build shed by the rate limiter can't fail a user's
+    request with it. Results whose census lookup came back empty
+    (unknown ZIP), and degraded results (a stage missed its deadline or the
+    city lookup failed upstream), are not cached. The returned dict is
+    shared; don't mutate it.
+    """
+    key = (zip_code, radius_miles or None, data_version(zip_code, radius_miles))
+    level = current_priority()
+
+    def compute() -> Dict:
+        # Also runs on the cache's refresh thread for a stale hit, which has
+        # no priority of its own: spend the caller's class, not interactive
+        with priority(level):
+            return IN_FLIGHT.do(key + (level,), lambda: _build_tax_breaks(zip_code, radius_miles))
+
+    if not store:
+        cached = RESULT_CACHE.peek(key)
+        return cached if cached is not None else compute()
+
+    return RESULT_CACHE.get_or_compute(
+        key,
+        compute,
+        should_cache=lambda result: bool(result["profile"].get("census")) and not is_degraded(result),
+    )
+
+
+def _build_tax_breaks(zip_code: str, radius_miles: Optional[float] = None) -> Dict:
     """
     Use:
-      - IRS BMF nonprofits (exact ZIP)
+      - IRS BMF nonprofits (exact ZIP, or within radius_miles, nearest first)
       - Psychographic tags
       - Census info
     to generate 3 ZIP-personalized tax write-off ideas.
     """
-    profile = learn_zip(zip_code)
+    profile = learn_zip(zip_code, radius_miles)
+
+    with stage("recommendations"):
+        return _recommend(zip_code, profile, radius_miles)
+
+
+def _recommend(zip_code: str, profile: Dict, radius_miles: Optional[float] = None) -> Dict:
+    """
+    Pick up to 3 recommendations for an already-built ZIP profile.
+    """
     tags = profile["psychographics"]
     nonprofits = profile["nonprofits"]
     census = profile["census"]
@@ -37,13 +144,17 @@ def generate_tax_breaks(zip_code: str) -> Dict:
     def has(tag: str) -> bool:
         return tag in tags
 
+    # Best-scoring orgs per slot (deductibility, status, NTEE, fit; see logic/scoring.py).
+    # Three per group, so the fallback can skip orgs already recommended.
+    ranked = top_nonprofits(nonprofits, tags, RECOMMENDATION_GROUPS, k=3)
+
+    def best(group: str) -> Optional[Dict]:
+        return ranked[group][0] if ranked[group] else None
+
     # ---------------------------------------------------
     # 1. EDUCATION nonprofit (boosters, academy, PTA, etc.)
     # ---------------------------------------------------
-    edu_org = _find_org(
-        nonprofits,
-        ["school", "academy", "education", "pta", "band", "booster", "lancer"]
-    )
+    edu_org = best("education")
     if edu_org:
         recs.append({
             "title": f"Support Local Education in {zip_code}",
@@ -63,10 +174,7 @@ def generate_tax_breaks(zip_code: str) -> Dict:
     # ---------------------------------------------------
     faith_org = None
     if has("faith_community_present"):
-        faith_org = _find_org(
-            nonprofits,
-            ["church", "catholic", "temple", "synagogue", "mosque", "ministries"]
-        )
+        faith_org = best("faith")
 
     if faith_org:
         recs.append({
@@ -87,16 +195,10 @@ def generate_tax_breaks(zip_code: str) -> Dict:
     env_org = None
 
     if has("animal_welfare_present"):
-        env_org = _find_org(
-            nonprofits,
-            ["animal", "rescue", "humane", "spca"]
-        )
+        env_org = best("animal")
 
     if env_org is None:
-        env_org = _find_org(
-            nonprofits,
-            ["conservation", "ecolife", "habitat", "environment", "lagoon"]
-        )
+        env_org = best("environment")
 
     if env_org:
         recs.append({
@@ -115,12 +217,15 @@ def generate_tax_breaks(zip_code: str) -> Dict:
     # ---------------------------------------------------
     # FALLBACK (if we don't get 3)
     # ---------------------------------------------------
-    if len(recs) < 3 and nonprofits:
-        fallback = nonprofits[0]
+    in_use = {id(org) for org in (edu_org, faith_org, env_org) if org is not None}
+    fallback = next((org for org in ranked["any"] if id(org) not in in_use), None)
+
+    if len(recs) < 3 and fallback is not None:
+        where = f"within {radius_miles:g} miles of {zip_code}" if radius_miles else f"in {zip_code}"
         recs.append({
             "title": "Support a Local Nonprofit in Your ZIP",
             "description": (
-                f"There are {len(nonprofits)} IRS-registered nonprofits in {zip_code}. "
+                f"There are {len(nonprofits)} IRS-registered nonprofits {where}. "
                 f"One example is **{fallback['name']}** in {fallback['city']}, {fallback['state']}."
             ),
             "tax_angle": (
@@ -132,8 +237,62 @@ def generate_tax_breaks(zip_code: str) -> Dict:
     # Keep only 3
     recs = recs[:3]
 
-    return {
+    result = {
         "zip": zip_code,
         "profile": profile,
         "recommendations": recs,
     }
+    if radius_miles:
+        result["radius_miles"] = radius_miles
+    return result
+
+
+def is_degraded(result: Dict) -> bool:
+    """
+    True if a learn_zip stage missed its deadline (or the city lookup failed
+    upstream) and the result is partial.
+    """
+    return bool(result.get("profile", {}).get("degraded"))
+
+
+def census_missed(result: Dict) -> bool:
+    """
+    True if the census stage missed its deadline, so the result has no Census
+    data for a reason that has nothing to do with the ZIP.
+    """
+    return "census" in result.get("profile", {}).get("degraded", ())
+
+
+def public_org(org: Dict) -> Dict:
+    """
+    org without INTERNAL_ORG_FIELDS, for anything sent to a client.
+    """
+    return {key: value for key, value in org.items() if key not in INTERNAL_ORG_FIELDS}
+
+
+def tax_breaks_payload(result: Dict) -> Optional[Dict]:
+    """
+    Shape a generate_tax_breaks result into the /api/tax-breaks response body
+    (also used for batch lines and precomputed bodies), without the orgs'
+    INTERNAL_ORG_FIELDS. Returns None if Census came back empty (not a ZIP we can serve).
+    """
+    profile = result.get("profile", {})
+
+    # If Census came back empty for this ZIP, treat it as not a valid ZIP
+    if not profile.get("census"):
+        return None
+
+    payload = {
+        "zip": result["zip"],
+        "city": profile["city"],
+        "state": profile["state"],
+        "area_label": profile.get("area_label"),
+        "psychographics": profile["psychographics"],
+        "census": profile["census"],
+        "recommendations": result["recommendations"],
+        "nonprofit_count": len(profile["nonprofits"]),
+        "nonprofits": [public_org(org) for org in profile["nonprofits"]],
+    }
+    if "radius_miles" in result:
+        payload["radius_miles"] = result["radius_miles"]
+    return payload
@@ -0,0 +1,159 @@
+"""
+Rank a ZIP's nonprofits for recommendations.
+
+Every candidate gets one score from a few features:
+
+  - subsection 03: 501(c)(3), so donations are deductible
+  - status 01: unconditional exemption (an active, current org)
+  - NTEE major group agreeing with the org's keyword category
+  - fit: how well the org's categories match the ZIP's psychographic tags
+  - distance (radius searches): nearer is better
+
+The other features only take a few hundred distinct combinations, so orgs are
+bucketed by feature tuple in one pass that also records each bucket's first k
+positions, each distinct tuple is scored once, and top-k per category is a
+heap selection over those positions. Distance is scored per org, for just
+those positions.
+"""
+import heapq
+from operator import itemgetter
+from typing import Dict, Iterable, List, Tuple
+
+from data_sources.categories import (
+    ANIMAL,
+    EDUCATION,
+    ENVIRONMENT,
+    FAITH,
+    PHILANTHROPY,
+    SCHOOL_SUPPORT,
+    org_categories,
+)
+
+DEDUCTIBLE_POINTS = 50.0
+ACTIVE_POINTS = 20.0
+NTEE_MATCH_POINTS = 10.0
+MILE_PENALTY = 2.0
+
+# NTEE major group (first letter of NTEE_CD) -> category bits
+NTEE_CATEGORIES: Dict[str, int] = {
+    "B": EDUCATION,
+    "C": ENVIRONMENT,
+    "D": ANIMAL,
+    "T": PHILANTHROPY,
+    "X": FAITH,
+}
+
+# Psychographic tag -> {category bits: points} for orgs in that category
+TAG_AFFINITY: Dict[str, Dict[int, float]] = {
+    "younger_area": {EDUCATION | SCHOOL_SUPPORT: 10.0},
+    "homeowner_heavy": {EDUCATION | SCHOOL_SUPPORT: 8.0, ENVIRONMENT: 4.0},
+    "older_area": {FAITH: 8.0, PHILANTHROPY: 6.0},
+    "very_affluent": {PHILANTHROPY: 10.0, ENVIRONMENT: 6.0},
+    "upper_middle_income": {EDUCATION | SCHOOL_SUPPORT: 6.0, ENVIRONMENT: 4.0},
+    "high_poverty": {FAITH: 6.0},
+    "renter_heavy": {ANIMAL: 4.0},
+}
+
+
+_FEATURES = itemgetter("category_mask", "subsection_code", "status", "classification")
+
+
+def _fit_table(tags: List[str]) -> Dict[int, float]:
+    """
+    {category bits: fit points} for this ZIP's tags.
+    """
+    table: Dict[int, float] = {}
+    for tag in tags:
+        for bits, points in TAG_AFFINITY.get(tag, {}).items():
+            table[bits] = table.get(bits, 0.0) + points
+    return table
+
+
+def _feature_key(org: Dict) -> Tuple:
+    # For orgs that didn't come through the BMF loader (no category_mask)
+    return org_categories(org), org.get("subsection_code"), org.get("status"), org.get("classification")
+
+
+def _first_positions(nonprofits: List[Dict], k: int) -> Dict[Tuple, List[int]]:
+    """
+    {feature tuple: positions of its first k orgs} in one pass over the list.
+    The tuple is (category_mask, subsection, status, NTEE); BMF rows are read
+    with a single itemgetter call each.
+    """
+    try:
+        return _positions(map(_FEATURES, nonprofits), k)
+    except KeyError:
+        return _positions(map(_feature_key, nonprofits), k)
+
+
+def _positions(keys: Iterable[Tuple], k: int) -> Dict[Tuple, List[int]]:
+    positions: Dict[Tuple, List[int]] = {}
+    for i, key in enumerate(keys):
+        found = positions.get(key)
+        if found is None:
+            positions[key] = [i]
+        elif len(found) < k:
+            found.append(i)
+    return positions
+
+
+def _score(key: Tuple, fit: Dict[int, float]) -> Tuple[int, float]:
+    """
+    (category mask, score) for one feature tuple. NTEE major groups are ORed
+    into the keyword category mask.
+    """
+    name_mask, subsection, status, classification = key
+    ntee_mask = NTEE_CATEGORIES.get((classification or " ")[0], 0)
+    mask = (name_mask or 0) | ntee_mask
+
+    score = 0.0
+    if subsection == "03":
+        score += DEDUCTIBLE_POINTS
+    if status == "01":
+        score += ACTIVE_POINTS
+    if (name_mask or 0) & ntee_mask:
+        score += NTEE_MATCH_POINTS
+    for bits, points in fit.items():
+        if mask & bits:
+            score += points
+    return mask, score
+
+
+def top_nonprofits(
+    nonprofits: List[Dict],
+    tags: List[str],
+    groups: Dict[str, int],
+    k: int = 3,
+) -> Dict[str, List[Dict]]:
+    """
+    {group: best k orgs} for each {group: category bits} (0 = any category).
+    Ties keep list order, so results are deterministic.
+
+    Orgs are bucketed by feature tuple (a few hundred distinct ones even for
+    thousands of orgs) and each tuple is scored once. Within a bucket, earlier
+    orgs never score lower: without distance they tie, and radius results come
+    nearest first, so the distance penalty only grows down the list. So only
+    each bucket's first k orgs can make a top k, and the selection runs over
+    those alone.
+    """
+    if k <= 0:
+        return {group: [] for group in groups}
+
+    fit = _fit_table(tags)
+    with_distance = bool(nonprofits) and "distance_miles" in nonprofits[0]
+
+    # (mask, [(-score, position), ...]) per bucket; negated so smallest is best
+    buckets = []
+    for key, positions in _first_positions(nonprofits, k).items():
+        mask, score = _score(key, fit)
+        if with_distance:
+            ranked = [(MILE_PENALTY * (nonprofits[i].get("distance_miles") or 0.0) - score, i) for i in positions]
+        else:
+            ranked = [(-score, i) for i in positions]
+        buckets.append((mask, ranked))
+
+    top: Dict[str, List[Dict]] = {}
+    for group, bits in groups.items():
+        candidates = [c for mask, ranked in buckets if not bits or mask & bits for c in ranked]
+        top[group] = [nonprofits[i] for _score, i in heapq.nsmallest(k, candidates)]
+    return top
@@ -0,0 +1,211 @@
+"""
+Cache warmup driven by observed ZIP popularity.
+
+  - record_zip() counts every /api/tax-breaks ZIP in a bounded in-memory
+    table; a background thread periodically merges the counts into
+    WARMUP_STATS_PATH, so they survive restarts and add up across workers.
+  - start_warmup() reads the top WARMUP_TOP_N ZIPs from that file and builds
+    their results through generate_tax_breaks on one background thread,
+    paced at WARMUP_RATE ZIPs/second, while the server takes traffic. It
+    also builds the nonprofit search indexes of WARMUP_SEARCH_STATES and the
+    popular ZIPs' states (up to BMF_SEARCH_MAX_INDEXES), so their first
+    searches don't wait for one (WARMUP_SEARCH_INDEXES=0 turns that off). gunicorn.conf.py calls it in each worker
+    once the app is loaded (python server.py before serving, and server.py
+    at import with WARMUP_ON_IMPORT), so the threads run in the process that
+    serves and no user request triggers the popularity-file read.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import Counter
+from typing import Dict, List
+
+from data_sources.bmf_search import build_search_indexes
+from data_sources.http_client import upstream_stats
+from data_sources.rate_limit import BACKGROUND, priority
+from data_sources.zip_prefixes import state_for_zip
+from logic.recommendations import generate_tax_breaks
+
+WARMUP_STATS_PATH = os.environ.get("WARMUP_STATS_PATH", "data_sources/zip_popularity.json")
+
+# How many of the most requested ZIPs to warm on start (0 disables warmup).
+WARMUP_TOP_N = int(os.environ.get("WARMUP_TOP_N", "100"))
+
+# ZIPs per second warmup may build. Each build can cost a Census call, so keep
+# this well under the API quota; live traffic gets the rest.
+WARMUP_RATE = float(os.environ.get("WARMUP_RATE", "2"))
+
+# Seconds between merges of the in-memory counts into WARMUP_STATS_PATH.
+WARMUP_FLUSH_INTERVAL = float(os.environ.get("WARMUP_FLUSH_INTERVAL", "60"))
+
+# Build nonprofit search indexes in the background when a worker boots, so a
+# state's first search doesn't wait a second or more for its index. States in
+# WARMUP_SEARCH_STATES (comma-separated) go first, then the states of the most
+# requested ZIPs, up to BMF_SEARCH_MAX_INDEXES. Any other state's index is
+# still built on its first search.
+WARMUP_SEARCH_INDEXES = os.environ.get("WARMUP_SEARCH_INDEXES", "1").lower() not in ("0", "false", "no")
+WARMUP_SEARCH_STATES = [
+    st.strip().upper() for st in os.environ.get("WARMUP_SEARCH_STATES", "").split(",") if st.strip()
+]
+
+# ZIPs tracked (in memory and on disk). When the table grows past twice this,
+# only the top WARMUP_TRACK_ZIPS are kept.
+WARMUP_TRACK_ZIPS = int(os.environ.get("WARMUP_TRACK_ZIPS", "5000"))
+
+
+class ZipPopularity:
+    """
+    Bounded ZIP request counter. Counts not yet written to disk are kept as a
+    separate delta, so several worker processes can merge into the same file
+    without double counting.
+    """
+
+    def __init__(self, path: str, track: int):
+        self.path = path
+        self.track = track
+        self._lock = threading.Lock()
+        self._pending: Counter = Counter()
+
+    def record(self, zip_code: str) -> None:
+        with self._lock:
+            self._pending[zip_code] += 1
+            if len(self._pending) > 2 * self.track:
+                self._pending = Counter(dict(self._pending.most_common(self.track)))
+
+    def _read(self) -> Counter:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return Counter(json.load(f).get("counts", {}))
+        except FileNotFoundError:
+            return Counter()
+        except (OSError, ValueError) as e:
+            print(f"[warmup] Ignoring unreadable {self.path}: {e}")
+            return Counter()
+
+    def flush(self) -> None:
+        """
+        Merge pending counts into the file (atomic rename, so readers never see
+        a partial file; a flush racing another worker's can drop one delta,
+        which is fine for a popularity estimate).
+        """
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending:
+            return
+
+        counts = self._read()
+        counts.update(pending)
+        doc = {"updated_at": int(time.time()), "counts": dict(counts.most_common(self.track))}
+
+        tmp_path = f"{self.path}.tmp.{os.getpid()}"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(doc, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[warmup] Could not write {self.path}: {e}")
+
+    def top(self, n: int) -> List[str]:
+        return [z for z, _count in self._read().most_common(n)]
+
+
+POPULARITY = ZipPopularity(WARMUP_STATS_PATH, WARMUP_TRACK_ZIPS)
+
+_stats_lock = threading.Lock()
+_stats = {"warmed": 0, "errors": 0, "pending": 0}
+_started = False
+
+
+def record_zip(zip_code: str) -> None:
+    POPULARITY.record(zip_code)
+
+
+def warmup_stats() -> Dict[str, int]:
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _upstream_healthy() -> bool:
+    # Don't pile warmup calls onto a host whose circuit breaker is open
+    return all(s.get("breaker") != "open" for s in upstream_stats().values())
+
+
+def _warm(zips: List[str]) -> None:
+    interval = 1.0 / WARMUP_RATE if WARMUP_RATE > 0 else 0.0
+    started = time.monotonic()
+
+    for i, zip_code in enumerate(zips):
+        # Pace against the schedule, not the previous call, so slow builds
+        # don't push the whole run back
+        delay = started + i * interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        while not _upstream_healthy():
+            time.sleep(max(interval, 1.0))
+
+        try:
+            # Lowest priority: live traffic gets the Census quota first
+            with priority(BACKGROUND):
+                generate_tax_breaks(zip_code)
+            key = "warmed"
+        except Exception as e:
+            print(f"[warmup] {zip_code} failed: {e}")
+            key = "errors"
+
+        with _stats_lock:
+            _stats[key] += 1
+            _stats["pending"] -= 1
+
+    print(f"[warmup] Warmed {len(zips)} ZIPs in {time.monotonic() - started:.1f}s")
+
+
+def _build_search(zips: List[str]) -> None:
+    started = time.monotonic()
+    # Configured states, then the most requested; with neither, any shards
+    states = WARMUP_SEARCH_STATES + [st for st in map(state_for_zip, zips) if st is not None] or None
+    try:
+        built = build_search_indexes(states)
+    except Exception as e:
+        print(f"[warmup] Search index build failed: {e}")
+        return
+    print(f"[warmup] Built {built} search indexes in {time.monotonic() - started:.1f}s")
+
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(WARMUP_FLUSH_INTERVAL)
+        POPULARITY.flush()
+
+
+def start_warmup() -> None:
+    """
+    Start the background flush and warmup threads (once per process). Returns
+    immediately; the server takes traffic while warmup runs.
+    """
+    global _started
+
+    if _started:
+        return
+    with _stats_lock:
+        if _started:
+            return
+        _started = True
+
+    threading.Thread(target=_flush_loop, name="warmup-flush", daemon=True).start()
+    atexit.register(POPULARITY.flush)
+
+    if WARMUP_TOP_N <= 0 and not WARMUP_SEARCH_INDEXES:
+        return
+    zips = POPULARITY.top(max(0, WARMUP_TOP_N))
+
+    if WARMUP_SEARCH_INDEXES:
+        threading.Thread(target=_build_search, args=(zips,), name="warmup-search", daemon=True).start()
+
+    if not zips:
+        return
+
+    with _stats_lock:
+        _stats["pending"] = len(zips)
+    threading.Thread(target=_warm, args=(zips,), name="warmup", daemon=True).start()
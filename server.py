@@ -1,55 +1,548 @@
 from dotenv import load_dotenv
 load_dotenv()  # Load .env variables like CENSUS_API_KEY before anything else
 
-from flask import Flask, request, jsonify, render_template
-from logic.recommendations import generate_tax_breaks
+import gzip
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Optional
+
+from flask import Flask, Response, g, request, jsonify, render_template, send_from_directory, url_for
+from data_sources.bmf_search import search_nonprofits, search_stats
+from data_sources.census import census_has_no_data, census_no_data_stats
+from data_sources.http_client import UpstreamError
+from data_sources.rate_limit import BATCH, RateLimited, priority, retry_after_header
+from data_sources.zcta import is_known_zip, zcta_stats
+from logic.metrics import (
+    end_request,
+    record_request,
+    register_stats,
+    render_prometheus,
+    request_timings,
+    server_timing_header,
+    stage,
+    start_request,
+)
+from logic.precompute import lookup_precomputed
+from logic.recommendations import (
+    RESPONSE_VERSION,
+    census_missed,
+    data_version,
+    generate_tax_breaks,
+    is_degraded,
+    public_org,
+    tax_breaks_payload,
+)
+from logic.warmup import record_zip, start_warmup, warmup_stats
+
+try:  # optional: Brotli responses when the package is installed
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
 
 app = Flask(__name__)
 
+register_stats("bmf_search", search_stats, gauges=("loaded", "records"))
+register_stats("warmup", warmup_stats, gauges=("pending",))
+register_stats("zcta", zcta_stats, gauges=("loaded", "zctas"))
+register_stats("census_no_data", census_no_data_stats, gauges=("size",))
+# Bodies smaller than this are sent uncompressed.
+COMPRESS_MIN_BYTES = 1024
+
+# Top-level fields of the /api/tax-breaks response that ?fields= may select.
+RESPONSE_FIELDS = (
+    "zip",
+    "city",
+    "state",
+    "area_label",
+    "psychographics",
+    "census",
+    "recommendations",
+    "nonprofit_count",
+    "nonprofits",
+    "radius_miles",
+)
+
+# Largest ?radius_miles= accepted for "near me" nonprofit searches.
+MAX_RADIUS_MILES = float(os.environ.get("MAX_RADIUS_MILES", "50"))
+
+# Nonprofit search: default and max results per request.
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+# Error for requests shed because we're over the Census API quota (503).
+BUSY_MESSAGE = "We're handling a lot of requests right now. Please try again shortly."
+
+# Error for requests the Census API couldn't answer (down, failing, or its
+# circuit breaker open) (503).
+UNAVAILABLE_MESSAGE = "Census data is temporarily unavailable. Please try again shortly."
+
+# Retry-After (seconds) when the Census lookup missed its stage deadline.
+CENSUS_TIMEOUT_RETRY_AFTER = 5.0
+
+# Start warmup when this module is imported, for WSGI servers other than
+# gunicorn (gunicorn.conf.py starts it in each worker). Not with gunicorn
+# --preload: threads started before the fork don't survive it.
+WARMUP_ON_IMPORT = os.environ.get("WARMUP_ON_IMPORT", "0").lower() in ("1", "true", "yes")
+
+# Serve /api/tax-breaks straight from the precomputed artifact
+# (python -m logic.precompute build), computing live only for ZIPs it lacks.
+SERVE_PRECOMPUTED = os.environ.get("SERVE_PRECOMPUTED", "0").lower() in ("1", "true", "yes")
+
+# Batch endpoint limits: max ZIPs per request, and how many of one batch's
+# ZIPs may be in flight at once (the pool itself is shared by all batches, and
+# caps how many batch builds run at all; their stages run on learn_zip's bulk
+# pool, sized LEARN_ZIP_BULK_WORKERS = 3x this).
+BATCH_MAX_ZIPS = int(os.environ.get("BATCH_MAX_ZIPS", "10000"))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+_batch_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("BATCH_WORKERS", "4")),
+    thread_name_prefix="batch",
+)
+
+# Cache lifetime for versioned static assets (?v=<content hash>); a deploy
+# that changes a file changes its URL, so browsers can keep them this long.
+STATIC_MAX_AGE = 365 * 86400
+
+_asset_versions = {}  # filename -> content hash, computed on first use
+_home_page = None  # (body, etag) of the rendered index page
+
+
+def asset_url(filename: str) -> str:
+    """
+    URL of a file in static/ with its content hash as ?v=, for templates.
+    """
+    return url_for("static", filename=filename, v=_asset_version(filename))
+
+
+def _asset_version(filename: str) -> str:
+    version = _asset_versions.get(filename)
+    if version is None:
+        with open(os.path.join(app.static_folder, filename), "rb") as f:
+            version = hashlib.sha256(f.read()).hexdigest()[:12]
+        _asset_versions[filename] = version
+    return version
+
+
+app.jinja_env.globals["asset_url"] = asset_url
+
+
+def _is_zip(zip_code: str) -> bool:
+    return bool(zip_code) and zip_code.isdigit() and len(zip_code) == 5
+
+
+def _is_servable_zip(zip_code: str) -> bool:
+    """
+    Cheap checks before any real work: a well-formed ZIP that is in the
+    valid-ZCTA bitmap and hasn't recently come back with no ACS data.
+    """
+    return _is_zip(zip_code) and is_known_zip(zip_code) and not census_has_no_data(zip_code)
+
+
+@app.before_request
+def _start_timing():
+    g.timing_token = start_request()
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _emit_timing(response):
+    elapsed = time.perf_counter() - g.request_started
+    record_request(request.endpoint or "unmatched", response.status_code, elapsed)
+
+    timings = dict(request_timings())
+    timings["total"] = elapsed * 1000.0
+    response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+
+@app.after_request
+def _static_cache_headers(response):
+    # Only a URL carrying the file's current hash is safe to cache for good
+    if request.endpoint == "static" and response.status_code == 200:
+        filename = (request.view_args or {}).get("filename", "")
+        try:
+            versioned = request.args.get("v") == _asset_version(filename)
+        except OSError:
+            versioned = False
+        if versioned:
+            response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}, immutable"
+        else:
+            response.headers["Cache-Control"] = "public, no-cache"
+    return response
+
+
+@app.teardown_request
+def _end_timing(_exc):
+    token = g.pop("timing_token", None)
+    if token is not None:
+        end_request(token)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
 
 @app.route("/", methods=["GET"])
 def home():
-    # Render the HTML page with the ZIP form
-    return render_template("index.html")
+    # The page only changes with a deploy: render it once, then serve the
+    # same bytes with an ETag so repeat visits get a 304
+    global _home_page
+
+    if _home_page is None:
+        body = render_template("index.html").encode("utf-8")
+        _home_page = (body, hashlib.sha256(body).hexdigest()[:16])
+    body, etag = _home_page
+
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    return _finish(Response(body, mimetype="text/html"), etag)
+
+
+@app.route("/sw.js", methods=["GET"])
+def service_worker():
+    # Served from the root so it may cover /api/; never cached long, so
+    # browsers pick up a new worker on the next visit
+    response = send_from_directory(app.static_folder, "sw.js", mimetype="text/javascript", max_age=0)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _parse_view_args(args):
+    """
+    Parse ?fields=, ?nonprofit_limit= and ?cursor=.
+    Returns (fields, limit, offset, error); fields/limit are None when not given.
+    """
+    fields = None
+    raw_fields = args.get("fields", "").strip()
+    if raw_fields:
+        fields = [f.strip() for f in raw_fields.split(",") if f.strip()]
+        unknown = [f for f in fields if f not in RESPONSE_FIELDS]
+        if unknown:
+            return None, None, 0, f"Unknown field(s): {', '.join(unknown)}."
+
+    limit = None
+    offset = 0
+    try:
+        if args.get("nonprofit_limit"):
+            limit = int(args["nonprofit_limit"])
+        if args.get("cursor"):
+            offset = int(args["cursor"])
+    except ValueError:
+        return None, None, 0, "nonprofit_limit and cursor must be integers."
+    # A zero limit would hand back the same cursor forever
+    if (limit is not None and limit < 1) or offset < 0:
+        return None, None, 0, "nonprofit_limit must be at least 1 and cursor must not be negative."
+
+    return fields, limit, offset, None
+
+
+def _apply_view(payload: dict, fields, limit, offset) -> dict:
+    """
+    Page the nonprofits list and keep only the requested top-level fields.
+    nonprofit_count always reports the full count; next_cursor is set while
+    more nonprofits remain.
+    """
+    if limit is not None or offset:
+        nonprofits = payload["nonprofits"]
+        end = len(nonprofits) if limit is None else offset + limit
+        payload = dict(payload, nonprofits=nonprofits[offset:end])
+        if end < len(nonprofits):
+            payload["next_cursor"] = str(end)
+
+    if fields is not None:
+        keep = set(fields) | ({"next_cursor"} if "nonprofits" in fields else set())
+        payload = {k: v for k, v in payload.items() if k in keep}
+
+    return payload
+
+
+def _parse_radius(args):
+    """
+    Parse ?radius_miles=. Returns (radius, error); radius is None when not given.
+    """
+    raw = args.get("radius_miles", "").strip()
+    if not raw:
+        return None, None
+    try:
+        radius = float(raw)
+    except ValueError:
+        return None, "radius_miles must be a number."
+    if not 0 < radius <= MAX_RADIUS_MILES:
+        return None, f"radius_miles must be between 0 and {MAX_RADIUS_MILES:g}."
+    return radius, None
+
+
+def _etag(zip_code: str, radius, fields, limit, offset) -> str:
+    """
+    Strong ETag for a response, derived from the data version of the ZIP and
+    the view parameters, so it can be checked before doing any work.
+    """
+    key = "|".join([
+        RESPONSE_VERSION,
+        zip_code,
+        "" if radius is None else f"{radius:g}",
+        data_version(zip_code, radius),
+        ",".join(fields) if fields is not None else "*",
+        "" if limit is None else str(limit),
+        str(offset),
+    ])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def _pick_encoding():
+    if brotli is not None and request.accept_encodings.quality("br") > 0:
+        return "br"
+    if request.accept_encodings.quality("gzip") > 0:
+        return "gzip"
+    return None
+
+
+def _not_modified(etag: str):
+    """
+    A 304 if If-None-Match has etag (in any of the encodings _finish sends),
+    else None.
+    """
+    if not any(request.if_none_match.contains(t) for t in (etag, f"{etag}-gzip", f"{etag}-br")):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+def _finish(response: Response, etag: Optional[str]) -> Response:
+    """
+    Compress the body when the client accepts it, and attach the ETag (one
+    per encoding, as strong validators must be). Without an ETag the response
+    is not to be stored at all.
+    """
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "public, no-cache" if etag is not None else "no-store"
+
+    encoding = _pick_encoding()
+    body = response.get_data()
+    if encoding is not None and len(body) >= COMPRESS_MIN_BYTES:
+        if encoding == "br":
+            response.set_data(brotli.compress(body))
+        else:
+            response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers["Content-Encoding"] = encoding
+        if etag is not None:
+            etag = f"{etag}-{encoding}"
+
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+
+def _busy(retry_after: Optional[float], message: str = BUSY_MESSAGE) -> Response:
+    """
+    503 for a request shed by upstream rate limiting, or one the upstream
+    couldn't answer (not the client's fault).
+    """
+    response = jsonify({"error": message})
+    response.status_code = 503
+    response.headers["Retry-After"] = retry_after_header(retry_after)
+    return response
 
 
 @app.route("/api/tax-breaks", methods=["GET"])
 def api_tax_breaks():
     zip_code = request.args.get("zip", "").strip()
 
-    # Any missing / non-numeric / wrong length ZIP → same error
-    if not zip_code or not zip_code.isdigit() or len(zip_code) != 5:
-        return jsonify({"error": "Enter a valid California ZIP."}), 400
+    # Any missing / non-numeric / wrong length / unknown ZIP → same error
+    if not _is_servable_zip(zip_code):
+        return jsonify({"error": "Enter a valid ZIP."}), 400
+
+    # The page prefetches while a ZIP is typed; only real lookups are demand
+    if request.headers.get("X-Prefetch") != "1":
+        record_zip(zip_code)
+
+    fields, limit, offset, error = _parse_view_args(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+
+    radius, error = _parse_radius(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+
+    # Repeat visitors: same data version + same view → nothing changed
+    etag = _etag(zip_code, radius, fields, limit, offset)
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
+    default_view = fields is None and limit is None and not offset
+
+    # The artifact only holds exact-ZIP results
+    if SERVE_PRECOMPUTED and radius is None:
+        body = lookup_precomputed(zip_code)
+        if body is not None:
+            if default_view:
+                return _finish(Response(body, mimetype="application/json"), etag)
+            return _finish(jsonify(_apply_view(json.loads(body), fields, limit, offset)), etag)
 
     try:
         # This will call learn_zip -> get_census_by_zip, etc.
-        result = generate_tax_breaks(zip_code)
+        result = generate_tax_breaks(zip_code, radius)
+    except RateLimited as e:
+        # Out of Census quota: the ZIP is fine, we're just busy
+        print("Shedding tax-breaks request:", e)
+        return _busy(e.retry_after)
+    except UpstreamError as e:
+        # Census is down or its breaker is open: also not the ZIP's fault
+        print("Census unavailable for tax-breaks request:", e)
+        return _busy(e.retry_after, UNAVAILABLE_MESSAGE)
     except Exception as e:
         # If anything blows up while building the profile, treat it as invalid ZIP
         print("Error in generate_tax_breaks:", e)
-        return jsonify({"error": "Enter a valid California ZIP."}), 400
+        return jsonify({"error": "Enter a valid ZIP."}), 400
 
-    profile = result.get("profile", {})
+    if census_missed(result):
+        # Census was too slow to answer, which says nothing about the ZIP
+        return _busy(CENSUS_TIMEOUT_RETRY_AFTER, UNAVAILABLE_MESSAGE)
 
-    # If Census came back empty for this ZIP, treat it as not a valid CA ZIP
-    if not profile.get("census"):
-        return jsonify({"error": "Enter a valid California ZIP."}), 400
+    payload = tax_breaks_payload(result)
+    if payload is None:
+        return jsonify({"error": "Enter a valid ZIP."}), 400
 
-    return jsonify({
-        "zip": result["zip"],
-        "city": profile["city"],
-        "state": profile["state"],
-        "area_label": profile.get("area_label"),
-        "psychographics": profile["psychographics"],
-        "census": profile["census"],
-        "recommendations": result["recommendations"],
-        "nonprofit_count": len(profile["nonprofits"]),
-        "nonprofits": profile["nonprofits"],
-    })
+    if not default_view:
+        payload = _apply_view(payload, fields, limit, offset)
 
+    # A partial result (some stage missed its deadline) must not be
+    # revalidated as the full one later: no ETag, not stored
+    return _finish(jsonify(payload), None if is_degraded(result) else etag)
 
-if __name__ == "__main__":
-    import os
 
+@app.route("/api/tax-breaks/seen", methods=["POST"])
+def api_tax_breaks_seen():
+    """
+    ?zip=92008. Counts a lookup the page answered from a prefetch, which the
+    server didn't count (X-Prefetch), without building anything. 204.
+    """
+    zip_code = request.args.get("zip", "").strip()
+    if not _is_servable_zip(zip_code):
+        return jsonify({"error": "Enter a valid ZIP."}), 400
+    record_zip(zip_code)
+    return Response(status=204)
+
+
+@app.route("/api/nonprofits/search", methods=["GET"])
+def api_nonprofit_search():
+    """
+    ?q=booster&zip=92008 (or &state=CA) &limit=20. Matches every word of q
+    against org names and cities; the last word may be partially typed.
+    """
+    query = request.args.get("q", "").strip()
+    zip_code = request.args.get("zip", "").strip() or None
+    state = request.args.get("state", "").strip().upper() or None
+
+    if not query:
+        return jsonify({"error": "Enter a search term."}), 400
+    if zip_code is not None and not _is_zip(zip_code):
+        return jsonify({"error": "Enter a valid ZIP."}), 400
+    if state is not None and (len(state) != 2 or not state.isalpha()):
+        return jsonify({"error": "state must be a two-letter abbreviation."}), 400
+
+    try:
+        limit = int(request.args.get("limit", SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer."}), 400
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+
+    try:
+        with stage("search"):
+            orgs = search_nonprofits(query, zip_code=zip_code, state=state, limit=limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    results = [public_org(org) for org in orgs]
+
+    return jsonify({"query": query, "count": len(results), "results": results})
+
+
+def _batch_line(zip_code: str) -> dict:
+    """
+    Build one NDJSON record for the batch endpoint; errors are reported inline.
+    """
+    if not _is_servable_zip(zip_code):
+        return {"zip": zip_code, "error": "Enter a valid ZIP."}
+
+    try:
+        # Batch work yields the Census quota and the stage workers to
+        # interactive requests, and reads the result cache without filling it
+        with priority(BATCH):
+            result = generate_tax_breaks(zip_code, store=False)
+    except RateLimited as e:
+        return {"zip": zip_code, "error": BUSY_MESSAGE, "retry_after": int(retry_after_header(e.retry_after))}
+    except UpstreamError as e:
+        return {"zip": zip_code, "error": UNAVAILABLE_MESSAGE, "retry_after": int(retry_after_header(e.retry_after))}
+    except Exception as e:
+        print(f"Error in generate_tax_breaks for {zip_code}:", e)
+        return {"zip": zip_code, "error": "Enter a valid ZIP."}
+
+    if census_missed(result):
+        return {"zip": zip_code, "error": UNAVAILABLE_MESSAGE, "retry_after": int(CENSUS_TIMEOUT_RETRY_AFTER)}
+
+    payload = tax_breaks_payload(result)
+    if payload is None:
+        return {"zip": zip_code, "error": "Enter a valid ZIP."}
+    return payload
+
+
+def _stream_batch(zips):
+    """
+    Yield one NDJSON line per ZIP as soon as it is ready (completion order).
+    At most BATCH_CONCURRENCY ZIPs are in flight, so memory stays flat no
+    matter how large the batch is.
+    """
+    pending = set()
+    zip_iter = iter(zips)
+
+    while True:
+        for zip_code in zip_iter:
+            pending.add(_batch_pool.submit(_batch_line, zip_code))
+            if len(pending) >= BATCH_CONCURRENCY:
+                break
+
+        if not pending:
+            return
+
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield json.dumps(future.result()) + "\n"
+
+
+@app.route("/api/tax-breaks/batch", methods=["POST"])
+def api_tax_breaks_batch():
+    """
+    Body: {"zips": ["92008", "90210", ...]} (or a bare JSON list).
+    Streams application/x-ndjson, one {"zip": ..., ...} or
+    {"zip": ..., "error": ...} line per distinct ZIP.
+    """
+    body = request.get_json(silent=True)
+    zips = body.get("zips") if isinstance(body, dict) else body
+
+    if not isinstance(zips, list):
+        return jsonify({"error": 'Send a JSON body like {"zips": ["92008", "90210"]}.'}), 400
+
+    # Deduplicate, keeping first-seen order
+    unique = list(dict.fromkeys(str(z).strip() for z in zips))
+    if len(unique) > BATCH_MAX_ZIPS:
+        return jsonify({"error": f"At most {BATCH_MAX_ZIPS} ZIPs per batch."}), 413
+
+    return Response(_stream_batch(unique), mimetype="application/x-ndjson")
+
+
+if WARMUP_ON_IMPORT:
+    start_warmup()
+
+
+if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
+    start_warmup()  # the dev server can warm up before its first request
     app.run(host="0.0.0.0", port=port)
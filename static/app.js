@@ -0,0 +1,251 @@
+const zipInput = document.getElementById('zip-input');
+const goBtn = document.getElementById('go-btn');
+const errorDiv = document.getElementById('error');
+const resultsDiv = document.getElementById('results');
+
+// Only what the page renders; the full nonprofit list stays on the server
+const API_FIELDS = 'zip,area_label,psychographics,census,recommendations,nonprofit_count';
+
+// ZIP -> Promise of {ok, data, prefetched}; started by prefetch() once
+// 5 digits have been typed and left alone for PREFETCH_DELAY_MS
+const lookups = new Map();
+const MAX_LOOKUPS = 20;
+const PREFETCH_DELAY_MS = 300;
+let prefetchTimer = null;
+
+function apiUrl(zip) {
+  return `/api/tax-breaks?zip=${encodeURIComponent(zip)}&fields=${API_FIELDS}`;
+}
+
+function lookup(zip, prefetched = false) {
+  let pending = lookups.get(zip);
+  if (pending) return pending;
+
+  // Prefetches are marked so the server doesn't count them as ZIP demand
+  const headers = prefetched ? { 'X-Prefetch': '1' } : {};
+  pending = fetch(apiUrl(zip), { headers })
+    .then(async (res) => ({ ok: res.ok, data: await res.json(), prefetched }))
+    .then((result) => {
+      // Don't hold on to errors (e.g. a 503 while we're busy); retry next time
+      if (!result.ok) lookups.delete(zip);
+      return result;
+    }, (err) => {
+      lookups.delete(zip);
+      throw err;
+    });
+
+  lookups.set(zip, pending);
+  if (lookups.size > MAX_LOOKUPS) {
+    lookups.delete(lookups.keys().next().value);
+  }
+  return pending;
+}
+
+// A submitted ZIP whose result came from a prefetch still counts once; the
+// server only records it, with no lookup work
+function countLookup(zip, result) {
+  if (!result.prefetched) return;
+  result.prefetched = false;
+  fetch(`/api/tax-breaks/seen?zip=${encodeURIComponent(zip)}`, { method: 'POST', keepalive: true })
+    .catch(() => {});
+}
+
+function prefetch() {
+  clearTimeout(prefetchTimer);
+  const zip = zipInput.value.trim();
+  if (/^[0-9]{5}$/.test(zip)) {
+    prefetchTimer = setTimeout(() => {
+      lookup(zip, true).catch(() => {});  // errors surface if the user submits
+    }, PREFETCH_DELAY_MS);
+  }
+}
+
+async function fetchTaxBreaks() {
+  const zip = zipInput.value.trim();
+  errorDiv.textContent = '';
+  resultsDiv.innerHTML = '';
+
+  if (!/^[0-9]{5}$/.test(zip)) {
+    errorDiv.textContent = 'Please enter a valid 5-digit ZIP code.';
+    return;
+  }
+
+  goBtn.disabled = true;
+  goBtn.textContent = 'Loading...';
+
+  try {
+    const result = await lookup(zip);
+    countLookup(zip, result);
+    const { ok, data } = result;
+
+    if (!ok) {
+      errorDiv.textContent = data.error || 'Something went wrong.';
+      return;
+    }
+
+    const {
+      zip: z,
+      area_label,
+      psychographics,
+      census,
+      recommendations,
+      nonprofit_count
+    } = data;
+
+    renderProfile(z, area_label, psychographics, census, nonprofit_count);
+    renderRecommendations(recommendations || [], z);
+
+  } catch (err) {
+    console.error(err);
+    errorDiv.textContent = 'Error contacting the server.';
+  } finally {
+    goBtn.disabled = false;
+    goBtn.textContent = 'Show my tax breaks';
+  }
+}
+
+function renderProfile(zip, area, psychographics, census, nonprofitCount) {
+  const censusData = census || {};
+  const tags = psychographics || [];
+
+  const medianIncome = censusData.median_household_income;
+  const population = censusData.population;
+  const ownerRatio = censusData.owner_ratio;
+  const povertyRate = censusData.poverty_rate;
+
+  const formatIncome = (val) => {
+    if (val === null || val === undefined || val === -666666666) {
+      return 'n/a';
+    }
+    const num = Number(val);
+    if (Number.isNaN(num) || num <= 0) return 'n/a';
+    return `$${num.toLocaleString()}`;
+  };
+
+  const formatPercent = (val) => {
+    if (val === null || val === undefined) return 'n/a';
+    const num = Number(val);
+    if (Number.isNaN(num) || num < 0) return 'n/a';
+    return `${(num * 100).toFixed(1)}%`;
+  };
+
+  const formatOwnerRenter = (ratio) => {
+    if (ratio === null || ratio === undefined) return 'n/a';
+    const num = Number(ratio);
+    if (Number.isNaN(num) || num < 0) return 'n/a';
+    const ownerPct = Math.round(num * 100);
+    const renterPct = 100 - ownerPct;
+    return `${ownerPct}% owner / ${renterPct}% renter`;
+  };
+
+  const humanizeTag = (tag) => {
+    const label = String(tag).replace(/_/g, ' ').trim();
+    return label.charAt(0).toUpperCase() + label.slice(1);
+  };
+
+  const tagsHtml = tags.length
+    ? tags.map(t => `<span class="tag-pill">${humanizeTag(t)}</span>`).join('')
+    : '<span class="small">No tags detected</span>';
+
+  const mapEmbed = `
+    <div class="map-wrapper">
+      <iframe
+        class="map-frame"
+        src="https://www.google.com/maps?q=${encodeURIComponent(zip)}&output=embed"
+        loading="lazy"
+        referrerpolicy="no-referrer-when-downgrade"
+        allowfullscreen>
+      </iframe>
+    </div>
+  `;
+
+  const censusHtml = `
+    <div class="small">
+      Median income: ${formatIncome(medianIncome)}<br>
+      Population: ${population != null ? Number(population).toLocaleString() : 'n/a'}<br>
+      Owner/renter mix: ${formatOwnerRenter(ownerRatio)}<br>
+      Poverty rate: ${formatPercent(povertyRate)}
+    </div>
+  `;
+
+  resultsDiv.innerHTML += `
+    <div class="card">
+      <h2>What we see about ${zip}</h2>
+      <div class="small">
+        Area: ${area || 'Unknown area'}<br>
+        IRS-listed nonprofits in this ZIP: ${nonprofitCount ?? 'n/a'}
+      </div>
+      ${mapEmbed}
+      <div style="margin-top: 0.5rem;">${tagsHtml}</div>
+      <div style="margin-top: 0.5rem;">${censusHtml}</div>
+    </div>
+  `;
+}
+
+function extractNonprofitName(rec) {
+  // 1) Prefer explicit fields if backend provides them
+  if (rec.nonprofit_name) return String(rec.nonprofit_name).trim();
+  if (rec.nonprofit) return String(rec.nonprofit).trim();
+  if (rec.org) return String(rec.org).trim();
+
+  // 2) Try to extract from bold text in description, e.g. **Mission Animal Rescue**
+  if (rec.description) {
+    const boldMatch = /\*\*(.+?)\*\*/.exec(rec.description);
+    if (boldMatch && boldMatch[1]) {
+      return boldMatch[1].trim();
+    }
+  }
+
+  // 3) Fallback: use the title
+  if (rec.title) return String(rec.title).trim();
+
+  // 4) Last resort
+  return "Nonprofit";
+}
+
+function renderRecommendations(recs, zip) {
+  if (!recs.length) {
+    resultsDiv.innerHTML += `
+      <div class="card">
+        <h3>No recommendations generated</h3>
+        <p class="small">We couldn’t build good suggestions for this ZIP. Try another one nearby.</p>
+      </div>
+    `;
+    return;
+  }
+
+  recs.forEach((rec, idx) => {
+    const nonprofitName = extractNonprofitName(rec);
+
+    const searchQuery = `${nonprofitName} ${zip}`;
+    const searchUrl = `https://www.google.com/search?q=${encodeURIComponent(searchQuery)}`;
+
+    resultsDiv.innerHTML += `
+      <div class="card recs">
+        <h3>${idx + 1}. ${rec.title}</h3>
+        <p>${rec.description}</p>
+
+        <p class="small">
+          <strong>Nonprofit:</strong>
+          <a href="${searchUrl}" target="_blank" class="nonprofit-link">
+            Search “${nonprofitName}”
+          </a>
+        </p>
+
+        <p class="small"><strong>Tax angle:</strong> ${rec.tax_angle}</p>
+        <p class="muted">Not tax advice. Talk to a tax pro about your specific situation.</p>
+      </div>
+    `;
+  });
+}
+
+goBtn.addEventListener('click', fetchTaxBreaks);
+zipInput.addEventListener('input', prefetch);
+zipInput.addEventListener('keydown', (e) => {
+  if (e.key === 'Enter') fetchTaxBreaks();
+});
+
+// Caches API responses per ZIP across visits (see /sw.js)
+if ('serviceWorker' in navigator) {
+  navigator.serviceWorker.register('/sw.js').catch((err) => console.warn('Service worker not registered:', err));
+}
@@ -0,0 +1,85 @@
+// Service worker: keeps /api/tax-breaks responses per ZIP (one cache entry per
+// request URL) so repeat lookups are answered locally.
+//
+//   - fresh (younger than FRESH_MS): served from the cache, no request
+//   - stale: revalidated with the cached ETag; a 304 re-stamps and serves the
+//     cached copy, which is also used if the network or server fails
+//   - responses the server marks no-store (partial results) are never kept
+//
+// Bump API_CACHE when the response shape changes to drop old entries.
+const API_CACHE = 'tax-breaks-api-v1';
+const FRESH_MS = 60 * 60 * 1000;
+const MAX_ENTRIES = 50;
+
+self.addEventListener('install', () => self.skipWaiting());
+
+self.addEventListener('activate', (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((keys) => Promise.all(
+        keys
+          .filter((key) => key.startsWith('tax-breaks-api-') && key !== API_CACHE)
+          .map((key) => caches.delete(key))
+      ))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener('fetch', (event) => {
+  const url = new URL(event.request.url);
+  if (
+    event.request.method !== 'GET' ||
+    url.origin !== self.location.origin ||
+    url.pathname !== '/api/tax-breaks'
+  ) {
+    return;
+  }
+  event.respondWith(cachedLookup(event.request));
+});
+
+async function cachedLookup(request) {
+  const cache = await caches.open(API_CACHE);
+  const cached = await cache.match(request);
+  if (cached && Date.now() - Number(cached.headers.get('X-Cached-At')) < FRESH_MS) {
+    return cached;
+  }
+
+  let conditional = request;
+  const etag = cached && cached.headers.get('ETag');
+  if (etag) {
+    const headers = new Headers(request.headers);
+    headers.set('If-None-Match', etag);
+    conditional = new Request(request, { headers });
+  }
+
+  let res;
+  try {
+    res = await fetch(conditional);
+  } catch (err) {
+    if (cached) return cached;
+    throw err;
+  }
+
+  if (res.status === 304 && cached) {
+    // Unchanged: good for another FRESH_MS
+    await store(cache, request, cached);
+    return cache.match(request);
+  }
+  if (res.ok && !/no-store/.test(res.headers.get('Cache-Control') || '')) {
+    await store(cache, request, res.clone());
+  } else if (cached && res.status >= 500) {
+    return cached;  // busy or down: a stale answer beats an error
+  }
+  return res;
+}
+
+async function store(cache, request, res) {
+  const headers = new Headers(res.headers);
+  headers.set('X-Cached-At', String(Date.now()));
+  const body = await res.blob();
+  await cache.put(request, new Response(body, { status: res.status, statusText: res.statusText, headers }));
+
+  // Keys come back oldest first; trim to MAX_ENTRIES
+  const keys = await cache.keys();
+  await Promise.all(keys.slice(0, Math.max(0, keys.length - MAX_ENTRIES)).map((key) => cache.delete(key)));
+}
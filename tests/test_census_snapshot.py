@@ -0,0 +1,62 @@
+import gzip
+import json
+
+import pytest
+
+from benchmarks.generate_bmf import generate_acs_response
+from data_sources import census
+
+FIXTURE_RESPONSE = "data_sources/fixtures/acs_response_2022.json"
+
+
+@pytest.fixture
+def snapshot_path(monkeypatch, tmp_path):
+    """
+    Point the snapshot at a file under tmp_path, with no live API fallback.
+    """
+    path = str(tmp_path / "acs_zcta_{vintage}.json.gz")
+    monkeypatch.setattr(census, "CENSUS_SNAPSHOT_PATH", path)
+    monkeypatch.setattr(census, "CENSUS_LIVE_FALLBACK", False)
+    monkeypatch.setattr(census, "_snapshots", {})
+    monkeypatch.setattr(census, "_snapshot_checked", {})
+    census._NO_DATA.clear()
+    yield path.format(vintage="2022")
+    census._NO_DATA.clear()
+
+
+def test_fixture_rebuilds_from_its_api_response(snapshot_path):
+    assert census.build_census_snapshot("2022", source_file=FIXTURE_RESPONSE, out_path=snapshot_path) == 2
+
+    with gzip.open(snapshot_path, "rt", encoding="utf-8") as f:
+        rebuilt = json.load(f)
+    with gzip.open(census.CENSUS_FIXTURE_PATH.format(vintage="2022"), "rt", encoding="utf-8") as f:
+        assert rebuilt == json.load(f)
+
+
+def test_lookups_are_served_from_the_fixture(monkeypatch, snapshot_path):
+    monkeypatch.setattr(census, "CENSUS_SNAPSHOT_PATH", census.CENSUS_FIXTURE_PATH)
+
+    row = census.get_census_by_zip("90210")
+
+    assert row["zip"] == "90210"
+    assert row["population"] == 19627
+    assert row["median_household_income"] == 154740
+    assert census.get_census_by_zip("00000") == {}
+    assert census.census_has_no_data("00000")
+
+
+def test_rebuild_is_picked_up_and_forgets_no_data_zips(monkeypatch, snapshot_path, tmp_path):
+    monkeypatch.setattr(census, "CENSUS_SNAPSHOT_RELOAD_INTERVAL", 0.0)
+    response = str(tmp_path / "acs_response.json")
+    generate_acs_response(response, ["94016", "94107"])
+    census.build_census_snapshot("2022", source_file=response)
+
+    assert census.get_census_by_zip("94016")["zip"] == "94016"
+    assert census.get_census_by_zip("95814") == {}
+    assert census.census_has_no_data("95814")
+
+    generate_acs_response(response, ["94016", "94107", "95814"])
+    census.build_census_snapshot("2022", source_file=response)
+
+    assert not census.census_has_no_data("95814")
+    assert census.get_census_by_zip("95814")["zip"] == "95814"
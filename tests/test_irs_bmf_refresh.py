@@ -0,0 +1,106 @@
+import csv
+
+import pytest
+
+from benchmarks.generate_bmf import BMF_COLUMNS, generate_bmf_csv
+from data_sources.irs_bmf import build_bmf_index, read_bmf_index, refresh_bmf_index, shard_path
+
+
+def _read_rows(path):
+    with open(path, encoding="latin-1", newline="") as f:
+        return [dict(zip(BMF_COLUMNS, row)) for row in list(csv.reader(f))[1:]]
+
+
+def _write_rows(path, rows):
+    with open(path, "w", encoding="latin-1", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(BMF_COLUMNS)
+        for row in rows:
+            writer.writerow([row[c] for c in BMF_COLUMNS])
+
+
+def _by_ein(index):
+    return {z: sorted(orgs, key=lambda org: org["ein"]) for z, orgs in index.items()}
+
+
+@pytest.fixture
+def drops(tmp_path):
+    """
+    (shard dir, old CSV, new CSV, expected delta): a synthetic drop indexed
+    into tmp_path, and a next month's drop with every kind of change.
+    """
+    old_csv = str(tmp_path / "eo_old.csv")
+    zips = generate_bmf_csv(old_csv, rows=2000, seed=11, zip_count=60)
+    rows = _read_rows(old_csv)
+
+    new_rows = [dict(row) for row in rows[40:]]  # 40 removed
+    for row in new_rows[:25]:  # 25 renamed
+        row["NAME"] += " INC"
+    for row in new_rows[25:35]:  # 10 STATUS changes
+        row["STATUS"] = "02" if row["STATUS"] != "02" else "01"
+    for row in new_rows[35:50]:  # 15 moved to another ZIP
+        row["ZIP"] = next(z for z in zips if not row["ZIP"].startswith(z))
+    added = [dict(row, EIN=f"{900000000 + i:09d}", NAME=f"NEW ORG {i}") for i, row in enumerate(rows[:30])]
+    new_rows.extend(added)  # 30 added
+
+    new_csv = str(tmp_path / "eo_new.csv")
+    _write_rows(new_csv, new_rows)
+
+    shard_dir = str(tmp_path / "shards")
+    build_bmf_index([old_csv], shard_dir, workers=1)
+    expected = {"added": 30, "removed": 40, "changed": 50, "status_changed": 10}
+    return shard_dir, old_csv, new_csv, expected
+
+
+def test_refresh_reports_each_kind_of_change(drops):
+    shard_dir, _old_csv, new_csv, expected = drops
+
+    assert refresh_bmf_index([new_csv], shard_dir) == {"CA": expected}
+
+
+def test_refresh_matches_full_rebuild(drops, tmp_path):
+    shard_dir, _old_csv, new_csv, _expected = drops
+    refresh_bmf_index([new_csv], shard_dir)
+
+    rebuilt_dir = str(tmp_path / "rebuilt")
+    build_bmf_index([new_csv], rebuilt_dir, workers=1)
+
+    refreshed = read_bmf_index(shard_path("CA", shard_dir))
+    rebuilt = read_bmf_index(shard_path("CA", rebuilt_dir))
+    assert sorted(refreshed) == sorted(rebuilt)
+    # Moved and added orgs are appended to their ZIP, so compare orgs, not order
+    assert _by_ein(refreshed) == _by_ein(rebuilt)
+
+
+def test_second_refresh_changes_nothing(drops):
+    shard_dir, _old_csv, new_csv, _expected = drops
+    refresh_bmf_index([new_csv], shard_dir)
+    path = shard_path("CA", shard_dir)
+    with open(path, "rb") as f:
+        before = f.read()
+
+    delta = refresh_bmf_index([new_csv], shard_dir)
+
+    assert delta == {"CA": {"added": 0, "removed": 0, "changed": 0, "status_changed": 0}}
+    with open(path, "rb") as f:
+        assert f.read() == before
+
+
+def test_refresh_with_the_built_drop_changes_nothing(drops):
+    shard_dir, old_csv, _new_csv, _expected = drops
+
+    delta = refresh_bmf_index([old_csv], shard_dir)
+
+    assert delta == {"CA": {"added": 0, "removed": 0, "changed": 0, "status_changed": 0}}
+
+
+def test_unchanged_orgs_keep_their_place(drops):
+    shard_dir, old_csv, new_csv, _expected = drops
+    before = read_bmf_index(shard_path("CA", shard_dir))
+    refresh_bmf_index([new_csv], shard_dir)
+    after = read_bmf_index(shard_path("CA", shard_dir))
+
+    unchanged = {row["EIN"] for row in _read_rows(old_csv)[90:]}
+    for z, orgs in before.items():
+        kept = [org["ein"] for org in orgs if org["ein"] in unchanged]
+        assert [org["ein"] for org in after.get(z, []) if org["ein"] in unchanged] == kept
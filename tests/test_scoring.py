@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+from data_sources.categories import org_categories
+from logic.recommendations import RECOMMENDATION_GROUPS, _recommend
+from logic.scoring import MILE_PENALTY, _feature_key, _fit_table, _score, top_nonprofits
+
+TAGS = ["younger_area", "homeowner_heavy", "older_area", "renter_heavy"]
+NAMES = ["Booster Club", "PTA", "Academy", "Church", "Animal Rescue", "Land Trust", "Foundation", "Food Bank"]
+
+
+def _orgs(count, seed=3, with_distance=False, with_mask=True):
+    rng = random.Random(seed)
+    orgs = []
+    for i in range(count):
+        org = {
+            "name": f"{rng.choice(NAMES)} {i}",
+            "city": "TESTVILLE",
+            "state": "CA",
+            "ein": f"{i:09d}",
+            "subsection_code": rng.choice(["03", "03", "04", "07"]),
+            "classification": rng.choice(["B20", "C30", "D20", "T20", "X20", "P20", ""]),
+            "status": rng.choice(["01", "01", "02", "12"]),
+        }
+        if with_mask:
+            org["category_mask"] = org_categories(org)
+        orgs.append(org)
+    if with_distance:
+        # Radius results come nearest first
+        for i, org in enumerate(orgs):
+            org["distance_miles"] = round(i // 7 * 0.4, 1)
+    return orgs
+
+
+def _brute_force(orgs, tags, bits, k):
+    fit = _fit_table(tags)
+    ranked = []
+    for i, org in enumerate(orgs):
+        mask, score = _score(_feature_key(org), fit)
+        if bits and not mask & bits:
+            continue
+        ranked.append((MILE_PENALTY * org.get("distance_miles", 0.0) - score, i))
+    return [orgs[i] for _key, i in sorted(ranked)[:k]]
+
+
+@pytest.mark.parametrize("with_distance", [False, True])
+@pytest.mark.parametrize("with_mask", [False, True])
+@pytest.mark.parametrize("k", [1, 3, 10])
+def test_top_k_matches_brute_force_sort(with_distance, with_mask, k):
+    orgs = _orgs(600, with_distance=with_distance, with_mask=with_mask)
+    top = top_nonprofits(orgs, TAGS, RECOMMENDATION_GROUPS, k=k)
+
+    assert set(top) == set(RECOMMENDATION_GROUPS)
+    for group, bits in RECOMMENDATION_GROUPS.items():
+        assert top[group] == _brute_force(orgs, TAGS, bits, k), group
+
+
+def test_ties_keep_list_order():
+    org = {"subsection_code": "03", "status": "01", "classification": "B20", "city": "X", "state": "CA"}
+    orgs = [dict(org, name=f"Academy {i}") for i in range(5)]
+
+    top = top_nonprofits(orgs, TAGS, {"any": 0}, k=3)
+
+    assert [o["name"] for o in top["any"]] == ["Academy 0", "Academy 1", "Academy 2"]
+
+
+def test_small_and_empty_inputs():
+    assert top_nonprofits([], TAGS, RECOMMENDATION_GROUPS) == {group: [] for group in RECOMMENDATION_GROUPS}
+    assert top_nonprofits(_orgs(5), TAGS, RECOMMENDATION_GROUPS, k=0)["any"] == []
+    assert len(top_nonprofits(_orgs(2), TAGS, {"any": 0}, k=3)["any"]) == 2
+
+
+def _profile(nonprofits, tags):
+    return {"psychographics": tags, "nonprofits": nonprofits, "census": {}, "city": "Testville", "state": "CA"}
+
+
+def _recommended_names(result):
+    return [rec["description"].split("**")[1] for rec in result["recommendations"]]
+
+
+def test_fallback_never_repeats_a_recommended_org():
+    # The education org is also the best org overall, so the fallback has to skip it
+    orgs = [
+        {"name": "Lincoln PTA", "subsection_code": "03", "status": "01", "classification": "B20"},
+        {"name": "Coastal Land Trust", "subsection_code": "03", "status": "01", "classification": "C30"},
+        {"name": "Rotary Club", "subsection_code": "07", "status": "01", "classification": "S20"},
+    ]
+    for org in orgs:
+        org.update(city="TESTVILLE", state="CA", category_mask=org_categories(org))
+
+    result = _recommend("90210", _profile(orgs, ["younger_area"]))
+
+    assert _recommended_names(result) == ["Lincoln PTA", "Coastal Land Trust", "Rotary Club"]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_fallback_never_repeats_on_random_lists(seed):
+    orgs = _orgs(random.Random(seed).randrange(1, 40), seed=seed)
+
+    result = _recommend("90210", _profile(orgs, TAGS))
+
+    names = _recommended_names(result)
+    if result["recommendations"][-1]["title"].startswith("Support a Local Nonprofit"):
+        assert names[-1] not in names[:-1]
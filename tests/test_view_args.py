@@ -0,0 +1,31 @@
+import pytest
+
+from server import _apply_view, _parse_view_args
+
+
+@pytest.mark.parametrize("args", [
+    {"nonprofit_limit": "0"},
+    {"nonprofit_limit": "-5"},
+    {"cursor": "-1"},
+    {"nonprofit_limit": "ten"},
+    {"fields": "zip,bogus"},
+])
+def test_bad_view_args_are_rejected(args):
+    assert _parse_view_args(args)[3] is not None
+
+
+def test_following_next_cursor_visits_every_nonprofit_once():
+    payload = {"zip": "92008", "nonprofits": [{"ein": str(i)} for i in range(7)]}
+    seen = []
+    cursor = None
+    for _page in range(10):
+        args = {"nonprofit_limit": "3"} if cursor is None else {"nonprofit_limit": "3", "cursor": cursor}
+        fields, limit, offset, error = _parse_view_args(args)
+        assert error is None
+        page = _apply_view(payload, fields, limit, offset)
+        seen.extend(org["ein"] for org in page["nonprofits"])
+        cursor = page.get("next_cursor")
+        if cursor is None:
+            break
+
+    assert seen == [str(i) for i in range(7)]